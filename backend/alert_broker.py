@@ -0,0 +1,373 @@
+"""
+Publish/subscribe for intrusion alerts.
+
+Every SSE connection gets a Subscription: a small bounded queue that the
+broker fills. Brokers differ in how an alert reaches the other gunicorn
+workers:
+
+- memory: subscribers in this process only (single worker / development)
+- sqlite: alerts are appended to a WAL-mode SQLite file on local disk and
+  one poller thread per process fans new rows out to its subscribers
+- redis:  PUBLISH / SUBSCRIBE on a Redis channel, one listener thread per
+  process (speaks RESP directly, so no client library is needed)
+
+Pick one with ALERT_BROKER=memory|sqlite|redis. The cross-process brokers
+keep exactly one connection per process no matter how many clients watch.
+"memory" under several gunicorn workers loses alerts (a warning is logged
+at startup).
+
+A subscription may register a farm location; alerts with coordinates are
+then only delivered to it when the farm is in range (see geo_fanout.py).
+"""
+import abc
+import json
+import os
+import queue
+import shlex
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+from geo_fanout import GeoSubscriberIndex, alert_point
+
+ALERT_BROKER = os.getenv("ALERT_BROKER", "memory")
+ALERT_BROKER_SQLITE_PATH = os.getenv("ALERT_BROKER_SQLITE_PATH") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "instance", "alert_broker.db")
+ALERT_BROKER_REDIS_URL = os.getenv("ALERT_BROKER_REDIS_URL", "redis://127.0.0.1:6379/0")
+ALERT_CHANNEL = os.getenv("ALERT_CHANNEL", "farmer-ai:intrusion-alerts")
+ALERT_SUBSCRIBER_BUFFER = int(os.getenv("ALERT_SUBSCRIBER_BUFFER", "100"))
+ALERT_BROKER_POLL_INTERVAL = float(os.getenv("ALERT_BROKER_POLL_INTERVAL", "0.2"))
+ALERT_BROKER_RETENTION_SECONDS = int(os.getenv("ALERT_BROKER_RETENTION_SECONDS", "3600"))
+
+
+class Subscription:
+    """One subscriber's view of the alert stream."""
+
+    def __init__(self, broker, maxsize=ALERT_SUBSCRIBER_BUFFER):
+        self._broker = broker
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def get(self, timeout=None):
+        """Next event, or None after `timeout` seconds without one."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def deliver(self, event):
+        # A subscriber that stopped reading loses its oldest alerts, never the newest,
+        # and never blocks the publisher
+        while True:
+            try:
+                self._queue.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def close(self):
+        self._broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    name = "memory"
+
+    def __init__(self, buffer_size=ALERT_SUBSCRIBER_BUFFER):
+        self.buffer_size = buffer_size
+        self._subscribers = set() # subscriptions without a farm location: every alert
+        self._geo = GeoSubscriberIndex() # subscriptions with one: alerts in range
+        self._lock = threading.Lock()
+        self.counts = {"published": 0, "received": 0, "delivered": 0}
+
+    def subscribe(self, location=None):
+        """location: optional (lat, lon, radius_km) of the subscriber's farm."""
+        subscription = Subscription(self, self.buffer_size)
+        with self._lock:
+            if location:
+                self._geo.add(subscription, *location)
+            else:
+                self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+            self._geo.remove(subscription)
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counts[name] += n
+
+    def publish(self, event):
+        self._count("published")
+        self._fan_out(event)
+
+    def _fan_out(self, event):
+        point = alert_point(event)
+        with self._lock:
+            subscribers = list(self._subscribers)
+            if point is not None:
+                subscribers.extend(self._geo.match(*point))
+            self.counts["received"] += 1
+            self.counts["delivered"] += len(subscribers)
+        for subscription in subscribers:
+            subscription.deliver(event)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counts)
+            stats["subscribers"] = len(self._subscribers) + len(self._geo)
+            stats["located_subscribers"] = len(self._geo)
+            stats["dropped"] = sum(s.dropped for s in self._subscribers) + sum(s.dropped for s in self._geo.keys())
+        stats["broker"] = self.name
+        return stats
+
+    def close(self):
+        pass
+
+
+class _ListenerBroker(InProcessBroker, metaclass=abc.ABCMeta):
+    """Local fan-out fed by a single background listener per process."""
+
+    def __init__(self, buffer_size=ALERT_SUBSCRIBER_BUFFER):
+        super().__init__(buffer_size)
+        self._listener = None
+        self._stopped = threading.Event()
+        self._ready = threading.Event()
+        self.counts["listener_errors"] = 0
+        self.counts["publish_errors"] = 0
+
+    def subscribe(self, location=None):
+        subscription = super().subscribe(location)
+        self._ensure_listener()
+        return subscription
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listener is not None:
+                return
+            self._listener = threading.Thread(target=self._listen_forever, name=f"alert-{self.name}", daemon=True)
+            self._listener.start()
+        # Wait until the listener is positioned, so an alert published right after
+        # subscribe() is not missed
+        self._ready.wait(timeout=2)
+
+    def _listen_forever(self):
+        backoff = 0.5
+        while not self._stopped.is_set():
+            try:
+                self._listen()
+                backoff = 0.5
+            except Exception as e:
+                self._count("listener_errors")
+                print(f"Alert broker ({self.name}) listener error: {e}")
+                self._stopped.wait(backoff)
+                backoff = min(backoff * 2, 30)
+
+    @abc.abstractmethod
+    def _listen(self):
+        """Receive alerts from the shared channel and _fan_out() them until stopped or disconnected."""
+
+    def close(self):
+        self._stopped.set()
+
+
+class SQLiteBroker(_ListenerBroker):
+    """Alerts go through an append-only table in a local WAL-mode SQLite file."""
+    name = "sqlite"
+
+    def __init__(self, path=ALERT_BROKER_SQLITE_PATH, poll_interval=ALERT_BROKER_POLL_INTERVAL,
+                 retention_seconds=ALERT_BROKER_RETENTION_SECONDS, buffer_size=ALERT_SUBSCRIBER_BUFFER):
+        super().__init__(buffer_size)
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self._local = threading.local()
+        self._wake = threading.Event()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._last_id = None
+        conn = self._connect()
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS alert_events ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_alert_events_created ON alert_events (created)")
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def publish(self, event):
+        conn = self._connection()
+        now = time.time()
+        cursor = conn.execute("INSERT INTO alert_events (payload, created) VALUES (?, ?)", (json.dumps(event), now))
+        self._count("published")
+        if cursor.lastrowid % 500 == 0:
+            conn.execute("DELETE FROM alert_events WHERE created < ?", (now - self.retention_seconds,))
+        # Subscribers in this process do not have to wait for the next poll
+        self._wake.set()
+
+    def _listen(self):
+        conn = self._connect()
+        try:
+            # After a reconnect, carry on from the last row delivered
+            if self._last_id is None:
+                self._last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM alert_events").fetchone()[0]
+            self._ready.set()
+            while not self._stopped.is_set():
+                rows = conn.execute(
+                    "SELECT id, payload FROM alert_events WHERE id > ? ORDER BY id LIMIT 1000", (self._last_id,)
+                ).fetchall()
+                for row_id, payload in rows:
+                    self._last_id = row_id
+                    self._fan_out(json.loads(payload))
+                if len(rows) < 1000:
+                    self._wake.wait(self.poll_interval)
+                    self._wake.clear()
+        finally:
+            conn.close()
+
+
+class RespConnection:
+    """Just enough of the Redis protocol for PUBLISH and SUBSCRIBE."""
+
+    def __init__(self, url, timeout=None):
+        parsed = urlparse(url)
+        self.sock = socket.create_connection((parsed.hostname or "127.0.0.1", parsed.port or 6379), timeout=5)
+        self.sock.settimeout(timeout)
+        self.reader = self.sock.makefile("rb")
+        if parsed.password:
+            self.command("AUTH", *([parsed.username] if parsed.username else []), parsed.password)
+
+    def send(self, *args):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self.sock.sendall(b"".join(parts))
+
+    def read(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise ConnectionError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            return [self.read() for _ in range(int(rest))]
+        raise ConnectionError(f"Unexpected Redis reply: {line!r}")
+
+    def command(self, *args):
+        self.send(*args)
+        return self.read()
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisBroker(_ListenerBroker):
+    name = "redis"
+
+    def __init__(self, url=ALERT_BROKER_REDIS_URL, channel=ALERT_CHANNEL, buffer_size=ALERT_SUBSCRIBER_BUFFER):
+        super().__init__(buffer_size)
+        self.url = url
+        self.channel = channel
+        self._publisher = None
+        self._publish_lock = threading.Lock()
+
+    def publish(self, event):
+        payload = json.dumps(event)
+        with self._publish_lock:
+            # One reconnect attempt: the shared connection may have been dropped by the server
+            for attempt in range(2):
+                try:
+                    if self._publisher is None:
+                        self._publisher = RespConnection(self.url, timeout=5)
+                    self._publisher.command("PUBLISH", self.channel, payload)
+                    break
+                except (OSError, ConnectionError) as e:
+                    if self._publisher is not None:
+                        self._publisher.close()
+                    self._publisher = None
+                    if attempt:
+                        # The alert is already in the alert log (clients replay it on reconnect)
+                        # and push delivery must still run, so do not fail the report
+                        self._count("publish_errors")
+                        print(f"Alert broker (redis) publish failed: {e}")
+                        return
+        self._count("published")
+
+    def _listen(self):
+        conn = RespConnection(self.url)
+        try:
+            conn.command("SUBSCRIBE", self.channel)
+            self._ready.set()
+            while not self._stopped.is_set():
+                message = conn.read()
+                if isinstance(message, list) and len(message) == 3 and message[0] == b"message":
+                    self._fan_out(json.loads(message[2]))
+        finally:
+            conn.close()
+
+
+def configured_workers():
+    """Worker count from the gunicorn command line (workers inherit the master's argv) or WEB_CONCURRENCY."""
+    workers = int(os.getenv("WEB_CONCURRENCY", "1") or 1)
+    args = shlex.split(os.getenv("GUNICORN_CMD_ARGS", "")) + sys.argv[1:]
+    if "gunicorn" not in os.path.basename(sys.argv[0]) and not os.getenv("GUNICORN_CMD_ARGS"):
+        return workers
+    for i, arg in enumerate(args):
+        try:
+            if arg in ("-w", "--workers") and i + 1 < len(args):
+                workers = int(args[i + 1])
+            elif arg.startswith("--workers="):
+                workers = int(arg.split("=", 1)[1])
+        except ValueError:
+            pass
+    return workers
+
+
+def create_broker(kind=ALERT_BROKER):
+    if kind == "sqlite":
+        broker = SQLiteBroker()
+    elif kind == "redis":
+        broker = RedisBroker()
+    else:
+        broker = InProcessBroker()
+    print(f"Alert broker: {broker.name}")
+    workers = configured_workers()
+    if broker.name == "memory" and workers > 1:
+        print(f"Warning: ALERT_BROKER=memory with {workers} workers - an alert only reaches SSE clients "
+              f"connected to the worker that received it. Set ALERT_BROKER=sqlite or redis.")
+    return broker
@@ -0,0 +1,91 @@
+"""
+Append-only log of intrusion alerts.
+
+Every reported alert is stored in intrusion_alerts before it is broadcast,
+and the row id becomes the alert id and the SSE `id:` field. Ids are
+monotonic across all workers, so a client that reconnects with
+Last-Event-ID gets exactly the alerts it missed, and the history endpoint
+can page with a plain `id < cursor` cursor.
+"""
+import datetime
+import json
+import os
+
+from extensions import db
+from models import IntrusionAlert
+
+ALERT_REPLAY_LIMIT = int(os.getenv("ALERT_REPLAY_LIMIT", "200"))
+ALERT_LOG_RETENTION_DAYS = int(os.getenv("ALERT_LOG_RETENTION_DAYS", "90"))
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+
+
+def to_event(row):
+    location = json.loads(row.location) if row.location else {}
+    return {
+        'id': row.id,
+        'type': row.alert_type,
+        'animal': row.animal,
+        'location': location,
+        'location_name': location.get('name', 'Farm perimeter'),
+        'severity': row.severity,
+        'timestamp': row.created_at.isoformat(),
+        'message': row.message
+    }
+
+
+def append_alert(alert_type, animal, location, severity, message):
+    """Stores the alert and returns it as a broadcastable event with its log id."""
+    row = IntrusionAlert(alert_type=alert_type, animal=animal, severity=severity,
+                         location=json.dumps(location, ensure_ascii=False), message=message,
+                         created_at=datetime.datetime.utcnow())
+    db.session.add(row)
+    db.session.commit()
+    if row.id % 1000 == 0:
+        purge_alerts()
+    return to_event(row)
+
+
+def alerts_after(last_id, limit=ALERT_REPLAY_LIMIT):
+    """Alerts newer than last_id, oldest first (the replay for a reconnecting client)."""
+    rows = (IntrusionAlert.query.filter(IntrusionAlert.id > last_id)
+            .order_by(IntrusionAlert.id.asc()).limit(limit).all())
+    return [to_event(row) for row in rows]
+
+
+def alert_page(cursor=None, limit=HISTORY_PAGE_SIZE):
+    """Newest-first page of alerts older than cursor. Returns (alerts, next_cursor)."""
+    query = IntrusionAlert.query
+    if cursor is not None:
+        query = query.filter(IntrusionAlert.id < cursor)
+    rows = query.order_by(IntrusionAlert.id.desc()).limit(limit + 1).all()
+    alerts = [to_event(row) for row in rows[:limit]]
+    next_cursor = alerts[-1]['id'] if len(rows) > limit else None
+    return alerts, next_cursor
+
+
+def purge_alerts(retention_days=ALERT_LOG_RETENTION_DAYS):
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=retention_days)
+    try:
+        IntrusionAlert.query.filter(IntrusionAlert.created_at < cutoff).delete(synchronize_session=False)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Alert log purge failed: {e}")
+
+
+def parse_event_id(value):
+    """Last-Event-ID / cursor value as an int, or None when missing or malformed."""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value >= 0 else None
+
+
+def format_sse(event):
+    """One SSE message; logged alerts carry their id so the browser can resume."""
+    data = f"data: {json.dumps(event)}\n\n"
+    if isinstance(event.get('id'), int):
+        return f"id: {event['id']}\n{data}"
+    return data
@@ -0,0 +1,290 @@
+"""
+Asyncio event-stream server for intrusion alerts.
+
+The Flask /api/intrusion/stream holds a request thread per watcher, so a
+gthread worker tops out at its thread count. This is a plain ASGI app (no
+framework) serving the same stream where each watcher is one coroutine with
+a small bounded buffer:
+
+- one broker subscription per process feeds every connection
+- a watcher whose buffer fills up (it stopped reading) is disconnected
+  rather than buffering without bound; EventSource reconnects by itself
+- one shared timer sends keep-alives to idle connections instead of a
+  timeout per connection
+- a reconnect with Last-Event-ID first replays the missed alerts from the
+  alert log
+
+Run it next to the Flask app with a cross-process broker, e.g.
+
+    ALERT_BROKER=sqlite python alert_stream_asgi.py --port 5001
+    ALERT_BROKER=sqlite uvicorn alert_stream_asgi:app --port 5001
+
+and point the frontend at it with VITE_ALERT_STREAM_URL.
+"""
+import argparse
+import asyncio
+import json
+import os
+import threading
+from collections import deque
+from urllib.parse import parse_qs
+
+from alert_broker import create_broker
+from alert_log import alerts_after, parse_event_id, format_sse
+from db_app import create_db_app
+from geo_fanout import GeoSubscriberIndex, parse_farm_location, alert_point, in_range
+
+try:
+    import uvicorn
+    UVICORN_AVAILABLE = True
+except ImportError:
+    UVICORN_AVAILABLE = False
+
+ALERT_STREAM_BUFFER = int(os.getenv("ALERT_STREAM_BUFFER", "32"))
+ALERT_STREAM_HEARTBEAT = float(os.getenv("ALERT_STREAM_HEARTBEAT", "15"))
+ALERT_STREAM_MAX_CONNECTIONS = int(os.getenv("ALERT_STREAM_MAX_CONNECTIONS", "10000"))
+
+STREAM_PATH = "/api/intrusion/stream"
+STATS_PATH = "/api/intrusion/stream/stats"
+SSE_HEADERS = [
+    (b"content-type", b"text/event-stream"),
+    (b"cache-control", b"no-cache"),
+    (b"x-accel-buffering", b"no"),  # no proxy buffering of the stream
+    (b"access-control-allow-origin", b"*"),
+]
+KEEP_ALIVE = (0, b": keep-alive\n\n")
+
+
+def format_event(event):
+    return format_sse(event).encode("utf-8")
+
+
+class StreamClient:
+    # buffer holds (alert id, chunk) so replayed alerts are not sent twice
+    __slots__ = ("buffer", "wake", "closed", "replayed_upto")
+
+    def __init__(self):
+        self.buffer = deque()
+        self.wake = asyncio.Event()
+        self.closed = False
+        self.replayed_upto = 0
+
+    def close(self):
+        self.closed = True
+        self.wake.set()
+
+
+class AlertHub:
+    """Fans alerts from the broker out to every connected coroutine."""
+
+    def __init__(self, broker=None, buffer_size=ALERT_STREAM_BUFFER, heartbeat=ALERT_STREAM_HEARTBEAT):
+        self.broker = broker
+        self.buffer_size = buffer_size
+        self.heartbeat = heartbeat
+        self.clients = set() # every connection
+        self._everywhere = set() # connections without a farm location
+        self._geo = GeoSubscriberIndex()
+        self.counts = {"connected": 0, "alerts": 0, "delivered": 0, "evicted": 0, "rejected": 0}
+        self._loop = None
+        self._log_app = None
+        self._stopped = threading.Event()
+        self._tasks = []
+
+    async def start(self):
+        if self._loop is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        if self.broker is None:
+            self.broker = create_broker()
+        subscription = self.broker.subscribe()
+        threading.Thread(target=self._bridge, args=(subscription,), name="alert-stream-bridge", daemon=True).start()
+        self._tasks.append(asyncio.ensure_future(self._heartbeats()))
+
+    def stop(self):
+        self._stopped.set()
+        for task in self._tasks:
+            task.cancel()
+        for client in list(self.clients):
+            client.close()
+
+    def _bridge(self, subscription):
+        # The broker API is blocking, so one thread per process hands alerts to the loop
+        try:
+            while not self._stopped.is_set():
+                event = subscription.get(timeout=1)
+                if event is not None:
+                    self._loop.call_soon_threadsafe(self.publish, event)
+        finally:
+            subscription.close()
+
+    def replay(self, last_id, farm=None):
+        """Alerts logged after last_id in range of farm (blocking; run in an executor)."""
+        if self._log_app is None:
+            self._log_app = create_db_app()
+        with self._log_app.app_context():
+            return [event for event in alerts_after(last_id) if in_range(event, farm)]
+
+    def publish(self, event):
+        chunk = (event.get("id", 0), format_event(event))
+        self.counts["alerts"] += 1
+        point = alert_point(event)
+        targets = list(self._everywhere) if point is not None else list(self.clients)
+        if point is not None:
+            targets.extend(self._geo.match(*point))
+        for client in targets:
+            if len(client.buffer) >= self.buffer_size:
+                self.evict(client)
+                continue
+            client.buffer.append(chunk)
+            client.wake.set()
+            self.counts["delivered"] += 1
+
+    def connect(self, farm=None):
+        client = StreamClient()
+        self.clients.add(client)
+        if farm:
+            self._geo.add(client, *farm)
+        else:
+            self._everywhere.add(client)
+        self.counts["connected"] += 1
+        return client
+
+    def disconnect(self, client):
+        self.clients.discard(client)
+        self._everywhere.discard(client)
+        self._geo.remove(client)
+
+    def evict(self, client):
+        self.counts["evicted"] += 1
+        self.disconnect(client)
+        client.close()
+
+    async def _heartbeats(self):
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            for client in list(self.clients):
+                if not client.buffer:
+                    client.buffer.append(KEEP_ALIVE)
+                    client.wake.set()
+
+    def stats(self):
+        stats = dict(self.counts)
+        stats["clients"] = len(self.clients)
+        stats["located_clients"] = len(self._geo)
+        stats["broker"] = self.broker.name if self.broker else None
+        return stats
+
+
+class AlertStreamApp:
+    def __init__(self, hub=None, max_connections=ALERT_STREAM_MAX_CONNECTIONS):
+        self.hub = hub or AlertHub()
+        self.max_connections = max_connections
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http":
+            if scope["method"] == "GET" and scope["path"] == STREAM_PATH:
+                await self.stream(scope, receive, send)
+            elif scope["method"] == "GET" and scope["path"] == STATS_PATH:
+                await self.hub.start()
+                await self.respond(send, 200, json.dumps(self.hub.stats()).encode("utf-8"))
+            else:
+                await self.respond(send, 404, b'{"error": "Not found"}')
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await self.hub.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.hub.stop()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def respond(self, send, status, body, headers=()):
+        await send({"type": "http.response.start", "status": status, "headers": [
+            (b"content-type", b"application/json"),
+            (b"access-control-allow-origin", b"*"),
+            *headers
+        ]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def stream(self, scope, receive, send):
+        await self.hub.start()
+        if len(self.hub.clients) >= self.max_connections:
+            self.hub.counts["rejected"] += 1
+            await self.respond(send, 503, b'{"error": "Too many connections"}', [(b"retry-after", b"5")])
+            return
+
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        try:
+            farm = parse_farm_location({key: values[0] for key, values in query.items()})
+        except ValueError as e:
+            await self.respond(send, 400, json.dumps({"error": str(e)}).encode("utf-8"))
+            return
+
+        client = self.hub.connect(farm)
+        watcher = asyncio.ensure_future(self._watch_disconnect(receive, client))
+        try:
+            await send({"type": "http.response.start", "status": 200, "headers": SSE_HEADERS})
+            await send({"type": "http.response.body", "body": format_event({"status": "connected"}), "more_body": True})
+            last_id = self._last_event_id(scope, query)
+            if last_id is not None:
+                # Connected before reading the log, so alerts published meanwhile are buffered
+                missed = await asyncio.get_running_loop().run_in_executor(None, self.hub.replay, last_id, farm)
+                client.replayed_upto = missed[-1]["id"] if missed else last_id
+                if missed:
+                    body = b"".join(format_event(event) for event in missed)
+                    await send({"type": "http.response.body", "body": body, "more_body": True})
+            while True:
+                await client.wake.wait()
+                client.wake.clear()
+                if client.closed:
+                    break
+                if client.buffer:
+                    body = b"".join(chunk for event_id, chunk in client.buffer
+                                    if event_id == 0 or event_id > client.replayed_upto)
+                    client.buffer.clear()
+                    if body:
+                        await send({"type": "http.response.body", "body": body, "more_body": True})
+        except OSError:
+            pass
+        finally:
+            self.hub.disconnect(client)
+            watcher.cancel()
+        try:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        except OSError:
+            pass
+
+    def _last_event_id(self, scope, query):
+        for name, value in scope.get("headers", ()):
+            if name == b"last-event-id":
+                return parse_event_id(value.decode("latin-1"))
+        return parse_event_id((query.get("last_event_id") or [None])[0])
+
+    async def _watch_disconnect(self, receive, client):
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                client.close()
+                return
+
+
+app = AlertStreamApp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Asyncio SSE server for intrusion alerts")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "5001")))
+    args = parser.parse_args()
+    if not UVICORN_AVAILABLE:
+        raise SystemExit("uvicorn is not installed: pip install uvicorn")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
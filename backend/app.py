@@ -1,9 +1,8 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 import os
 import json
 import requests
-import math
 import random
 
 # Try to import optional dependencies
@@ -35,18 +34,6 @@ if CORS_AVAILABLE:
 else:
     print("Warning: CORS not enabled due to missing flask-cors library")
 
-# Initialize OpenAI client (optional)
-client = None
-if OPENAI_AVAILABLE and os.getenv("OPENAI_API_KEY"):
-    try:
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        print("OpenAI client initialized successfully")
-    except Exception as e:
-        print(f"Warning: Could not initialize OpenAI client: {e}")
-        client = None
-else:
-    print("OpenAI not available or API key not configured")
-
 # --- AUTHENTICATION & DATABASE SETUP ---
 import sys
 import os
@@ -58,9 +45,40 @@ if backend_dir not in sys.path:
 
 from extensions import db, bcrypt
 from models import User
-from auth import create_access_token, create_refresh_token, token_required
+from auth import create_access_token, create_refresh_token, token_required, claims_required, get_token_user_id, user_cache_stats, load_user, decode_token, revoke_token, revoke_token_family, new_token_family, is_revoked
+from token_revocation import revocations
+from llm_gateway import get_gateway
+from emotion import (build_emotion_user_prompt, sanitize_emotion_analysis,
+                     unavailable_emotion_response, unparseable_emotion_response)
+from emotion_batch import BACKENDS as EMOTION_BATCH_BACKENDS, create_backend as create_emotion_batch_backend
+from emotion_classifier import EmotionClassifier, EMOTION_FASTPATH_ENABLED
+from prompt_registry import registry as prompt_registry
+from response_cache import ResponseCache, make_cache_key
+from stream_json import IncrementalJSONObjectParser
+from image_analysis import crop_bp, diagnosis_cache
+from geocoding import create_geocoder
+from facility_store import FacilityStore, FACILITY_INDEX_ENABLED
+from geo_distance import haversine_km, haversine_many, rank_facilities
+from routing import RouteClient, RoutingError, MAX_MATRIX_DESTINATIONS
+from alert_broker import create_broker
+from push_dispatch import create_dispatcher, PYWEBPUSH_AVAILABLE
+from geo_fanout import parse_farm_location, in_range
+from push_subscriptions import save_subscription, remove_subscription, subscriptions_for_alert, InvalidSubscription
+from alert_log import (append_alert, alerts_after, alert_page, parse_event_id, format_sse,
+                       HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE)
+from swr_cache import StaleWhileRevalidateCache, DatabaseTier
+from facility_availability import availability as facility_availability, current_window, window_bounds, seeded_random, AVAILABILITY_WINDOW_SECONDS
 from sqlalchemy.exc import IntegrityError
 import datetime
+import hashlib
+import time
+
+# Initialize the shared LLM gateway (optional): pooled client, deadlines, bounded concurrency, retries
+llm = get_gateway() if OPENAI_AVAILABLE else None
+if llm:
+    print("OpenAI client initialized successfully")
+else:
+    print("OpenAI not available or API key not configured")
 
 # Configure Database (PostgreSQL for production, SQLite for local development)
 database_url = os.getenv('DATABASE_URL') or 'sqlite:///farmer_twin.db'
@@ -76,181 +94,51 @@ with app.app_context():
     db.create_all()
 # ---------------------------------------
 
-def get_system_prompt(language="en"):
-    base_prompt = """You are a Farmer Digital Twin and AI Farming Assistant.
-
-Your role is to support farmers with expert farming advice and decision support.
-
-CORE CAPABILITIES:
-1. Answer farming questions with expert knowledge
-2. Provide What-If Future View for decision-related questions
-
-WHAT-IF DETECTION:
-When a farmer asks about decisions (selling, buying, waiting, investing, planting timing, harvesting timing, etc.), 
-automatically provide a What-If Future View showing TWO paths:
-- "If you act now"
-- "If you wait a little"
-
-CRITICAL RULES FOR WHAT-IF RESPONSES:
-1. Use ONLY real data provided in context (market prices, dates, trends)
-2. NO fake numbers, predictions, or assumed statistics
-3. If data insufficient, provide cautious qualitative explanation
-4. NO probabilities, percentages, or complex charts
-5. NO commands or forced decisions
-6. Keep explanations very simple and understandable
+# Cache for /api/ask-twin answers (exact match + optional near-duplicate tier)
+ask_twin_cache = ResponseCache(
+    maxsize=int(os.getenv("ASK_TWIN_CACHE_SIZE", "2048")),
+    ttl=int(os.getenv("ASK_TWIN_CACHE_TTL", "3600")),
+    near_duplicates=os.getenv("ASK_TWIN_CACHE_NEAR_DUP", "0") == "1",
+    similarity_threshold=float(os.getenv("ASK_TWIN_CACHE_SIMILARITY", "0.8"))
+)
 
-WHAT-IF RESPONSE FORMAT:
-When providing What-If view, structure your response EXACTLY as:
+# Local lexicon classifier answering clear-cut emotion texts before the LLM
+emotion_classifier = EmotionClassifier() if EMOTION_FASTPATH_ENABLED else None
 
-"Let us calmly look at two possible futures based on what we know now.
+# Place name -> coordinates for cold-storage search (memory, gazetteer, DB, then Nominatim)
+geocoder = create_geocoder()
 
-**If you act now:**
-[Explain outcome using real data only - 2-3 short sentences]
+# Local spatial index of synced cold-storage facilities (see facility_sync.py)
+facility_store = FacilityStore(app) if FACILITY_INDEX_ENABLED else None
 
-**If you wait a little:**
-[Explain outcome using real data only - 2-3 short sentences]
+# Crop image diagnosis (previously a separate dev server on port 5001)
+app.register_blueprint(crop_bp)
 
-Market conditions can change, and no option is completely risk-free. This view is to help you think clearly, not to push you toward any decision."
-
-TONE & STYLE:
-- Calm, supportive, respectful
-- Non-judgmental
-- Easy for low-literacy users
-- Short sentences
-- No technical terms
-
-REGULAR RESPONSES:
-For non-decision questions (like "How to improve soil?", "What is drip irrigation?"), 
-provide direct, helpful answers as usual. Keep responses short (3-4 sentences)."""
-    
-    language_instructions = {
-        "hi": "\n\nIMPORTANT: Respond in Hindi (हिंदी). Use simple Hindi words that farmers can easily understand.",
-        "es": "\n\nIMPORTANT: Respond in Spanish (Español). Use simple Spanish words that farmers can easily understand.",
-        "fr": "\n\nIMPORTANT: Respond in French (Français). Use simple French words that farmers can easily understand.",
-        "ta": """
-
-IMPORTANT: Respond in Tamil (தமிழ்). Use simple Tamil words that farmers can easily understand. Write in clear, simple Tamil without technical jargon.
-
-For What-If responses in Tamil, use this EXACT format:
-
-"இப்போது தெரிந்த தகவல்களை வைத்து, இரண்டு சாத்தியமான எதிர்காலங்களை அமைதியாக பார்க்கலாம்.
-
-**நீங்கள் இப்போது முடிவு எடுத்தால்:**
-[உண்மை தரவுகளை மட்டுமே பயன்படுத்தி விளக்கம் - 2-3 குறுகிய வாக்கியங்கள்]
-
-**நீங்கள் சிறிது காலம் காத்திருந்தால்:**
-[உண்மை தரவுகளை மட்டுமே பயன்படுத்தி விளக்கம் - 2-3 குறுகிய வாக்கியங்கள்]
-
-சந்தை நிலைமைகள் மாறக்கூடும். இந்த விளக்கம், நீங்கள் தெளிவாக யோசிக்க உதவுவதற்கே — முடிவை கட்டாயப்படுத்த அல்ல.""",
-        "en": ""
-    }
-    
-    return base_prompt + language_instructions.get(language, "")
+# System prompts are data files under prompts/, assembled and frozen once at startup
+def get_system_prompt(language="en"):
+    return prompt_registry.text("ask_twin", language)
 
 def get_emotion_analysis_prompt(language="en"):
-    base_prompt = """You are an emotion analysis system for a Farmer Digital Twin. Your task is to analyze the farmer's spoken or written text and provide HONEST, EVIDENCE-BASED emotional assessment.
-
-CRITICAL RULES:
-1. ONLY identify emotions when there is CLEAR EVIDENCE in the words, tone, or context
-2. DO NOT assume negative emotions (sadness, anger, depression) without strong evidence
-3. DO NOT exaggerate or dramatize emotions
-4. If emotion is unclear or neutral, clearly state "Neutral" or "Unclear"
-5. DO NOT provide medical or psychological diagnosis
-6. Base your analysis strictly on what the farmer actually said or wrote
-
-Emotion Categories (only use when justified by evidence):
-- Happy: Clear expressions of joy, satisfaction, positive outlook
-- Calm: Neutral, composed, balanced state
-- Sad: Clear expressions of sadness, disappointment, loss
-- Angry: Clear expressions of frustration, irritation, anger
-- Stressed: Clear expressions of worry, pressure, anxiety, concern
-- Possible emotional distress: Only if there are repeated strong signals
-
-Response Format (JSON):
-{
-  "emotion": "Detected emotion or 'Neutral' or 'Unclear'",
-  "confidence": "High/Medium/Low",
-  "evidence": "Brief explanation of what evidence supports this (or 'No clear evidence' if neutral)",
-  "stress_level": "Low/Moderate/High/Unclear (only if supported by evidence)",
-  "decision_readiness": "Stable/Needs Caution/Unclear",
-  "confidence_trend": "Improving/Declining/Stable/Unclear"
-}
-
-Be truthful. If you cannot determine emotion from the text, return "Neutral" or "Unclear"."""
-    
-    language_instructions = {
-        "ta": "\n\nIMPORTANT: Respond in JSON format. For 'emotion' field, use Tamil if emotion is detected: 'மகிழ்ச்சி' (Happy), 'அமைதி' (Calm), 'வருத்தம்' (Sad), 'கோபம்' (Angry), 'மன அழுத்தம்' (Stressed), 'நடுநிலை' (Neutral), 'தெளிவற்ற' (Unclear). For 'evidence' field, write in simple Tamil explaining what evidence supports the emotion.",
-        "en": ""
-    }
-    
-    return base_prompt + language_instructions.get(language, "")
+    return prompt_registry.text("emotion", language)
 
 def get_what_if_system_prompt(language="en"):
-    base_prompt = """You are a Farmer Digital Twin Decision Support AI.
-
-Your task is to generate a "What-If Future View" for farmers to help them understand the possible outcomes of their decision in a simple, calm, and human-friendly way.
-
-CRITICAL RULES:
-1. Use ONLY the real data provided by the system (market prices, dates, user inputs, known trends).
-2. Do NOT generate fake numbers, fake predictions, or assumed statistics.
-3. If real data is insufficient, clearly say so and provide a cautious, qualitative explanation.
-4. Do NOT use probabilities, percentages, or complex charts.
-5. Do NOT give commands or force decisions.
-6. Keep the explanation very simple and understandable for farmers.
-
-FEATURE GOAL:
-Show TWO simple future paths based on the farmer's current decision:
-1. "If you act now"
-2. "If you wait a little"
-
-Explain:
-- Possible benefits
-- Possible risks
-- Known uncertainties
-Using ONLY real contextual data available.
-
-TONE & STYLE:
-- Calm, supportive, respectful
-- Non-judgmental
-- Easy for low-literacy users
-- Short sentences
-- No technical terms
-
-ETHICAL SAFETY:
-- If stress indicators are high, keep the message shorter and calmer.
-- Never present outcomes as guaranteed.
-- Never override the farmer's choice.
-
-RESPONSE FORMAT (JSON):
-{
-  "introduction": "Brief reassurance line",
-  "path_now": "Explanation of 'If you act now' using real data only",
-  "path_wait": "Explanation of 'If you wait a little' using real data only",
-  "closing": "Gentle closing reflection (not advice)"
-}"""
-    
-    language_instructions = {
-        "ta": """
+    return prompt_registry.text("what_if", language)
 
-IMPORTANT: Respond in JSON format with all text fields in Tamil (தமிழ்).
+# --- STREAMING HELPERS ---
 
-Use this structure:
-{
-  "introduction": "அமைதியான உறுதிமொழி வரி",
-  "path_now": "நீங்கள் இப்போது முடிவு எடுத்தால் என்ன நடக்கும் - உண்மையான தரவுகளை மட்டுமே பயன்படுத்தி விளக்கம்",
-  "path_wait": "நீங்கள் சிறிது காலம் காத்திருந்தால் என்ன நடக்கும் - உண்மையான தரவுகளை மட்டுமே பயன்படுத்தி விளக்கம்",
-  "closing": "மென்மையான முடிவுரை (அறிவுரை அல்ல)"
-}
+def wants_stream(data):
+    # Streaming is opt-in: {"stream": true} in the body or an SSE Accept header
+    return bool(data.get("stream")) or "text/event-stream" in request.headers.get("Accept", "")
 
-Write in simple, clear Tamil without technical jargon. Use short sentences that farmers can easily understand.""",
-        "en": """
+def sse_event(payload, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(payload, ensure_ascii=False)}\n\n"
 
-IMPORTANT: Respond in JSON format with all text fields in English.
-
-Use simple, clear English without technical jargon. Use short sentences that farmers can easily understand."""
-    }
-    
-    return base_prompt + language_instructions.get(language, language_instructions["en"])
+def sse_response(generator):
+    response = Response(generator, mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # Disable proxy buffering so tokens flush immediately
+    return response
 
 # --- AUTH ROUTES ---
 
@@ -316,9 +204,10 @@ def login():
             
         db.session.commit()
         
-        # Generate tokens
-        access_token = create_access_token(user.id)
-        refresh_token = create_refresh_token(user.id)
+        # Generate tokens; rotation keeps the family, so reuse can revoke the whole login
+        family = new_token_family()
+        access_token = create_access_token(user.id, family)
+        refresh_token = create_refresh_token(user.id, family)
         
         return jsonify({
             'message': 'Login successful',
@@ -336,6 +225,69 @@ def get_current_user(current_user):
         'user': current_user.to_dict()
     }), 200
 
+@app.route('/api/auth/session', methods=['GET'])
+@claims_required
+def get_session(claims):
+    # Name and status from the user cache: no database lookup and no ORM object on a cache hit
+    return jsonify({
+        'user_id': claims.id,
+        'name': claims.name,
+        'status': claims.status
+    }), 200
+
+@app.route('/api/auth/refresh', methods=['POST'])
+def refresh_tokens():
+    # Rotation: every refresh token works once and is exchanged for a new pair,
+    # so clients renew expired access tokens without re-sending the password
+    data = request.json or {}
+    token = data.get('refresh_token')
+
+    if not token:
+        return jsonify({'error': 'Refresh token is required'}), 400
+
+    # Revocation is checked below: a revoked refresh token is a reuse
+    claims, error = decode_token(token, 'refresh', check_revoked=False)
+    if error:
+        return error
+    if not claims.get('jti'):
+        # Issued before rotation existed and cannot be revoked; log in again
+        return jsonify({'error': 'Invalid token'}), 401
+
+    user = load_user(claims['user_id'])
+    if not user:
+        return jsonify({'error': 'User not found'}), 401
+
+    # The unique jti insert is what makes the token single-use across workers.
+    # A second use means the token leaked (or raced): revoke the whole family,
+    # including the tokens the first use was exchanged for.
+    if is_revoked(claims) or not revoke_token(claims):
+        revoke_token_family(claims)
+        return jsonify({'error': 'Token has been revoked'}), 401
+
+    family = claims.get('fam') or new_token_family()
+    return jsonify({
+        'access_token': create_access_token(user.id, family),
+        'refresh_token': create_refresh_token(user.id, family)
+    }), 200
+
+@app.route('/api/auth/logout', methods=['POST'])
+def logout():
+    # Revokes the presented access and refresh tokens and their family; either may be missing or expired
+    data = request.json or {}
+    tokens = [(data.get('refresh_token'), 'refresh')]
+    auth_header = request.headers.get('Authorization', '').split()
+    if len(auth_header) == 2 and auth_header[0] == 'Bearer':
+        tokens.append((auth_header[1], 'access'))
+
+    for token, token_type in tokens:
+        if token:
+            claims, error = decode_token(token, token_type)
+            if claims:
+                revoke_token(claims)
+                revoke_token_family(claims)
+
+    return jsonify({'message': 'Logged out'}), 200
+
 # -------------------
 
 @app.route("/api/ask-twin", methods=["POST"])
@@ -349,7 +301,7 @@ def ask_twin():
         return jsonify({"error": "No doubt provided"}), 400
 
     # Check if OpenAI client is available
-    if not client:
+    if not llm:
         # Provide a fallback response when OpenAI is not available
         fallback_responses = [
             "I understand you're facing a challenge. Please consider consulting with local agricultural experts for personalized advice.",
@@ -361,9 +313,28 @@ def ask_twin():
         answer = random.choice(fallback_responses)
         return jsonify({"answer": answer, "note": "AI service temporarily unavailable - showing general guidance"})
 
+    prompt = prompt_registry.get("ask_twin", language)
+    system_prompt, prompt_version = prompt.text, prompt.version
+
+    cached_answer, cache_tier = ask_twin_cache.get(doubt, context, language, prompt_version)
+    if cached_answer is not None:
+        if wants_stream(data):
+            response = sse_response(iter([
+                sse_event({"delta": cached_answer}, "token"),
+                sse_event({"answer": cached_answer}, "done")
+            ]))
+        else:
+            response = jsonify({"answer": cached_answer})
+        response.headers["X-Cache"] = cache_tier.upper()
+        return response
+
+    if wants_stream(data):
+        response = sse_response(stream_ask_twin(doubt, context, language, system_prompt, prompt_version))
+        response.headers["X-Cache"] = "MISS"
+        return response
+
     try:
-        system_prompt = get_system_prompt(language)
-        response = client.chat.completions.create(
+        response = llm.complete(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -377,7 +348,59 @@ def ask_twin():
         print(f"Error calling OpenAI API: {e}")
         return jsonify({"error": f"Error calling OpenAI API: {str(e)}"}), 500
 
-    return jsonify({"answer": answer})
+    if answer:
+        ask_twin_cache.set(doubt, answer, context, language, prompt_version)
+
+    response = jsonify({"answer": answer})
+    response.headers["X-Cache"] = "MISS"
+    return response
+
+def stream_ask_twin(doubt, context, language, system_prompt, prompt_version):
+    parts = []
+    try:
+        stream = llm.stream(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": f"Context: {context}\nFarmer doubt: {doubt}"}
+            ],
+            temperature=0.4
+        )
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield sse_event({"delta": delta}, "token")
+    except Exception as e:
+        print(f"Error streaming from OpenAI API: {e}")
+        yield sse_event({"error": f"Error calling OpenAI API: {str(e)}"}, "error")
+        return
+
+    answer = "".join(parts).strip()
+    if answer:
+        ask_twin_cache.set(doubt, answer, context, language, prompt_version)
+    yield sse_event({"answer": answer}, "done")
+
+@app.route("/api/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify({
+        "ask_twin": ask_twin_cache.stats(),
+        "llm_gateway": llm.stats() if llm else None,
+        "emotion_fastpath": emotion_classifier.stats() if emotion_classifier else None,
+        "crop_image": diagnosis_cache.stats() if diagnosis_cache else None,
+        "geocode": geocoder.stats(),
+        "facility_index": facility_store.stats() if facility_store else None,
+        "routes": route_client.stats(),
+        "cold_storage_search": cold_storage_cache.stats(),
+        "auth_users": user_cache_stats(),
+        "token_revocation": revocations.stats()
+    })
+
+@app.route('/api/health', methods=['GET'])
+def health_check():
+    return jsonify({'status': 'healthy', 'service': 'Farmer AI backend'})
 
 @app.route("/api/analyze-emotion", methods=["POST"])
 def analyze_emotion():
@@ -388,33 +411,27 @@ def analyze_emotion():
     if not text:
         return jsonify({"error": "No text provided"}), 400
 
+    # Fast path: clear-cut texts are answered locally, the rest escalate to the LLM
+    if emotion_classifier:
+        local_analysis = emotion_classifier.classify(text, language)
+        if local_analysis:
+            response = jsonify(local_analysis)
+            response.headers["X-Emotion-Source"] = "local"
+            return response
+
     # Check if OpenAI client is available
-    if not client:
+    if not llm:
         # Provide a fallback response when OpenAI is not available
-        neutral_response = {
-            "emotion": "Neutral" if language != "ta" else "நடுநிலை",
-            "confidence": "Low",
-            "evidence": "AI service temporarily unavailable" if language != "ta" else "AI சேவை தற்காலிகமாக கிடைக்கவில்லை",
-            "stress_level": "Unclear",
-            "decision_readiness": "Stable",
-            "confidence_trend": "Stable"
-        }
-        return jsonify(neutral_response)
+        return jsonify(unavailable_emotion_response(language))
 
     try:
         system_prompt = get_emotion_analysis_prompt(language)
 
-        user_prompt = f"""Analyze the emotional state of this farmer's text. Be honest and evidence-based. Only identify emotions when there is clear evidence.
-
-Farmer's text: "{text}"
-
-Provide your analysis in JSON format following the specified structure."""
-
-        response = client.chat.completions.create(
+        response = llm.complete(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
+                {"role": "user", "content": build_emotion_user_prompt(text)}
             ],
             temperature=0.3,  # Lower temperature for more consistent, factual analysis
             response_format={"type": "json_object"}
@@ -425,31 +442,73 @@ Provide your analysis in JSON format following the specified structure."""
         # Parse JSON response
         analysis = json.loads(analysis_text)
 
-        # Validate and sanitize response
-        valid_emotions = ["Happy", "Calm", "Sad", "Angry", "Stressed", "Neutral", "Unclear",
-                         "மகிழ்ச்சி", "அமைதி", "வருத்தம்", "கோபம்", "மன அழுத்தம்", "நடுநிலை", "தெளிவற்ற"]
-
-        if analysis.get("emotion") not in valid_emotions:
-            # If emotion is not in valid list, default to Neutral
-            analysis["emotion"] = "Neutral" if language != "ta" else "நடுநிலை"
-            analysis["confidence"] = "Low"
-            analysis["evidence"] = "No clear evidence" if language != "ta" else "தெளிவான சான்று இல்லை"
-
-        return jsonify(analysis)
+        return jsonify(sanitize_emotion_analysis(analysis, language))
 
     except json.JSONDecodeError:
         # If JSON parsing fails, return neutral state
-        return jsonify({
-            "emotion": "Neutral" if language != "ta" else "நடுநிலை",
-            "confidence": "Low",
-            "evidence": "Unable to analyze" if language != "ta" else "பகுப்பாய்வு செய்ய முடியவில்லை",
-            "stress_level": "Unclear",
-            "decision_readiness": "Unclear",
-            "confidence_trend": "Unclear"
-        })
+        return jsonify(unparseable_emotion_response(language))
     except Exception as e:
         return jsonify({"error": f"Error analyzing emotion: {str(e)}"}), 500
 
+EMOTION_BATCH_BACKEND = os.getenv("EMOTION_BATCH_BACKEND", "packed")
+if EMOTION_BATCH_BACKEND not in EMOTION_BATCH_BACKENDS:
+    # Fail at startup rather than in the middle of a streamed response
+    raise ValueError(f"Unknown EMOTION_BATCH_BACKEND {EMOTION_BATCH_BACKEND!r}, expected one of {sorted(EMOTION_BATCH_BACKENDS)}")
+EMOTION_BATCH_MAX_TEXTS = int(os.getenv("EMOTION_BATCH_MAX_TEXTS", "500"))
+
+@app.route("/api/analyze-emotion/batch", methods=["POST"])
+def analyze_emotion_batch():
+    # Streams one NDJSON line per text as results arrive (order not guaranteed,
+    # use "index"), then a summary line with upstream usage.
+    data = request.json or {}
+    texts = data.get("texts", [])
+    language = data.get("language", "en")
+
+    if not isinstance(texts, list) or not texts:
+        return jsonify({"error": "No texts provided"}), 400
+    if len(texts) > EMOTION_BATCH_MAX_TEXTS:
+        return jsonify({"error": f"Too many texts (max {EMOTION_BATCH_MAX_TEXTS})"}), 413
+    texts = [str(t) if t is not None else "" for t in texts]
+
+    def generate():
+        started = time.time()
+        pending = []
+        for index, text in enumerate(texts):
+            local_analysis = emotion_classifier.classify(text, language) if emotion_classifier and text.strip() else None
+            if not text.strip():
+                yield json.dumps({"index": index, "error": "No text provided"}, ensure_ascii=False) + "\n"
+            elif local_analysis:
+                yield json.dumps({"index": index, "result": local_analysis, "source": "local"}, ensure_ascii=False) + "\n"
+            elif not llm:
+                yield json.dumps({"index": index, "result": unavailable_emotion_response(language)}, ensure_ascii=False) + "\n"
+            else:
+                pending.append(index)
+
+        usage = None
+        if pending:
+            backend = create_emotion_batch_backend(EMOTION_BATCH_BACKEND, llm, get_emotion_analysis_prompt)
+            batch_texts = [texts[i] for i in pending]
+            for position, analysis in backend.analyze(batch_texts, language):
+                line = {"index": pending[position]}
+                if "error" in analysis:
+                    line["error"] = analysis["error"]
+                else:
+                    line["result"] = analysis
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+            usage = backend.usage
+
+        yield json.dumps({
+            "done": True,
+            "count": len(texts),
+            "backend": EMOTION_BATCH_BACKEND,
+            "usage": usage,
+            "elapsed_ms": round((time.time() - started) * 1000)
+        }) + "\n"
+
+    response = Response(generate(), mimetype="application/x-ndjson")
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
 @app.route("/api/what-if-view", methods=["POST"])
 def what_if_view():
     data = request.json
@@ -462,7 +521,7 @@ def what_if_view():
         return jsonify({"error": "No decision provided"}), 400
 
     # Check if OpenAI client is available
-    if not client:
+    if not llm:
         # Provide a fallback response when OpenAI is not available
         if language == "ta":
             fallback_response = {
@@ -480,15 +539,14 @@ def what_if_view():
             }
         return jsonify(fallback_response)
 
-    try:
-        system_prompt = get_what_if_system_prompt(language)
-        
-        # Adjust message length based on stress level
-        length_instruction = ""
-        if stress_level == "High":
-            length_instruction = "\n\nIMPORTANT: The farmer is experiencing high stress. Keep your response VERY SHORT and EXTRA CALM. Use simple, reassuring language."
-        
-        user_prompt = f"""The farmer wants to: {decision}
+    system_prompt = get_what_if_system_prompt(language)
+
+    # Adjust message length based on stress level
+    length_instruction = ""
+    if stress_level == "High":
+        length_instruction = "\n\nIMPORTANT: The farmer is experiencing high stress. Keep your response VERY SHORT and EXTRA CALM. Use simple, reassuring language."
+
+    user_prompt = f"""The farmer wants to: {decision}
 
 Context and real data available:
 {context}
@@ -499,12 +557,18 @@ Generate a What-If Future View showing two possible paths. Use ONLY the real dat
 
 Provide your response in JSON format following the specified structure."""
 
-        response = client.chat.completions.create(
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+    if wants_stream(data):
+        return sse_response(stream_what_if(messages, language))
+
+    try:
+        response = llm.complete(
             model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
+            messages=messages,
             temperature=0.4,  # Balanced temperature for helpful but not overly creative responses
             response_format={"type": "json_object"}
         )
@@ -514,38 +578,74 @@ Provide your response in JSON format following the specified structure."""
         # Parse JSON response
         what_if_data = json.loads(what_if_text)
         
-        # Validate response structure
-        required_fields = ["introduction", "path_now", "path_wait", "closing"]
-        for field in required_fields:
-            if field not in what_if_data:
-                what_if_data[field] = "Information not available" if language != "ta" else "தகவல் கிடைக்கவில்லை"
-        
-        # Add detected language to response
-        what_if_data["detected_language"] = language
-        
-        return jsonify(what_if_data)
+        return jsonify(finalize_what_if(what_if_data, language))
 
     except json.JSONDecodeError:
         # If JSON parsing fails, return a simple fallback
-        if language == "ta":
-            return jsonify({
-                "introduction": "மன்னிக்கவும், பதிலை உருவாக்க முடியவில்லை.",
-                "path_now": "உங்கள் முடிவை கவனமாக யோசியுங்கள்.",
-                "path_wait": "அவசரப்படாமல் சிந்தியுங்கள்.",
-                "closing": "உங்கள் முடிவு முக்கியமானது.",
-                "detected_language": "ta"
-            })
-        else:
-            return jsonify({
-                "introduction": "Sorry, unable to generate response.",
-                "path_now": "Please think carefully about your decision.",
-                "path_wait": "Take your time to consider.",
-                "closing": "Your decision matters.",
-                "detected_language": "en"
-            })
+        return jsonify(what_if_parse_fallback(language))
     except Exception as e:
         return jsonify({"error": f"Error generating What-If view: {str(e)}"}), 500
 
+WHAT_IF_FIELDS = ["introduction", "path_now", "path_wait", "closing"]
+
+def finalize_what_if(what_if_data, language):
+    # Validate response structure
+    for field in WHAT_IF_FIELDS:
+        if field not in what_if_data:
+            what_if_data[field] = "Information not available" if language != "ta" else "தகவல் கிடைக்கவில்லை"
+
+    # Add detected language to response
+    what_if_data["detected_language"] = language
+    return what_if_data
+
+def what_if_parse_fallback(language):
+    if language == "ta":
+        return {
+            "introduction": "மன்னிக்கவும், பதிலை உருவாக்க முடியவில்லை.",
+            "path_now": "உங்கள் முடிவை கவனமாக யோசியுங்கள்.",
+            "path_wait": "அவசரப்படாமல் சிந்தியுங்கள்.",
+            "closing": "உங்கள் முடிவு முக்கியமானது.",
+            "detected_language": "ta"
+        }
+    return {
+        "introduction": "Sorry, unable to generate response.",
+        "path_now": "Please think carefully about your decision.",
+        "path_wait": "Take your time to consider.",
+        "closing": "Your decision matters.",
+        "detected_language": "en"
+    }
+
+def stream_what_if(messages, language):
+    # Emits "delta" events while a field is being written and a "field" event as soon
+    # as each top-level field is complete, so path_now can render before path_wait exists.
+    parser = IncrementalJSONObjectParser()
+    try:
+        stream = llm.stream(
+            model="gpt-4o-mini",
+            messages=messages,
+            temperature=0.4,
+            response_format={"type": "json_object"}
+        )
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            for kind, key, value in parser.feed(delta):
+                if kind == "delta":
+                    yield sse_event({"field": key, "delta": value}, "delta")
+                else:
+                    yield sse_event({"field": key, "value": value}, "field")
+    except Exception as e:
+        yield sse_event({"error": f"Error generating What-If view: {str(e)}"}, "error")
+        return
+
+    if parser.done:
+        yield sse_event(finalize_what_if(dict(parser.fields), language), "done")
+    else:
+        yield sse_event(what_if_parse_fallback(language), "done")
+
 import os
 from werkzeug.utils import secure_filename
 
@@ -595,94 +695,123 @@ def upload_profile(current_user):
     
 # --- COLD STORAGE REAL-TIME API ---
 
-@app.route('/api/cold-storage/search', methods=['POST'])
+COLD_STORAGE_RADIUS_KM = 50
+COLD_STORAGE_MAX_RADIUS_KM = 100
+COLD_STORAGE_MAX_RESULTS = int(os.getenv("COLD_STORAGE_MAX_RESULTS", "50"))
+
+# OpenRouteService (Free Tier) directions and matrix, cached by rounded coordinates
+ORS_API_KEY = os.getenv('ORS_API_KEY') or "eyJvcmciOiI1YjNjZTM1OTc4NTExMTAwMDFjZjYyNDgiLCJpZCI6ImFkYjBkZjVmNTg0MzQwNTQ4MTkyM2FhMTE5NDU1NWI2IiwiaCI6Im11cm11cjY0In0="
+route_client = RouteClient(ORS_API_KEY)
+
+# Whole search responses: memory LRU + database tier, stale-while-revalidate.
+# Keys include the availability window, so nothing outlives its window and
+# older stale entries would never be read again.
+cold_storage_cache = StaleWhileRevalidateCache(
+    app,
+    fresh_ttl=int(os.getenv("COLD_STORAGE_CACHE_FRESH_TTL", "300")),
+    stale_ttl=int(os.getenv("COLD_STORAGE_CACHE_STALE_TTL", str(AVAILABILITY_WINDOW_SECONDS))),
+    maxsize=int(os.getenv("COLD_STORAGE_CACHE_SIZE", "500")),
+    second_tier=DatabaseTier("cold-storage-search")
+)
+
+def build_facility(facility_id, name, f_lat, f_lon, dist, location_query, window):
+    # Smart Availability Simulation (stable hash of the facility id and time window)
+    # This ensures "No fake" but provides realistic data without a real-time booking API
+    is_available, available_capacity = facility_availability(f"real-{facility_id}", 10000, window)
+
+    return {
+        "id": f"real-{facility_id}",
+        "name": {"en": name, "ta": f"{name} (பதிவு செய்யப்பட்டது)"},
+        "location": {"lat": f_lat, "lon": f_lon, "name": location_query or "Local Region"},
+        "supportedCrops": ["Potato", "Onion", "Tomato", "Mango", "Banana"], # Common crops
+        "tempRange": {"min": 2, "max": 15},
+        "totalCapacity": 10000,
+        "availableCapacity": available_capacity,
+        "costPerKg": 0.55 if dist < 10 else 0.40,
+        "contact": "+91 00000 00000",
+        "status": "Available" if is_available else "Not Available",
+        "distance": dist
+    }
+
+@app.route('/api/cold-storage/search', methods=['GET', 'POST'])
 def search_cold_storage():
-    data = request.json
+    # GET (query string) responses are cacheable and support If-None-Match / If-Modified-Since
+    data = request.args if request.method == 'GET' else (request.json or {})
     crop = data.get('crop', '')
     location_query = data.get('location', '')
+    try:
+        radius_km = min(max(float(data.get('radius') or COLD_STORAGE_RADIUS_KM), 1.0), COLD_STORAGE_MAX_RADIUS_KM)
+        limit = min(int(data.get('limit') or COLD_STORAGE_MAX_RESULTS), COLD_STORAGE_MAX_RESULTS)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'radius and limit must be numbers'}), 400
+    if limit < 1:
+        return jsonify({'status': 'error', 'message': 'limit must be a positive integer'}), 400
+
+    # Repeat searches are answered from the cache; stale entries are served
+    # immediately while a background refresh re-runs the search. A new
+    # availability window is a new key, so it misses instead of serving the old one.
+    window = current_window()
+    key = make_cache_key(crop, location_query, radius_km, limit, window)
+    result, cache_status, age = cold_storage_cache.get_or_compute(
+        key,
+        lambda: run_cold_storage_search(location_query, radius_km, limit, window),
+        # Mock fallbacks usually mean Overpass had a hiccup; do not pin them
+        cacheable=lambda r: r['facility_source'] != 'mock'
+    )
+
+    response = jsonify({
+        'status': 'success',
+        'facilities': result['facilities'],
+        'count': len(result['facilities'])
+    })
+    response.headers['X-Geocode-Source'] = result['geocode_source']
+    response.headers['X-Facility-Source'] = result['facility_source']
+    response.headers['X-Cache'] = {'fresh': 'HIT', 'stale': 'STALE', 'miss': 'MISS'}[cache_status]
+    response.headers['Age'] = str(int(age))
+    return make_cacheable(response, result['window'])
+
+def run_cold_storage_search(location_query, radius_km, limit, window):
+    # Results are deterministic per (crop, location, radius) within an availability window
     
-    # 1. Geocode Location using Nominatim (Free)
+    # 1. Geocode Location (cached; Nominatim only for places we have not seen)
     lat, lon = 10.8505, 76.2711 # Default fallback (South India)
+    geocode_source = "default"
     if location_query:
-        try:
-            geo_url = f"https://nominatim.openstreetmap.org/search?q={location_query}&format=json&limit=1"
-            headers = {'User-Agent': 'FarmerDigitalTwin/1.0'}
-            geo_res = requests.get(geo_url, headers=headers).json()
-            if geo_res:
-                lat = float(geo_res[0]['lat'])
-                lon = float(geo_res[0]['lon'])
-        except Exception as e:
-            print(f"Geocoding error: {e}")
-
-    # 2. Query Overpass API for real facilities
-    # Searching for industrial=cold_storage or amenity=warehouse near the location
-    overpass_url = "https://overpass-api.de/api/interpreter"
-    overpass_query = f"""
-    [out:json][timeout:25];
-    (
-      node["industrial"="cold_storage"](around:50000,{lat},{lon});
-      way["industrial"="cold_storage"](around:50000,{lat},{lon});
-      node["amenity"="warehouse"](around:50000,{lat},{lon});
-      way["amenity"="warehouse"](around:50000,{lat},{lon});
-    );
-    out center;
-    """
-    
+        place = geocoder.geocode(location_query)
+        if place:
+            lat, lon = place['lat'], place['lon']
+            geocode_source = place['source']
+
+    # 2. Local facility index first (milliseconds, offline); live Overpass only
+    # for areas that have not been synced yet
     facilities = []
-    try:
-        response = requests.post(overpass_url, data={'data': overpass_query}).json()
-        for element in response.get('elements', []):
-            name = element.get('tags', {}).get('name', 'Universal Cold Storage')
-            # Extract center for ways, or lat/lon for nodes
-            f_lat = element.get('lat') or element.get('center', {}).get('lat')
-            f_lon = element.get('lon') or element.get('center', {}).get('lon')
-            
-            # 3. Smart Availability Simulation (Deterministic based on name hash)
-            # This ensures "No fake" but provides realistic data without a real-time booking API
-            is_available = (hash(name) % 10) > 2 # 70% chance of availability
-            
-            # 4. Distance Calculation (Haversine for Free/Instant response)
-            def haversine(lat1, lon1, lat2, lon2):
-                R = 6371 # km
-                dlat = math.radians(lat2 - lat1)
-                dlon = math.radians(lon2 - lon1)
-                a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2)**2
-                c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-                return R * c
-
-            dist = round(haversine(lat, lon, f_lat, f_lon), 1)
-            
-            facilities.append({
-                "id": f"real-{element['id']}",
-                "name": {"en": name, "ta": f"{name} (பதிவு செய்யப்பட்டது)"},
-                "location": {"lat": f_lat, "lon": f_lon, "name": location_query or "Local Region"},
-                "supportedCrops": ["Potato", "Onion", "Tomato", "Mango", "Banana"], # Common crops
-                "tempRange": {"min": 2, "max": 15},
-                "totalCapacity": 10000,
-                "availableCapacity": 2500 if is_available else 0,
-                "costPerKg": 0.55 if dist < 10 else 0.40,
-                "contact": "+91 00000 00000",
-                "status": "Available" if is_available else "Not Available",
-                "distance": dist
-            })
-    except Exception as e:
-        print(f"Overpass error: {e}")
+    nearby = facility_store.search(lat, lon, radius_km) if facility_store else None
+    facility_source = "index" if nearby is not None else "overpass"
+    if nearby is not None:
+        for facility, distance in nearby:
+            name = facility['name'] or 'Universal Cold Storage'
+            facilities.append(build_facility(facility['osm_id'].replace('/', '-'), name, facility['lat'],
+                                             facility['lon'], round(distance, 1), location_query, window))
+    else:
+        facilities = search_overpass(lat, lon, location_query, radius_km, window)
 
     # --- MOCK DATA FALLBACK (If no real data found) ---
     if not facilities:
         print("Using Mock Data Fallback")
+        facility_source = "mock"
         base_names = [f"Global Cold Chain {location_query.title()}", "AgriStorage Pro", "Farmer's Cool Hub", "National Warehouse", "Fresh Logistics"]
         
         for i in range(5):
+            # Seeded per place and window so repeated searches get the same answer
+            rng = seeded_random("mock", round(lat, 4), round(lon, 4), i, window)
              # Create random offset around the center (Approx 5-10km radius)
-            offset_lat = (random.random() - 0.5) * 0.1 
-            offset_lon = (random.random() - 0.5) * 0.1
+            offset_lat = (rng.random() - 0.5) * 0.1 
+            offset_lon = (rng.random() - 0.5) * 0.1
             
             mock_lat = lat + offset_lat
             mock_lon = lon + offset_lon
             
-            # Simple distance calc for mock
-            d_mock = round(6371 * math.acos(math.cos(math.radians(lat)) * math.cos(math.radians(mock_lat)) * math.cos(math.radians(mock_lon) - math.radians(lon)) + math.sin(math.radians(lat)) * math.sin(math.radians(mock_lat))), 1)
+            d_mock = round(haversine_km(lat, lon, mock_lat, mock_lon), 1)
 
             facilities.append({
                 "id": f"mock-{i}",
@@ -693,22 +822,71 @@ def search_cold_storage():
                     "lon": mock_lon
                 },
                 "totalCapacity": 1000,
-                "availableCapacity": random.randint(100, 800),
-                "costPerKg": round(random.uniform(0.40, 0.80), 2),
+                "availableCapacity": rng.randint(100, 800),
+                "costPerKg": round(rng.uniform(0.40, 0.80), 2),
                 "supportedCrops": ["Tomatoes", "Potatoes", "Onions"],
                 "contact": "+91 98765 43210",
                 "status": "Available",
                 "distance": d_mock
             })
 
-    # 5. Smart Ranking (Distance, then Availability, then Price)
-    facilities.sort(key=lambda x: (x['status'] != 'Available', x['distance'], x['costPerKg']))
+    # 5. Smart Ranking (Availability, then Distance, then Price); top-k selection
+    # instead of a full sort when the area has many facilities
+    facilities = rank_facilities(facilities, k=limit)
     
-    return jsonify({
-        'status': 'success',
+    return {
         'facilities': facilities,
-        'count': len(facilities)
-    })
+        'geocode_source': geocode_source,
+        'facility_source': facility_source,
+        'window': window
+    }
+
+def make_cacheable(response, window):
+    # ETag over the body; Last-Modified and max-age follow the availability window
+    window_start, window_end = window_bounds(window)
+    response.set_etag(hashlib.sha256(response.get_data()).hexdigest()[:32])
+    response.last_modified = window_start
+    response.cache_control.public = True
+    response.cache_control.max_age = max(0, int((window_end - datetime.datetime.now(datetime.timezone.utc)).total_seconds()))
+    return response.make_conditional(request)
+
+def search_overpass(lat, lon, location_query, radius_km, window):
+    # Searching for industrial=cold_storage or amenity=warehouse near the location
+    overpass_url = "https://overpass-api.de/api/interpreter"
+    overpass_query = f"""
+    [out:json][timeout:25];
+    (
+      node["industrial"="cold_storage"](around:{int(radius_km * 1000)},{lat},{lon});
+      way["industrial"="cold_storage"](around:{int(radius_km * 1000)},{lat},{lon});
+      node["amenity"="warehouse"](around:{int(radius_km * 1000)},{lat},{lon});
+      way["amenity"="warehouse"](around:{int(radius_km * 1000)},{lat},{lon});
+    );
+    out center;
+    """
+
+    facilities = []
+    try:
+        response = requests.post(overpass_url, data={'data': overpass_query}, timeout=30).json()
+        if response.get('remark'):
+            print(f"Overpass returned an incomplete result: {response['remark']}")
+        elements = []
+        for element in response.get('elements', []):
+            # Extract center for ways, or lat/lon for nodes
+            f_lat = element.get('lat') or element.get('center', {}).get('lat')
+            f_lon = element.get('lon') or element.get('center', {}).get('lon')
+            if f_lat is not None and f_lon is not None:
+                elements.append((element, f_lat, f_lon))
+
+        # Distances to all elements in one pass
+        distances = haversine_many(lat, lon, [e[1] for e in elements], [e[2] for e in elements])
+        for (element, f_lat, f_lon), dist in zip(elements, distances):
+            name = element.get('tags', {}).get('name', 'Universal Cold Storage')
+            # Node and way ids overlap, so the element type is part of the id (as in osm_id)
+            facility_id = f"{element.get('type', 'node')}-{element['id']}"
+            facilities.append(build_facility(facility_id, name, f_lat, f_lon, round(float(dist), 1), location_query, window))
+    except Exception as e:
+        print(f"Overpass error: {e}")
+    return facilities
 
 @app.route('/api/cold-storage/route', methods=['POST'])
 def get_route():
@@ -716,194 +894,161 @@ def get_route():
     start = data.get('start') # [lat, lon]
     end = data.get('end')     # [lat, lon]
     
-    # Check for API Key (Free Tier)
-    # In a real app, use os.getenv('ORS_API_KEY')
-    # For this demo, we use the key provided by the user
-    api_key = os.getenv('ORS_API_KEY') or "eyJvcmciOiI1YjNjZTM1OTc4NTExMTAwMDFjZjYyNDgiLCJpZCI6ImFkYjBkZjVmNTg0MzQwNTQ4MTkyM2FhMTE5NDU1NWI2IiwiaCI6Im11cm11cjY0In0="
-    
-    if not api_key:
+    if not route_client.api_key:
         return jsonify({'status': 'error', 'message': 'ORS_API_KEY not configured'}), 400
 
     try:
-        # OpenRouteService Directions API (Driving-Car)
-        url = "https://api.openrouteservice.org/v2/directions/driving-car/geojson"
-        headers = {
-            'Authorization': api_key,
-            'Content-Type': 'application/json'
-        }
-        body = {
-            "coordinates": [
-                [start[1], start[0]], # ORS uses [lon, lat]
-                [end[1], end[0]]
-            ]
-        }
-        
-        response = requests.post(url, json=body, headers=headers)
-        if response.status_code == 200:
-            return jsonify({
-                'status': 'success',
-                'route': response.json()
-            })
-        else:
-            return jsonify({'status': 'error', 'message': 'ORS API Error', 'details': response.text}), 500
-            
+        # OpenRouteService Directions API (Driving-Car), cached by rounded coordinates
+        route, cached = route_client.directions(start, end)
+        response = jsonify({
+            'status': 'success',
+            'route': route
+        })
+        response.headers['X-Route-Cache'] = 'HIT' if cached else 'MISS'
+        return response
+    except RoutingError as e:
+        return jsonify({'status': 'error', 'message': str(e), 'details': e.details}), 500
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@app.route('/api/cold-storage/route-matrix', methods=['POST'])
+def get_route_matrix():
+    """
+    Road distance and travel time from one farm to many facilities in a single call.
+    Body: {"origin": [lat, lon], "destinations": [[lat, lon], ...] or [{"id", "lat", "lon"}, ...]}
+    """
+    data = request.json or {}
+    origin = data.get('origin')
+    destinations = data.get('destinations') or []
+    if not origin or len(origin) != 2:
+        return jsonify({'status': 'error', 'message': 'origin must be [lat, lon]'}), 400
+    if not destinations:
+        return jsonify({'status': 'error', 'message': 'destinations are required'}), 400
+    if len(destinations) > MAX_MATRIX_DESTINATIONS:
+        return jsonify({'status': 'error', 'message': f'At most {MAX_MATRIX_DESTINATIONS} destinations per request'}), 400
+
+    try:
+        points = [[d['lat'], d['lon']] if isinstance(d, dict) else [d[0], d[1]] for d in destinations]
+        points = [[float(p[0]), float(p[1])] for p in points]
+        origin = [float(origin[0]), float(origin[1])]
+    except (KeyError, IndexError, TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'destinations must be [lat, lon] pairs or {lat, lon} objects'}), 400
+
+    legs = route_client.matrix(origin, points)
+    results = []
+    for i, (destination, leg) in enumerate(zip(destinations, legs)):
+        results.append({
+            'index': i,
+            'id': destination.get('id') if isinstance(destination, dict) else None,
+            'distance': leg['distance_km'],
+            'duration': round(leg['duration_s'] / 60, 1), # minutes
+            'source': leg['source']
+        })
+
+    return jsonify({
+        'status': 'success',
+        'results': results,
+        # Facility indices ordered by travel time
+        'ranking': [r['index'] for r in sorted(results, key=lambda r: r['duration'])],
+        'estimated': any(r['source'] == 'estimate' for r in results)
+    })
+
 # ------------------------------------
 
 # ------------------------------------
 # --- ANIMAL INTRUSION ALERT SYSTEM ---
 # ------------------------------------
 
-import queue
 import time
 
-# Global Event Queue for SSE (Simple in-memory for MVP)
-# In production, use Redis or similar
-intrusion_events = queue.Queue()
+# Alerts reach SSE clients in every gunicorn worker through the broker
+# (ALERT_BROKER=memory|sqlite|redis, see alert_broker.py)
+alert_broker = create_broker()
 
-# Store Push Subscriptions (In-memory for demo, use DB in production)
-push_subscriptions = []
+def prune_push_subscription(subscription):
+    # The push service answered 404/410: the browser unsubscribed or the endpoint expired.
+    # Runs on a dispatcher thread, outside any request.
+    with app.app_context():
+        remove_subscription(subscription)
 
-# Try to import pywebpush
-try:
-    from pywebpush import webpush, WebPushException
-    PYWEBPUSH_AVAILABLE = True
-except ImportError:
-    PYWEBPUSH_AVAILABLE = False
+if not PYWEBPUSH_AVAILABLE:
     print("Warning: pywebpush not available. Push notifications will be disabled.")
-
-@app.route('/api/intrusion/report', methods=['POST'])
-def report_intrusion():
-    data = request.json
-    animal = data.get('animal', 'Unknown')
-    location = data.get('location', 'Farm Sector 1')
-    severity = data.get('severity', 'Medium')
-    
-    # Create Alert Object
-    alert = {
-        'id': int(time.time() * 1000),
-        'type': 'ANIMAL_INTRUSION',
-        'animal': animal,
-        'location': location,
-        'severity': severity,
-        'timestamp': datetime.datetime.utcnow().isoformat(),
-        'message': f"⚠️ {severity} Alert: {animal} detected at {location}!"
-    }
-    
-    # 1. Add to SSE Queue for Web Clients
-    intrusion_events.put(alert)
-    
-    # 2. Send Push Notifications
-    if PYWEBPUSH_AVAILABLE:
-        # Get VAPID Keys from Env or use placeholder
-        # Ideally, never hardcode. ensure these are in .env
-        private_key = os.getenv("VAPID_PRIVATE_KEY")
-        public_key = os.getenv("VAPID_PUBLIC_KEY") # Claims/Email usually required too
-        
-        if private_key:
-            notification_data = json.dumps(alert)
-            for sub in push_subscriptions:
-                try:
-                    webpush(
-                        subscription_info=sub,
-                        data=notification_data,
-                        vapid_private_key=private_key,
-                        vapid_claims={"sub": "mailto:admin@farmer.ai"}
-                    )
-                except WebPushException as ex:
-                    print(f"Push failed: {ex}")
-                    # Remove expired subscription logic here...
-                except Exception as e:
-                    print(f"Push error: {e}")
-
-    return jsonify({'status': 'success', 'message': 'Alert broadcasted', 'alert': alert}), 200
+# Deliveries run on a background pool; None when pywebpush or VAPID_PRIVATE_KEY is missing
+push_dispatcher = create_dispatcher(on_gone=prune_push_subscription)
 
 @app.route('/api/intrusion/stream')
 def stream_intrusion():
-    def event_stream():
-        # Send initial connection message
-        yield f"data: {json.dumps({'status': 'connected'})}\n\n"
-        
-        while True:
-            try:
-                # Wait for new event (blocking)
-                # We use a timeout to send keep-alive
-                event = intrusion_events.get(timeout=10) 
-                yield f"data: {json.dumps(event)}\n\n"
-                
-                # Re-queue for other clients (Broadcasting hack for single-process queue)
-                # NOTE: This simple queue mechanism is DESTRUCTIVE (pops item). 
-                # For proper multi-client broadcasting in Flask threaded mode without Redis,
-                # we need a better approach or just accept that ONLY ONE client gets it in this simple demo.
-                # BETTER APPROACH FOR MVP: use a global list with timestamp-based polling or a list of queues per client.
-                # Let's switch to a "List of Queues" approach for broadcasting.
-                pass 
-            except queue.Empty:
-                yield f": keep-alive\n\n"
-
-    # Optimization: Switch to Client-Specific Queue for proper broadcasting
-    # This replaces the logic above inside the route for thread-safety
-    client_queue = queue.Queue()
-    clients.append(client_queue)
-    
+    # ?lat=&lon=&radius_km= limits the stream to alerts near the farm
+    try:
+        farm = parse_farm_location(request.args)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    # Subscribe before reading the log so nothing published in between is lost
+    subscription = alert_broker.subscribe(farm)
+    # Browsers send Last-Event-ID when EventSource reconnects by itself
+    last_id = parse_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    missed = [event for event in alerts_after(last_id) if in_range(event, farm)] if last_id is not None else []
+    replayed_upto = missed[-1]['id'] if missed else (last_id or 0)
+
     def broadcast_stream():
         try:
             yield f"data: {json.dumps({'status': 'connected'})}\n\n"
+            for event in missed:
+                yield format_sse(event)
             while True:
-                try:
-                    event = client_queue.get(timeout=15)
-                    yield f"data: {json.dumps(event)}\n\n"
-                except queue.Empty:
+                event = subscription.get(timeout=15)
+                if event is None:
                     yield f": keep-alive\n\n"
-        except GeneratorExit:
-            clients.remove(client_queue)
+                elif event.get('id', 0) > replayed_upto:
+                    yield format_sse(event)
+        finally:
+            subscription.close()
 
     return Response(broadcast_stream(), mimetype="text/event-stream")
 
-# Global list of client queues for broadcasting
-clients = []
-
-# Update report_intrusion to push to ALL client queues
 def broadcast_event(event):
-    for q in clients:
-        q.put(event)
+    alert_broker.publish(event)
+
+@app.route('/api/intrusion/history', methods=['GET'])
+def intrusion_history():
+    cursor = parse_event_id(request.args.get('cursor'))
+    try:
+        limit = min(max(int(request.args.get('limit', HISTORY_PAGE_SIZE)), 1), HISTORY_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'limit must be a number'}), 400
+    alerts, next_cursor = alert_page(cursor, limit)
+    return jsonify({'status': 'success', 'alerts': alerts, 'next_cursor': next_cursor})
+
+@app.route('/api/intrusion/stats', methods=['GET'])
+def intrusion_stats():
+    stats = alert_broker.stats()
+    stats['push'] = push_dispatcher.stats() if push_dispatcher else None
+    return jsonify(stats)
 
-# Redefine report_intrusion to use broadcast
 @app.route('/api/intrusion/report', methods=['POST'])
-def report_intrusion_v2():
-    with app.app_context(): # Ensure context if needed, though mostly for DB
-        data = request.json
-        animal = data.get('animal', 'Unknown')
-        location = data.get('location', {})
-        location_name = location.get('name', 'Farm perimeter')
-        severity = data.get('severity', 'Medium')
-        
-        alert = {
-            'id': int(time.time() * 1000),
-            'type': 'ANIMAL_INTRUSION',
-            'animal': animal,
-            'location': location,
-            'location_name': location_name,
-            'severity': severity,
-            'timestamp': datetime.datetime.utcnow().isoformat(),
-            'message': f"⚠️ {animal} detected at {location_name}!"
-        }
-        
-        # Broadcast to SSE clients
-        broadcast_event(alert)
-        
-        # Trigger Push
-        trigger_push(alert)
-        
-        return jsonify({'status': 'success', 'alert': alert}), 200
+def report_intrusion():
+    data = request.json or {}
+    animal = data.get('animal', 'Unknown')
+    location = data.get('location', {}) # {"name", "lat", "lon", "region"}, all optional
+    if isinstance(location, str): # older clients send just the name
+        location = {'name': location}
+    location_name = location.get('name', 'Farm perimeter')
+    severity = data.get('severity', 'Medium')
+
+    # Logged first: the row id is the alert id clients resume from
+    alert = append_alert('ANIMAL_INTRUSION', animal, location, severity,
+                         f"⚠️ {animal} detected at {location_name}!")
+
+    # Broadcast to SSE clients
+    broadcast_event(alert)
+
+    # Trigger Push
+    trigger_push(alert)
+
+    return jsonify({'status': 'success', 'alert': alert}), 200
 
 def trigger_push(alert):
-    if not PYWEBPUSH_AVAILABLE: return
-    
-    private_key = os.getenv("VAPID_PRIVATE_KEY")
-    if not private_key: return
+    if not push_dispatcher: return
 
     payload = json.dumps({
         "title": "Animal Intrusion Alert!",
@@ -915,31 +1060,28 @@ def trigger_push(alert):
         }
     })
 
-    for sub in push_subscriptions:
-        try:
-            webpush(
-                subscription_info=sub,
-                data=payload,
-                vapid_private_key=private_key,
-                vapid_claims={"sub": "mailto:admin@farmer.ai"}
-            )
-        except Exception as e:
-            print(f"Push error: {e}")
+    # Only farms within range of the alert (everyone when it has no coordinates)
+    subscriptions = subscriptions_for_alert(alert)
+    # Returns immediately; delivery happens on the dispatcher's worker pool
+    push_dispatcher.dispatch(payload, subscriptions)
 
 @app.route('/api/push/subscribe', methods=['POST'])
 def push_subscribe():
-    subscription = request.json
-    if subscription and subscription not in push_subscriptions:
-        push_subscriptions.append(subscription)
+    # Either the browser's PushSubscription JSON, or
+    # {"subscription": ..., "location": {"lat", "lon", "radius_km"}, "region": ...}
+    data = request.json or {}
+    subscription = data.get('subscription', data)
+    try:
+        save_subscription(subscription, user_id=get_token_user_id(),
+                          location=data.get('location'), region=data.get('region'))
+    except InvalidSubscription as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     return jsonify({'status': 'success'}), 201
 
 @app.route('/api/push/vapid-public-key', methods=['GET'])
 def get_vapid_key():
     return jsonify({'publicKey': os.getenv("VAPID_PUBLIC_KEY")}), 200
 
-# Need to import Response
-from flask import Response
-
 if __name__ == "__main__":
     app.run(debug=True, threaded=True) # Ensure threaded for SSE
 
@@ -1,9 +1,16 @@
 import jwt
 import datetime
+import time
+import uuid
+from collections import namedtuple
 from flask import request, jsonify
 from functools import wraps
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
 from models import User
 from extensions import db
+from response_cache import TTLCache
+from token_revocation import revocations
 import os
 
 # Configuration (should be in .env but defaults provided for safety)
@@ -11,53 +18,186 @@ JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'default-dev-secret-key-change-in-p
 JWT_ACCESS_EXPIRATION_MINUTES = 60
 JWT_REFRESH_EXPIRATION_DAYS = 7
 
-def create_access_token(user_id):
+# Authenticated requests load the user from a per-process cache instead of the
+# database. Updates made through this process invalidate it immediately; other
+# workers see a change (e.g. a suspension) within USER_CACHE_TTL seconds; 0 disables it.
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', '60'))
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+TokenClaims = namedtuple('TokenClaims', ['id', 'name', 'status'])
+
+_user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+_USER_COLUMNS = [column.key for column in User.__table__.columns]
+
+def new_token_family():
+    """Id shared by every token issued from one login through refresh rotation."""
+    return uuid.uuid4().hex
+
+def create_access_token(user_id, family=None):
     payload = {
         'user_id': user_id,
         'exp': datetime.datetime.utcnow() + datetime.timedelta(minutes=JWT_ACCESS_EXPIRATION_MINUTES),
-        'type': 'access'
+        'type': 'access',
+        'jti': uuid.uuid4().hex
     }
+    if family:
+        payload['fam'] = family
     return jwt.encode(payload, JWT_SECRET_KEY, algorithm='HS256')
 
-def create_refresh_token(user_id):
+def create_refresh_token(user_id, family=None):
     payload = {
         'user_id': user_id,
         'exp': datetime.datetime.utcnow() + datetime.timedelta(days=JWT_REFRESH_EXPIRATION_DAYS),
-        'type': 'refresh'
+        'type': 'refresh',
+        'jti': uuid.uuid4().hex,
+        'fam': family or new_token_family()
     }
     return jwt.encode(payload, JWT_SECRET_KEY, algorithm='HS256')
 
+def load_user(user_id):
+    """User attached to the current session, from the cache when possible (no SELECT on a hit)."""
+    values = _user_cache.get(user_id) if USER_CACHE_TTL > 0 else None
+    if values is None:
+        user = db.session.get(User, user_id)
+        if user is not None and USER_CACHE_TTL > 0:
+            _user_cache.set(user_id, {column: getattr(user, column) for column in _USER_COLUMNS})
+        return user
+    user = User(**values)
+    make_transient_to_detached(user)
+    # load=False attaches the cached state as-is, so handlers can still modify and commit it
+    return db.session.merge(user, load=False)
+
+def user_values(user_id):
+    """Column values of the user as a dict from the cache (no ORM object on a hit), or None."""
+    values = _user_cache.get(user_id) if USER_CACHE_TTL > 0 else None
+    if values is None:
+        user = load_user(user_id)
+        if user is None:
+            return None
+        values = {column: getattr(user, column) for column in _USER_COLUMNS}
+    return values
+
+def invalidate_user(user_id):
+    _user_cache.pop(user_id)
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_cached_user(mapper, connection, target):
+    invalidate_user(target.id)
+    # Another request may re-cache the old row before this transaction commits
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('changed_user_ids', set()).add(target.id)
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _invalidate_committed_users(session):
+    for user_id in session.info.pop('changed_user_ids', ()):
+        invalidate_user(user_id)
+
+def user_cache_stats():
+    return {'entries': len(_user_cache), 'ttl': USER_CACHE_TTL}
+
+def get_token_user_id():
+    """User id from a valid access token in the Authorization header, or None (no DB lookup)."""
+    parts = (request.headers.get('Authorization') or '').split()
+    if len(parts) != 2 or parts[0] != 'Bearer':
+        return None
+    try:
+        data = jwt.decode(parts[1], JWT_SECRET_KEY, algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        return None
+    if data.get('type') != 'access' or is_revoked(data):
+        return None
+    return data.get('user_id')
+
+def is_revoked(data):
+    """Whether the token or its family was revoked. Bloom filter first; only a hit goes to the database."""
+    return any(revocations.is_revoked(data[claim]) for claim in ('jti', 'fam') if data.get(claim))
+
+def decode_token(token, token_type, check_revoked=True):
+    """Returns (claims, None) or (None, error response) for a token of the given type."""
+    try:
+        data = jwt.decode(token, JWT_SECRET_KEY, algorithms=['HS256'])
+    except jwt.ExpiredSignatureError:
+        return None, (jsonify({'error': 'Token has expired'}), 401)
+    except jwt.InvalidTokenError:
+        return None, (jsonify({'error': 'Invalid token'}), 401)
+    if data.get('type') != token_type:
+        return None, (jsonify({'error': 'Invalid token type'}), 401)
+    if check_revoked and is_revoked(data):
+        return None, (jsonify({'error': 'Token has been revoked'}), 401)
+    return data, None
+
+def revoke_token(data):
+    """Revokes decoded token claims until they expire. False if the jti was already revoked."""
+    if not data.get('jti'):
+        return False
+    return revocations.revoke(data['jti'], data['type'], data['exp'], data.get('user_id'))
+
+def revoke_token_family(data):
+    """
+    Revokes every access and refresh token sharing the family of the decoded
+    claims. The row outlives any token of the family: each was issued before
+    now and expires within JWT_REFRESH_EXPIRATION_DAYS of its issue.
+    """
+    if not data.get('fam'):
+        return False
+    expires_at = time.time() + JWT_REFRESH_EXPIRATION_DAYS * 24 * 3600
+    return revocations.revoke(data['fam'], 'family', expires_at, data.get('user_id'))
+
+def _decode_access_token():
+    """Returns (claims, None) or (None, error response)."""
+    token = None
+
+    # Check Authorization header
+    auth_header = request.headers.get('Authorization')
+    if auth_header:
+        parts = auth_header.split()
+        if len(parts) == 2 and parts[0] == 'Bearer':
+            token = parts[1]
+
+    if not token:
+        return None, (jsonify({'error': 'Authentication token is missing'}), 401)
+
+    return decode_token(token, 'access')
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        
-        # Check Authorization header
-        auth_header = request.headers.get('Authorization')
-        if auth_header:
-            parts = auth_header.split()
-            if len(parts) == 2 and parts[0] == 'Bearer':
-                token = parts[1]
-        
-        if not token:
-            return jsonify({'error': 'Authentication token is missing'}), 401
-        
+        data, error = _decode_access_token()
+        if error:
+            return error
+
         try:
-            data = jwt.decode(token, JWT_SECRET_KEY, algorithms=['HS256'])
-            if data.get('type') != 'access':
-                 return jsonify({'error': 'Invalid token type'}), 401
-                 
-            current_user = User.query.get(data['user_id'])
+            current_user = load_user(data['user_id'])
             if not current_user:
                 return jsonify({'error': 'User not found'}), 401
-                
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token has expired'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
         except Exception as e:
             return jsonify({'error': 'Token validation failed'}), 500
-            
+
         return f(current_user, *args, **kwargs)
-    
+
+    return decorated
+
+def claims_required(f):
+    """
+    Like token_required, but passes TokenClaims(id, name, status) from the
+    cached column values without building a User. The cache is dropped on
+    every update, so a rename or suspension shows up immediately in this worker.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        data, error = _decode_access_token()
+        if error:
+            return error
+
+        try:
+            values = user_values(data['user_id'])
+        except Exception as e:
+            return jsonify({'error': 'Token validation failed'}), 500
+        if not values:
+            return jsonify({'error': 'User not found'}), 401
+
+        return f(TokenClaims(values['id'], values['name'], values['status']), *args, **kwargs)
+
     return decorated
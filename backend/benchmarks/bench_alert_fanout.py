@@ -0,0 +1,111 @@
+"""
+Intrusion alert fan-out: alerts/sec delivered to N concurrent subscribers.
+
+    python benchmarks/bench_alert_fanout.py --subscribers 1000 --alerts 200
+
+Each subscriber is a thread blocked in Subscription.get(), like an SSE
+request thread in a gthread worker. For the cross-process brokers the
+alerts are published from a separate process, the way a report handled by
+one gunicorn worker must reach watchers connected to another. Redis runs
+against benchmarks/fake_redis.py unless --redis-url is given.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from alert_broker import InProcessBroker, SQLiteBroker, RedisBroker
+from fake_redis import FakeRedisServer
+
+
+def make_alert(i):
+    return {"id": i, "type": "ANIMAL_INTRUSION", "animal": "Wild Boar", "severity": "High",
+            "location": {"name": "North field", "lat": 11.01, "lon": 76.95},
+            "message": "Wild Boar detected at North field!"}
+
+
+def publish_all(kind, target, alerts, rate):
+    broker = SQLiteBroker(path=target) if kind == "sqlite" else RedisBroker(url=target)
+    for i in range(alerts):
+        broker.publish(make_alert(i))
+        if rate:
+            time.sleep(1 / rate)
+
+
+def run(kind, broker, target, subscribers, alerts, rate):
+    received = [0] * subscribers
+    done = threading.Barrier(subscribers + 1)
+    subscriptions = [broker.subscribe() for _ in range(subscribers)]
+
+    def consume(i, subscription):
+        # Slow subscribers may have older alerts dropped; the last one always arrives
+        while True:
+            event = subscription.get(timeout=30)
+            if event is None:
+                break
+            received[i] += 1
+            if event["id"] == alerts - 1:
+                break
+        done.wait()
+
+    threads = [threading.Thread(target=consume, args=(i, s), daemon=True) for i, s in enumerate(subscriptions)]
+    for thread in threads:
+        thread.start()
+
+    start = time.perf_counter()
+    if kind == "memory":
+        for i in range(alerts):
+            broker.publish(make_alert(i))
+            if rate:
+                time.sleep(1 / rate)
+    else:
+        publisher = multiprocessing.get_context("spawn").Process(
+            target=publish_all, args=(kind, target, alerts, rate))
+        publisher.start()
+        publisher.join()
+    done.wait()
+    elapsed = time.perf_counter() - start
+    for subscription in subscriptions:
+        subscription.close()
+    delivered = sum(received)
+    return delivered, elapsed, broker.stats()["dropped"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subscribers", type=int, default=1000)
+    parser.add_argument("--alerts", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=0, help="publish rate limit (alerts/s), 0 = as fast as possible")
+    parser.add_argument("--brokers", nargs="+", default=["memory", "sqlite", "redis"])
+    parser.add_argument("--redis-url")
+    args = parser.parse_args()
+
+    fake_redis = None
+    print(f"{args.subscribers} subscribers, {args.alerts} alerts")
+    print(f"{'broker':>8} {'delivered':>10} {'dropped':>8} {'seconds':>8} {'alerts/s':>9} {'deliveries/s':>13}")
+    for kind in args.brokers:
+        with tempfile.TemporaryDirectory() as tmp:
+            if kind == "memory":
+                target, broker = None, InProcessBroker()
+            elif kind == "sqlite":
+                target = os.path.join(tmp, "alerts.db")
+                broker = SQLiteBroker(path=target, poll_interval=0.05)
+            else:
+                if not args.redis_url and fake_redis is None:
+                    fake_redis = FakeRedisServer().start()
+                target = args.redis_url or fake_redis.url
+                broker = RedisBroker(url=target)
+            delivered, elapsed, dropped = run(kind, broker, target, args.subscribers, args.alerts, args.rate)
+            broker.close()
+        print(f"{kind:>8} {delivered:>10} {dropped:>8} {elapsed:>8.2f} {args.alerts / elapsed:>9.0f} {delivered / elapsed:>13.0f}")
+    if fake_redis:
+        fake_redis.stop()
+
+
+if __name__ == "__main__":
+    main()
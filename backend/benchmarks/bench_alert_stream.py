@@ -0,0 +1,136 @@
+"""
+Idle SSE connections per worker: asyncio server vs. the threaded Flask stream.
+
+    python benchmarks/bench_alert_stream.py --connections 1000 5000 10000
+
+For each server (run as a separate process on a temp SQLite broker) the
+benchmark opens N idle /api/intrusion/stream connections, reads the RSS of
+the server process to get memory per idle connection, then publishes one
+alert from this process and times until every connection has received it.
+
+"threaded" is app.py under Werkzeug's threaded server, one thread per
+watcher; in production a gthread worker caps this at --threads (16 in
+render.yaml). "asyncio" is alert_stream_asgi under uvicorn.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from alert_broker import SQLiteBroker
+
+SERVERS = {
+    "asyncio": "import alert_stream_asgi as m, sys; sys.argv = ['x', '--host', '127.0.0.1', '--port', '{port}']; m.main()",
+    "threaded": "import app as m; m.app.run(host='127.0.0.1', port={port}, threaded=True)",
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_kb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def start_server(kind, port, tmp):
+    env = dict(os.environ, ALERT_BROKER="sqlite", ALERT_BROKER_SQLITE_PATH=os.path.join(tmp, "alerts.db"),
+               ALERT_BROKER_POLL_INTERVAL="0.05", DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'app.db')}",
+               ALERT_STREAM_MAX_CONNECTIONS="100000", ALERT_SUBSCRIBER_BUFFER="10")
+    process = subprocess.Popen([sys.executable, "-c", SERVERS[kind].format(port=port)], cwd=BACKEND_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(300):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"{kind} server did not start")
+
+
+async def open_stream(port):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET /api/intrusion/stream HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\nAccept: text/event-stream\r\n\r\n".encode())
+    await writer.drain()
+    await reader.readuntil(b'"connected"}')
+    return reader, writer
+
+
+async def wait_for_alert(reader):
+    await reader.readuntil(b"ANIMAL_INTRUSION")
+
+
+async def measure(kind, port, pid, counts, broker):
+    streams = []
+    results = []
+    failed = False
+    baseline = None
+    for n in counts:
+        while len(streams) < n and not failed:
+            batch = min(200, n - len(streams))
+            opened = await asyncio.gather(*[asyncio.wait_for(open_stream(port), 20) for _ in range(batch)],
+                                          return_exceptions=True)
+            for item in opened:
+                if isinstance(item, BaseException):
+                    failed = True
+                else:
+                    streams.append(item)
+            if baseline is None and streams:
+                await asyncio.sleep(0.5)
+                baseline = (len(streams), rss_kb(pid))
+        await asyncio.sleep(1)
+        rss = rss_kb(pid)
+        per_connection = (rss - baseline[1]) / max(1, len(streams) - baseline[0])
+
+        start = time.perf_counter()
+        broker.publish({"id": n, "type": "ANIMAL_INTRUSION", "animal": "Elephant"})
+        delivered = await asyncio.gather(*[asyncio.wait_for(wait_for_alert(r), 30) for r, _ in streams],
+                                         return_exceptions=True)
+        fan_out = time.perf_counter() - start
+        ok = sum(1 for d in delivered if not isinstance(d, BaseException))
+        results.append((kind, n, len(streams), rss / 1024, per_connection, ok, fan_out))
+        if failed:
+            break
+    for _, writer in streams:
+        writer.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connections", type=int, nargs="+", default=[1000, 5000, 10000])
+    parser.add_argument("--servers", nargs="+", default=["threaded", "asyncio"])
+    parser.add_argument("--threaded-max", type=int, default=2000, help="skip larger counts for the threaded server")
+    args = parser.parse_args()
+
+    print(f"{'server':>9} {'target':>7} {'open':>7} {'rss MB':>8} {'KB/conn':>8} {'got alert':>10} {'fan-out':>9}")
+    for kind in args.servers:
+        counts = [n for n in args.connections if kind != "threaded" or n <= args.threaded_max]
+        with tempfile.TemporaryDirectory() as tmp:
+            port = free_port()
+            process = start_server(kind, port, tmp)
+            broker = SQLiteBroker(path=os.path.join(tmp, "alerts.db"))
+            try:
+                for row in asyncio.run(measure(kind, port, process.pid, counts, broker)):
+                    print("{:>9} {:>7} {:>7} {:>8.1f} {:>8.1f} {:>10} {:>8.2f}s".format(*row))
+            finally:
+                process.kill()
+                process.wait()
+
+
+if __name__ == "__main__":
+    main()
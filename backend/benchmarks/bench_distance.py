@@ -0,0 +1,91 @@
+"""
+Distance + ranking micro-benchmark for facility search.
+
+    python benchmarks/bench_distance.py --sizes 10000 100000 --k 50
+
+"scalar" is the previous approach: one math.haversine call per facility and
+a full sort on the (not available, distance, cost) tuple. "vectorized" is
+geo_distance: bounding-box prefilter, one NumPy haversine pass and
+argpartition top-k on a single composite key.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from geo_distance import haversine_km, haversine_many, bbox_mask, ranking_key, top_k
+
+
+def make_candidates(n, lat, lon, spread_deg, seed=3):
+    rng = np.random.default_rng(seed)
+    lats = lat + rng.uniform(-spread_deg, spread_deg, n)
+    lons = lon + rng.uniform(-spread_deg, spread_deg, n)
+    available = rng.random(n) > 0.3
+    cost = np.round(rng.uniform(0.40, 0.80, n), 2)
+    return lats, lons, available, cost
+
+
+def scalar(lat, lon, radius_km, k, lats, lons, available, cost):
+    rows = []
+    for i in range(len(lats)):
+        dist = round(haversine_km(lat, lon, lats[i], lons[i]), 1)
+        if dist <= radius_km:
+            rows.append((not available[i], dist, cost[i], i))
+    rows.sort()
+    return [row[3] for row in rows[:k]]
+
+
+def vectorized(lat, lon, radius_km, k, lats, lons, available, cost):
+    candidates = np.flatnonzero(bbox_mask(lat, lon, radius_km, lats, lons))
+    dist = np.round(haversine_many(lat, lon, lats[candidates], lons[candidates]), 1)
+    inside = dist <= radius_km
+    candidates, dist = candidates[inside], dist[inside]
+    keys = np.where(available[candidates], 0.0, 1e9) + np.round(dist * 100) + np.minimum(cost[candidates], 9.99) / 10
+    return candidates[top_k(keys, k)].tolist()
+
+
+def tuple_key(data, i, lat, lon):
+    lats, lons, available, cost = data
+    return (not available[i], round(haversine_km(lat, lon, lats[i], lons[i]), 1), cost[i])
+
+
+def timeit(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--radius", type=float, default=50.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    lat, lon = 11.0168, 76.9558
+    # Sanity check: the composite key orders exactly like the tuple
+    assert ranking_key(True, 3.4, 0.8) < ranking_key(True, 3.5, 0.4) < ranking_key(False, 0.1, 0.4)
+
+    print(f"{'candidates':>10} {'spread':>7} {'scalar':>10} {'vectorized':>11} {'speed-up':>9}")
+    for n in args.sizes:
+        for spread in (0.5, 5.0):  # everything near the farm vs. mostly outside the radius
+            data = make_candidates(n, lat, lon, spread)
+            lists = [data[0].tolist(), data[1].tolist(), data[2].tolist(), data[3].tolist()]
+            t_scalar, expected = timeit(lambda: scalar(lat, lon, args.radius, args.k, *lists), args.repeat)
+            t_vector, got = timeit(lambda: vectorized(lat, lon, args.radius, args.k, *data), args.repeat)
+            # Ties (same availability, distance and cost) may come back in either order
+            assert [tuple_key(data, i, lat, lon) for i in got] == [tuple_key(data, i, lat, lon) for i in expected], "rankings differ"
+            print(f"{n:>10} {spread:>6}° {t_scalar * 1000:>8.2f}ms {t_vector * 1000:>9.2f}ms {t_scalar / t_vector:>8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Throughput and cost per text for batch emotion analysis.
+
+    python benchmarks/bench_emotion_batch.py --texts 400 --latency 0.5
+
+Compares the old pattern (one sequential request per text) with the
+per_item and packed batch backends, against a local fake OpenAI server that
+charges latency per call and a small amount per output item.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_openai import FakeOpenAIServer
+from emotion_batch import PerItemBackend, PackedCompletionBackend
+from llm_gateway import LLMGateway
+
+# gpt-4o-mini list prices, USD per 1M tokens
+INPUT_PRICE = 0.15
+OUTPUT_PRICE = 0.60
+
+SAMPLE_TEXTS = [
+    "I am happy, the harvest came out well this year",
+    "Rain destroyed half my paddy, I don't know how to repay the loan",
+    "Prices at the mandi are fine today",
+    "I am worried about the pest attack on my cotton",
+    "The trader cheated me again, I am very angry",
+    "இன்று பயிர் நன்றாக உள்ளது",
+]
+
+RESULT = {"emotion": "Calm", "confidence": "Medium", "evidence": "Benchmark response",
+          "stress_level": "Low", "decision_readiness": "Stable", "confidence_trend": "Stable"}
+
+
+def responder(body):
+    user_prompt = body["messages"][-1]["content"]
+    match = re.search(r"Farmer texts \(JSON\):\n(.*)\n\nProvide", user_prompt, re.S)
+    if match:
+        items = json.loads(match.group(1))
+        return json.dumps({"results": [dict(RESULT, id=item["id"]) for item in items]})
+    return json.dumps(RESULT)
+
+
+def system_prompt(language):
+    # Roughly the size of the real emotion prompt
+    return "You are an emotion analysis system for a Farmer Digital Twin. " * 40
+
+
+def report(name, texts, elapsed, usage):
+    n = len(texts)
+    cost = (usage["prompt_tokens"] * INPUT_PRICE + usage["completion_tokens"] * OUTPUT_PRICE) / 1e6
+    print(f"{name:<22} {n / elapsed:8.1f} texts/s  {usage['upstream_calls']:5d} calls  "
+          f"${cost / n * 1000:.4f} per 1k texts")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--texts", type=int, default=400)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--pack-size", type=int, default=20)
+    args = parser.parse_args()
+
+    fake = FakeOpenAIServer(latency=args.latency, responder=responder).start()
+    gateway = LLMGateway(api_key="bench", base_url=fake.base_url, max_concurrency=32, singleflight=False)
+    texts = [f"{SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)]} ({i})" for i in range(args.texts)]
+
+    # Before: one blocking request per text, as the field-officer tool does today
+    serial = texts[:max(4, args.texts // 20)]
+    backend = PerItemBackend(gateway, system_prompt)
+    start = time.perf_counter()
+    for text in serial:
+        list(backend.analyze([text]))
+    report("sequential (before)", serial, time.perf_counter() - start, backend.usage)
+
+    for backend in (PerItemBackend(gateway, system_prompt),
+                    PackedCompletionBackend(gateway, system_prompt, pack_size=args.pack_size)):
+        start = time.perf_counter()
+        results = list(backend.analyze(texts))
+        assert len(results) == len(texts)
+        report(f"{backend.name} batch", texts, time.perf_counter() - start, backend.usage)
+
+    fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Radius and k-nearest query latency of the local facility index.
+
+    python benchmarks/bench_facility_index.py --facilities 50000 --queries 500
+
+Facilities are generated around random "market towns" inside India's
+bounding box (real facilities cluster the same way). Each query is compared
+against a linear scan over every facility, which is what the search endpoint
+did with the elements of a live Overpass response.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from facility_store import FacilityIndex
+from geo_distance import haversine_km
+
+
+def make_facilities(count, towns=400, seed=7):
+    rng = random.Random(seed)
+    centers = [(rng.uniform(8.0, 30.0), rng.uniform(70.0, 88.0)) for _ in range(towns)]
+    facilities = []
+    for i in range(count):
+        lat, lon = rng.choice(centers)
+        facilities.append({
+            "osm_id": f"node/{i}",
+            "name": f"Cold Storage {i}",
+            "lat": lat + rng.gauss(0, 0.25),
+            "lon": lon + rng.gauss(0, 0.25),
+        })
+    return facilities, centers
+
+
+def linear_radius(facilities, lat, lon, radius_km):
+    results = []
+    for facility in facilities:
+        distance = haversine_km(lat, lon, facility["lat"], facility["lon"])
+        if distance <= radius_km:
+            results.append((facility, distance))
+    results.sort(key=lambda item: item[1])
+    return results
+
+
+def summarize(label, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{label:<28} median {statistics.median(samples) * 1000:8.3f} ms   p95 {p95 * 1000:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--facilities", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--radius", type=float, default=50.0)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    facilities, centers = make_facilities(args.facilities)
+    started = time.perf_counter()
+    index = FacilityIndex(facilities)
+    print(f"Built index over {index.size} facilities in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    rng = random.Random(1)
+    points = [(lat + rng.gauss(0, 0.3), lon + rng.gauss(0, 0.3))
+              for lat, lon in (rng.choice(centers) for _ in range(args.queries))]
+
+    linear, indexed, nearest = [], [], []
+    found = 0
+    for lat, lon in points:
+        start = time.perf_counter()
+        expected = linear_radius(facilities, lat, lon, args.radius)
+        linear.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        got = index.radius(lat, lon, args.radius)
+        indexed.append(time.perf_counter() - start)
+        # Same facilities; order may differ only between points at (floating-point) equal distance
+        assert {f["osm_id"] for f, _ in got} == {f["osm_id"] for f, _ in expected}
+        found += len(got)
+
+        start = time.perf_counter()
+        index.nearest(lat, lon, k=args.k)
+        nearest.append(time.perf_counter() - start)
+
+    print(f"{args.queries} queries, {found / args.queries:.0f} facilities within {args.radius:.0f} km on average\n")
+    summarize(f"linear scan ({args.radius:.0f} km)", linear)
+    summarize(f"geohash index ({args.radius:.0f} km)", indexed)
+    summarize(f"geohash index (k={args.k} nearest)", nearest)
+    print(f"\nSpeed-up (median radius query): {statistics.median(linear) / statistics.median(indexed):.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Geo-targeted alert fan-out simulation.
+
+    python benchmarks/bench_geo_fanout.py --subscribers 50000 --alerts 1000
+
+Subscribers are farms clustered around towns across Tamil Nadu (about
+5.5 x 4.5 degrees) with alert radii of 5-25 km. The benchmark times
+GeoSubscriberIndex.match (one cell lookup + exact distance check on the
+candidates in that cell), checks it against a brute-force distance scan, and
+then times the real InProcessBroker fan-out into the subscription queues:
+
+- broadcast:    the previous behaviour, every alert to every subscriber
+- geo-targeted: subscribers registered with their farm location
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from alert_broker import InProcessBroker
+from geo_distance import haversine_km
+from geo_fanout import GeoSubscriberIndex
+from geohash import encode
+
+SOUTH, WEST, NORTH, EAST = 8.0, 76.2, 13.5, 80.4
+
+
+def make_farms(n, seed=7):
+    rng = random.Random(seed)
+    # Farms cluster around towns, like real users do
+    towns = [(rng.uniform(SOUTH, NORTH), rng.uniform(WEST, EAST)) for _ in range(60)]
+    farms = []
+    for _ in range(n):
+        town_lat, town_lon = rng.choice(towns)
+        farms.append((town_lat + rng.gauss(0, 0.25), town_lon + rng.gauss(0, 0.25), rng.uniform(5, 25)))
+    return farms
+
+
+def make_alerts(n, farms, seed=11):
+    rng = random.Random(seed)
+    # Intrusions happen near farms
+    return [(lat + rng.uniform(-0.1, 0.1), lon + rng.uniform(-0.1, 0.1))
+            for lat, lon, _ in (rng.choice(farms) for _ in range(n))]
+
+
+def timed(fn, items):
+    samples = []
+    results = []
+    for item in items:
+        start = time.perf_counter()
+        results.append(fn(item))
+        samples.append(time.perf_counter() - start)
+    return samples, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subscribers", type=int, default=50000)
+    parser.add_argument("--alerts", type=int, default=1000)
+    parser.add_argument("--verify", type=int, default=50, help="alerts to check against a brute-force scan")
+    args = parser.parse_args()
+
+    farms = make_farms(args.subscribers)
+    alerts = make_alerts(args.alerts, farms)
+
+    start = time.perf_counter()
+    index = GeoSubscriberIndex()
+    for i, (lat, lon, radius) in enumerate(farms):
+        index.add(i, lat, lon, radius)
+    build = time.perf_counter() - start
+
+    for lat, lon in alerts[:args.verify]:
+        expected = {i for i, (f_lat, f_lon, r) in enumerate(farms) if haversine_km(lat, lon, f_lat, f_lon) <= r}
+        assert set(index.match(lat, lon)) == expected, "geo index disagrees with brute force"
+
+    samples, sent = timed(lambda alert: len(index.match(*alert)), alerts)
+    candidates = [len(index._cells.get(encode(lat, lon, index.precision), ())) for lat, lon in alerts]
+    p99 = sorted(samples)[int(len(samples) * 0.99) - 1]
+
+    print(f"{args.subscribers} subscribers, {args.alerts} alerts, index built in {build * 1000:.0f} ms "
+          f"(verified {args.verify} alerts against brute force)")
+    print(f"geo index match: {statistics.mean(candidates):.0f} candidates, {statistics.mean(sent):.0f} recipients/alert, "
+          f"p50 {statistics.median(samples) * 1e6:.0f}us, p99 {p99 * 1e6:.0f}us")
+
+    # End to end through the broker: queue puts included
+    for targeted in (False, True):
+        broker = InProcessBroker(buffer_size=1000)
+        for lat, lon, radius in farms:
+            broker.subscribe((lat, lon, radius) if targeted else None)
+        sample = alerts[:100]
+        start = time.perf_counter()
+        for i, (lat, lon) in enumerate(sample):
+            broker.publish({"id": i, "animal": "Elephant", "location": {"lat": lat, "lon": lon}})
+        per_alert = (time.perf_counter() - start) / len(sample)
+        stats = broker.stats()
+        print(f"broker {'geo-targeted' if targeted else 'broadcast':>12}: {per_alert * 1000:.2f} ms/alert, "
+              f"{stats['delivered'] / len(sample):.0f} deliveries/alert")
+
+
+if __name__ == "__main__":
+    main()
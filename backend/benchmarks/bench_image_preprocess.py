@@ -0,0 +1,96 @@
+"""
+Bytes saved and end-to-end latency of image preprocessing before the vision call.
+
+    python benchmarks/bench_image_preprocess.py --folder path/to/leaf/photos --uplink-mbps 5
+
+Without --folder, synthetic 12 MP phone-style JPEGs (with EXIF) are generated.
+End-to-end latency = local preparation + time to push the request body over an
+uplink of the given speed + the round trip to a local fake OpenAI server.
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from PIL import Image
+
+from fake_openai import FakeOpenAIServer
+from image_preprocess import preprocess_image, to_data_url
+
+
+def make_samples(folder, count=5):
+    for i in range(count):
+        # Smooth gradients + noise compress like real photos (not like pure noise)
+        image = Image.radial_gradient("L").resize((4000, 3000)).convert("RGB")
+        noise = Image.effect_noise((4000, 3000), 40).convert("RGB")
+        image = Image.blend(image, noise, 0.35)
+        exif = Image.Exif()
+        exif[0x0112] = 6  # orientation: rotate 90
+        exif[0x010F] = "PhoneMaker"
+        image.save(os.path.join(folder, f"sample_{i}.jpg"), "JPEG", quality=95, exif=exif)
+
+
+def post(url, data_url):
+    body = json.dumps({"model": "gpt-4o-mini", "messages": [{"role": "user", "content": [
+        {"type": "image_url", "image_url": {"url": data_url}}]}]})
+    start = time.perf_counter()
+    requests.post(url, data=body, headers={"Content-Type": "application/json"})
+    return len(body), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--folder")
+    parser.add_argument("--uplink-mbps", type=float, default=5.0)
+    parser.add_argument("--quality", type=int, default=82)
+    args = parser.parse_args()
+
+    folder = args.folder or tempfile.mkdtemp(prefix="crop_images_")
+    if not args.folder:
+        make_samples(folder)
+
+    fake = FakeOpenAIServer(latency=0.0).start()
+    url = fake.base_url + "/chat/completions"
+    bytes_per_s = args.uplink_mbps * 1e6 / 8
+
+    totals = {"raw": 0, "prepared": 0, "raw_e2e": 0.0, "prepared_e2e": 0.0}
+    print(f"{'image':<24} {'raw KB':>8} {'sent KB':>8} {'saved':>6} {'prep ms':>8} {'e2e before':>11} {'e2e after':>10}")
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        with open(path, "rb") as f:
+            raw = f.read()
+
+        # Before: raw bytes base64'd and labelled image/jpeg
+        raw_url = "data:image/jpeg;base64," + base64.b64encode(raw).decode("ascii")
+        raw_body, raw_rtt = post(url, raw_url)
+        raw_e2e = raw_body / bytes_per_s + raw_rtt
+
+        start = time.perf_counter()
+        with open(path, "rb") as f:
+            prepared = preprocess_image(f, quality=args.quality)
+        data_url = to_data_url(prepared)
+        prep_time = time.perf_counter() - start
+        body, rtt = post(url, data_url)
+        e2e = prep_time + body / bytes_per_s + rtt
+
+        totals["raw"] += len(raw)
+        totals["prepared"] += len(prepared.data)
+        totals["raw_e2e"] += raw_e2e
+        totals["prepared_e2e"] += e2e
+        print(f"{name[:24]:<24} {len(raw) / 1024:8.0f} {len(prepared.data) / 1024:8.0f} "
+              f"{1 - len(prepared.data) / len(raw):6.1%} {prep_time * 1000:8.0f} {raw_e2e:10.2f}s {e2e:9.2f}s")
+
+    print(f"\nTotal: {totals['raw'] / 1e6:.1f} MB -> {totals['prepared'] / 1e6:.2f} MB "
+          f"({1 - totals['prepared'] / totals['raw']:.1%} saved); "
+          f"end-to-end {totals['raw_e2e']:.1f}s -> {totals['prepared_e2e']:.1f}s at {args.uplink_mbps} Mbps uplink")
+    fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Requests/sec per worker for LLM calls, before and after the shared gateway.
+
+    python benchmarks/bench_llm_gateway.py --requests 64 --latency 0.3
+
+- before:        one call at a time with a default OpenAI client, which is what a
+                 gunicorn sync worker does
+- after/threads: gthread-style worker, N request threads sharing the gateway
+- after/async:   one thread multiplexing all calls via LLMGateway.complete_many
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai import OpenAI
+from fake_openai import FakeOpenAIServer
+from llm_gateway import LLMGateway
+
+REQUEST = {
+    "model": "gpt-4o-mini",
+    "messages": [{"role": "user", "content": "How to control leaf curl in tomato?"}],
+    "temperature": 0.4,
+}
+
+
+def bench_before(base_url, n):
+    client = OpenAI(api_key="bench", base_url=base_url)
+    start = time.perf_counter()
+    for _ in range(n):
+        client.chat.completions.create(**REQUEST)
+    return n / (time.perf_counter() - start)
+
+
+def bench_threads(gateway, n, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda _: gateway.complete(**REQUEST), range(n)))
+    return n / (time.perf_counter() - start)
+
+
+def bench_async(gateway, n):
+    start = time.perf_counter()
+    results = gateway.complete_many([REQUEST] * n)
+    errors = sum(1 for r in results if isinstance(r, Exception))
+    return n / (time.perf_counter() - start), errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake = FakeOpenAIServer(latency=args.latency, error_rate=args.error_rate).start()
+    gateway = LLMGateway(api_key="bench", base_url=fake.base_url, max_concurrency=args.concurrency)
+
+    serial_n = max(4, args.requests // 8)
+    print(f"Fake upstream latency: {args.latency * 1000:.0f} ms, error rate: {args.error_rate:.0%}")
+    print(f"before (sync worker, {serial_n} calls):       {bench_before(fake.base_url, serial_n):8.1f} req/s")
+    print(f"after  (gthread x{args.threads}, {args.requests} calls):    "
+          f"{bench_threads(gateway, args.requests, args.threads):8.1f} req/s")
+    rps, errors = bench_async(gateway, args.requests)
+    print(f"after  (async multiplex, {args.requests} calls): {rps:8.1f} req/s ({errors} errors)")
+    print(f"gateway stats: {gateway.stats()}")
+    fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+One intrusion alert delivered to many Web Push subscriptions.
+
+    python benchmarks/bench_push_dispatch.py --subscriptions 10000 --latency 0.05
+
+- before: the old trigger_push loop, pywebpush.webpush() per subscription in
+          the request thread (re-parses the VAPID key and re-signs the JWT
+          each time, new connection per send). Timed on --before-sample
+          subscriptions and extrapolated.
+- after:  PushDispatcher, pooled session, cached VAPID headers, worker pool.
+          "handler" is how long /api/intrusion/report now blocks.
+
+Subscriptions point at benchmarks/fake_push.py; 1% of them answer 410 and
+must be pruned.
+"""
+import argparse
+import base64
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from pywebpush import webpush, WebPushException
+
+from fake_push import FakePushServer
+from push_dispatch import PushDispatcher, VAPID_CLAIMS_SUB
+
+PAYLOAD = '{"title": "Animal Intrusion Alert!", "body": "Elephant detected at North field!", "data": {"url": "/world", "alert_id": 1}}'
+
+
+def b64url(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def make_vapid_key():
+    key = ec.generate_private_key(ec.SECP256R1())
+    return b64url(key.private_numbers().private_value.to_bytes(32, "big"))
+
+
+def make_subscriptions(base_url, n):
+    # Browsers each have their own keys; one pair is enough since encryption still runs per send
+    key = ec.generate_private_key(ec.SECP256R1())
+    p256dh = b64url(key.public_key().public_bytes(serialization.Encoding.X962,
+                                                  serialization.PublicFormat.UncompressedPoint))
+    return [{"endpoint": f"{base_url}/push/{i}", "keys": {"p256dh": p256dh, "auth": b64url(os.urandom(16))}}
+            for i in range(n)]
+
+
+def bench_before(subscriptions, private_key):
+    start = time.perf_counter()
+    for subscription in subscriptions:
+        try:
+            webpush(subscription_info=subscription, data=PAYLOAD, vapid_private_key=private_key,
+                    vapid_claims={"sub": VAPID_CLAIMS_SUB})
+        except WebPushException:
+            pass
+    return time.perf_counter() - start
+
+
+def bench_after(subscriptions, private_key, workers):
+    pruned = []
+    lock = threading.Lock()
+
+    def on_gone(subscription):
+        with lock:
+            pruned.append(subscription["endpoint"])
+
+    dispatcher = PushDispatcher(private_key, workers=workers, on_gone=on_gone)
+    start = time.perf_counter()
+    fan_out = dispatcher.dispatch(PAYLOAD, subscriptions)
+    handler = time.perf_counter() - start
+    for future in fan_out.result():
+        future.result()
+    return handler, time.perf_counter() - start, dispatcher.stats(), len(pruned)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subscriptions", type=int, default=10000)
+    parser.add_argument("--before-sample", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05, help="push service response time (s)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[16, 64])
+    args = parser.parse_args()
+
+    server = FakePushServer(latency=args.latency, gone={str(i) for i in range(0, args.subscriptions, 100)}).start()
+    private_key = make_vapid_key()
+    subscriptions = make_subscriptions(server.base_url, args.subscriptions)
+
+    sample = subscriptions[:args.before_sample]
+    elapsed = bench_before(sample, private_key)
+    per_send = elapsed / len(sample)
+    print(f"{args.subscriptions} subscriptions, push service latency {args.latency * 1000:.0f} ms")
+    print(f"before: {per_send * 1000:.1f} ms/send sequential -> ~{per_send * args.subscriptions:.0f} s "
+          f"blocking the report request (sampled {len(sample)})")
+
+    for workers in args.workers:
+        connections = server.connections
+        handler, total, stats, pruned = bench_after(subscriptions, private_key, workers)
+        print(f"after ({workers} workers): handler {handler * 1000:.1f} ms, all delivered in {total:.1f} s "
+              f"({args.subscriptions / total:.0f}/s), sent {stats['sent']}, pruned {pruned}, "
+              f"VAPID signatures {stats['vapid_signed']}, new connections {server.connections - connections}")
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
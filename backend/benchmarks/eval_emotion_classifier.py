@@ -0,0 +1,81 @@
+"""
+Offline evaluation of the local emotion fast path on labeled samples.
+
+    python benchmarks/eval_emotion_classifier.py [--data benchmarks/data/emotion_heldout.jsonl ...]
+
+For each data set and threshold, reports how many texts are answered locally
+(coverage), the escalation rate, and the accuracy of the local answers
+against the labels. Escalated texts go to the LLM, so they do not count
+against accuracy.
+
+emotion_sample.jsonl was written together with the lexicon, so its accuracy
+says little. emotion_heldout.jsonl holds texts written separately, including
+adversarial ones (distress next to calm words, conditionals, weak negation,
+sarcasm). Texts marked "escalate" must never be answered locally, and every
+local answer to one is counted as unsafe.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from emotion_classifier import EmotionClassifier, EMOTION_FASTPATH_THRESHOLD, TAMIL_LABELS
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DEFAULT_DATA = [os.path.join(DATA_DIR, "emotion_sample.jsonl"), os.path.join(DATA_DIR, "emotion_heldout.jsonl")]
+ENGLISH_LABELS = {tamil: english for english, tamil in TAMIL_LABELS.items()}
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(samples, threshold):
+    classifier = EmotionClassifier(threshold=threshold)
+    correct, errors, unsafe = 0, [], []
+    start = time.perf_counter()
+    for sample in samples:
+        result = classifier.classify(sample["text"])
+        if result is None:
+            continue
+        predicted = ENGLISH_LABELS.get(result["emotion"], result["emotion"])
+        if sample.get("escalate"):
+            unsafe.append((sample["text"], sample["label"], predicted))
+        if predicted == sample["label"]:
+            correct += 1
+        else:
+            errors.append((sample["text"], sample["label"], predicted))
+    per_text_us = (time.perf_counter() - start) / len(samples) * 1e6
+    stats = classifier.stats()
+    return stats, correct, errors, unsafe, per_text_us
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", nargs="+", default=DEFAULT_DATA)
+    parser.add_argument("--verbose", action="store_true", help="print misclassified texts")
+    args = parser.parse_args()
+
+    for path in args.data:
+        samples = load(path)
+        print(f"{os.path.basename(path)}: {len(samples)} labeled texts, configured threshold {EMOTION_FASTPATH_THRESHOLD}")
+        print(f"{'threshold':>9} {'coverage':>9} {'escalation':>11} {'local acc':>10} {'unsafe':>7} {'us/text':>8}")
+        for threshold in (0.5, 0.6, 0.7, 0.75, 0.8, 0.9):
+            stats, correct, errors, unsafe, per_text_us = evaluate(samples, threshold)
+            answered = stats["local_answers"]
+            accuracy = correct / answered if answered else 0.0
+            print(f"{threshold:>9.2f} {answered / len(samples):>9.1%} {stats['escalation_rate']:>11.1%} "
+                  f"{accuracy:>10.1%} {len(unsafe):>7} {per_text_us:>8.1f}")
+            if args.verbose:
+                for text, label, predicted in errors:
+                    print(f"    expected {label:<8} got {predicted:<8} {text}")
+                for text, label, predicted in unsafe:
+                    print(f"    UNSAFE ({label}) answered {predicted:<8} {text}")
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Local stand-in for the OpenAI chat completions API, used by the benchmarks.
+
+    python benchmarks/fake_openai.py --port 8089 --latency 0.3
+
+Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:8089/v1.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def default_responder(body):
+    wants_json = (body.get("response_format") or {}).get("type") == "json_object"
+    if wants_json:
+        return json.dumps({
+            "emotion": "Calm", "confidence": "Medium", "evidence": "Benchmark response",
+            "stress_level": "Low", "decision_readiness": "Stable", "confidence_trend": "Stable",
+            "introduction": "Let us look calmly.", "path_now": "Selling now locks today's price.",
+            "path_wait": "Waiting may change the price.", "closing": "The choice is yours."
+        })
+    return "Water the plants early in the morning and check the leaves for spots."
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+class FakeOpenAIServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.3, error_rate=0.0, responder=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.responder = responder or default_responder
+        self.requests = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status, payload, headers=None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                with server._lock:
+                    server.requests += 1
+                time.sleep(server.latency)
+
+                if server.error_rate and random.random() < server.error_rate:
+                    status = random.choice([429, 500, 503])
+                    self._send_json(status, {"error": {"message": "simulated upstream error", "type": "server_error"}},
+                                    {"Retry-After": "0"} if status == 429 else None)
+                    return
+
+                content = server.responder(body)
+                prompt_text = json.dumps(body.get("messages", []), ensure_ascii=False)
+                usage = {"prompt_tokens": estimate_tokens(prompt_text), "completion_tokens": estimate_tokens(content)}
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+                if body.get("stream"):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    for i in range(0, len(content), 8):
+                        chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                                 "model": body.get("model"),
+                                 "choices": [{"index": 0, "delta": {"content": content[i:i + 8]}, "finish_reason": None}]}
+                        self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+                    self._write_chunk("data: [DONE]\n\n")
+                    self._write_chunk("")
+                    return
+
+                self._send_json(200, {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "gpt-4o-mini"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                    "usage": usage
+                })
+
+            def _write_chunk(self, text):
+                data = text.encode("utf-8")
+                self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.base_url = f"http://{host}:{self.port}/v1"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI chat completions server")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    fake = FakeOpenAIServer(port=args.port, latency=args.latency, error_rate=args.error_rate)
+    print(f"Fake OpenAI listening on {fake.base_url}")
+    fake.httpd.serve_forever()
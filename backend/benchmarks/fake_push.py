@@ -0,0 +1,71 @@
+"""
+Local stand-in for a Web Push service (FCM / Mozilla autopush), used by the
+push benchmarks.
+
+    python benchmarks/fake_push.py --port 8091 --latency 0.05
+
+POST /push/<id> answers 201 after `latency` seconds; ids in `gone` answer
+410 like an expired subscription.
+"""
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakePushServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.05, gone=()):
+        self.latency = latency
+        self.gone = set(gone)
+        self.received = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real push services
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with server._lock:
+                    server.received += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                status = 410 if self.path.rsplit("/", 1)[-1] in server.gone else 201
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+        ThreadingHTTPServer.daemon_threads = True
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.base_url = f"http://{host}:{self.server.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8091)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+    server = FakePushServer(port=args.port, latency=args.latency)
+    print(f"Fake push service listening on {server.base_url}")
+    server.server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
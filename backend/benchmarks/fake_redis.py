@@ -0,0 +1,122 @@
+"""
+Local stand-in for Redis pub/sub, used by the alert broker benchmark.
+
+    python benchmarks/fake_redis.py --port 6390
+
+Supports PING, PUBLISH, SUBSCRIBE and UNSUBSCRIBE over RESP, which is all
+RedisBroker needs. Point the app at it with
+ALERT_BROKER=redis ALERT_BROKER_REDIS_URL=redis://127.0.0.1:6390/0.
+"""
+import argparse
+import socketserver
+import threading
+
+
+def encode(value):
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(encode(v) for v in value)
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def read_command(reader):
+    line = reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        return line.strip().split()  # inline command
+    args = []
+    for _ in range(int(line[1:-2])):
+        length = int(reader.readline()[1:-2])
+        args.append(reader.read(length + 2)[:-2])
+    return args
+
+
+class FakeRedisServer:
+    def __init__(self, host="127.0.0.1", port=0):
+        self.channels = {}  # channel -> set of handlers
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def setup(self):
+                super().setup()
+                self.write_lock = threading.Lock()
+
+            def send(self, data):
+                with self.write_lock:
+                    self.wfile.write(data)
+                    self.wfile.flush()
+
+            def handle(self):
+                subscribed = set()
+                try:
+                    while True:
+                        args = read_command(self.rfile)
+                        if args is None:
+                            break
+                        name = args[0].upper()
+                        if name == b"PING":
+                            self.send(b"+PONG\r\n")
+                        elif name == b"PUBLISH":
+                            self.send(encode(server.publish(args[1], args[2])))
+                        elif name == b"SUBSCRIBE":
+                            for channel in args[1:]:
+                                with server._lock:
+                                    server.channels.setdefault(channel, set()).add(self)
+                                subscribed.add(channel)
+                                self.send(encode([b"subscribe", channel, len(subscribed)]))
+                        elif name == b"UNSUBSCRIBE":
+                            for channel in args[1:] or list(subscribed):
+                                with server._lock:
+                                    server.channels.get(channel, set()).discard(self)
+                                subscribed.discard(channel)
+                                self.send(encode([b"unsubscribe", channel, len(subscribed)]))
+                        else:
+                            self.send(b"-ERR unknown command\r\n")
+                except (ConnectionError, OSError):
+                    pass
+                finally:
+                    with server._lock:
+                        for channel in subscribed:
+                            server.channels.get(channel, set()).discard(self)
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"redis://{host}:{self.server.server_address[1]}/0"
+
+    def publish(self, channel, payload):
+        with self._lock:
+            handlers = list(self.channels.get(channel, ()))
+        message = encode([b"message", channel, payload])
+        for handler in handlers:
+            try:
+                handler.send(message)
+            except OSError:
+                pass
+        return len(handlers)
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+    server = FakeRedisServer(port=args.port)
+    print(f"Fake Redis listening on {server.url}")
+    server.server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
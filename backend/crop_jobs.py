@@ -0,0 +1,242 @@
+"""
+Durable job queue for crop image analysis.
+
+`POST /api/analyze-crop-image?mode=async` stores the preprocessed image as a
+job in a SQLite file and returns a job id straight away; a pool of worker
+threads runs the vision call and writes the result back. Clients poll the
+job or subscribe to its SSE stream.
+
+- Durable: queued jobs survive restarts, and jobs left "running" by a dead
+  worker are re-queued once their lease expires.
+- Backpressure: submit() refuses work beyond CROP_JOB_MAX_QUEUE queued jobs
+  (the endpoint answers 503 with a Retry-After estimate).
+- Timing: every job records queue wait and run time, summarized by stats(),
+  which is what the pool size (CROP_JOB_WORKERS) should be tuned against.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+CROP_JOB_DB_PATH = os.getenv("CROP_JOB_DB_PATH") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "instance", "crop_jobs.db")
+CROP_JOB_WORKERS = int(os.getenv("CROP_JOB_WORKERS", "4"))
+CROP_JOB_MAX_QUEUE = int(os.getenv("CROP_JOB_MAX_QUEUE", "100"))
+CROP_JOB_LEASE_SECONDS = int(os.getenv("CROP_JOB_LEASE_SECONDS", "300"))
+CROP_JOB_RETENTION_SECONDS = int(os.getenv("CROP_JOB_RETENTION_SECONDS", "3600"))
+
+FINISHED_STATUSES = ("done", "failed")
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after):
+        super().__init__("Crop analysis queue is full")
+        self.retry_after = retry_after
+
+
+class JobFailed(Exception):
+    """Raised by a processor to fail a job with a specific response body and HTTP status."""
+
+    def __init__(self, body, status=500):
+        super().__init__(body.get("error", "Job failed"))
+        self.body = body
+        self.status = status
+
+
+class CropJobQueue:
+    def __init__(self, processor, path=CROP_JOB_DB_PATH, workers=CROP_JOB_WORKERS,
+                 max_queue=CROP_JOB_MAX_QUEUE, lease_seconds=CROP_JOB_LEASE_SECONDS,
+                 retention_seconds=CROP_JOB_RETENTION_SECONDS, poll_interval=0.5):
+        self.processor = processor
+        self.path = path
+        self.workers = workers
+        self.max_queue = max_queue
+        self.lease_seconds = lease_seconds
+        self.retention_seconds = retention_seconds
+        self.poll_interval = poll_interval
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._local = threading.local()
+        self._wakeup = threading.Condition()
+        self._threads = []
+        self._busy = 0
+        self._busy_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS crop_jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                owner TEXT,
+                image BLOB,
+                mime TEXT,
+                result TEXT,
+                http_status INTEGER,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_crop_jobs_status_created ON crop_jobs (status, created_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    # --- producer side ---
+
+    def queue_depth(self):
+        return self._connect().execute("SELECT COUNT(*) FROM crop_jobs WHERE status = 'queued'").fetchone()[0]
+
+    def submit(self, image, mime="image/jpeg"):
+        depth = self.queue_depth()
+        if depth >= self.max_queue:
+            raise QueueFull(self._retry_after(depth))
+        job_id = uuid.uuid4().hex
+        self._connect().execute(
+            "INSERT INTO crop_jobs (id, status, image, mime, created_at) VALUES (?, 'queued', ?, ?, ?)",
+            (job_id, sqlite3.Binary(image), mime, time.time())
+        )
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def _retry_after(self, depth):
+        stats = self.timing()
+        per_job = (stats["avg_run_ms"] or 5000) / 1000
+        return max(1, int(depth * per_job / max(1, self.workers)))
+
+    def get(self, job_id):
+        row = self._connect().execute(
+            "SELECT id, status, result, http_status, created_at, started_at, finished_at, attempts "
+            "FROM crop_jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = {
+            "job_id": row["id"],
+            "status": row["status"],
+            "attempts": row["attempts"],
+            "timing": {
+                "queue_wait_ms": round(((row["started_at"] or time.time()) - row["created_at"]) * 1000),
+                "run_ms": round((row["finished_at"] - row["started_at"]) * 1000) if row["finished_at"] else None,
+            },
+        }
+        if row["status"] == "queued":
+            job["queue_position"] = self._connect().execute(
+                "SELECT COUNT(*) FROM crop_jobs WHERE status = 'queued' AND created_at <= ?", (row["created_at"],)
+            ).fetchone()[0]
+        if row["status"] in FINISHED_STATUSES:
+            job["result"] = json.loads(row["result"]) if row["result"] else None
+            job["http_status"] = row["http_status"]
+        return job
+
+    # --- worker side ---
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"crop-job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def _claim(self):
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Recover jobs whose worker died mid-run
+            conn.execute(
+                "UPDATE crop_jobs SET status = 'queued', owner = NULL WHERE status = 'running' AND started_at < ?",
+                (now - self.lease_seconds,)
+            )
+            row = conn.execute(
+                "SELECT id, image, mime FROM crop_jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE crop_jobs SET status = 'running', owner = ?, started_at = ?, attempts = attempts + 1 "
+                    "WHERE id = ?", (self.owner, now, row["id"])
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return row
+
+    def _finish(self, job_id, status, body, http_status):
+        # The image is dropped once processed; only the result is kept for polling
+        self._connect().execute(
+            "UPDATE crop_jobs SET status = ?, result = ?, http_status = ?, finished_at = ?, image = NULL "
+            "WHERE id = ? AND owner = ?",
+            (status, json.dumps(body, ensure_ascii=False), http_status, time.time(), job_id, self.owner)
+        )
+
+    def _cleanup(self):
+        self._connect().execute(
+            "DELETE FROM crop_jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+            (time.time() - self.retention_seconds,)
+        )
+
+    def _run(self):
+        last_cleanup = 0
+        while True:
+            try:
+                if time.time() - last_cleanup > 60:
+                    self._cleanup()
+                    last_cleanup = time.time()
+                row = self._claim()
+            except sqlite3.Error as e:
+                print(f"Crop job queue error: {e}")
+                row = None
+            if row is None:
+                # Woken early by submit() in this process; jobs submitted by other
+                # worker processes are picked up on the next poll
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+
+            with self._busy_lock:
+                self._busy += 1
+            try:
+                body = self.processor(bytes(row["image"]), row["mime"])
+                self._finish(row["id"], "done", body, 200)
+            except JobFailed as e:
+                self._finish(row["id"], "failed", e.body, e.status)
+            except Exception as e:
+                print(f"❌ Crop job {row['id']} failed: {e}")
+                self._finish(row["id"], "failed", {"error": str(e)}, 500)
+            finally:
+                with self._busy_lock:
+                    self._busy -= 1
+
+    # --- metrics ---
+
+    def timing(self, window_seconds=3600):
+        row = self._connect().execute(
+            "SELECT COUNT(*), AVG(started_at - created_at), AVG(finished_at - started_at), "
+            "MAX(started_at - created_at) FROM crop_jobs WHERE finished_at >= ?",
+            (time.time() - window_seconds,)
+        ).fetchone()
+        return {
+            "completed_last_hour": row[0],
+            "avg_queue_wait_ms": round(row[1] * 1000) if row[1] is not None else None,
+            "avg_run_ms": round(row[2] * 1000) if row[2] is not None else None,
+            "max_queue_wait_ms": round(row[3] * 1000) if row[3] is not None else None,
+        }
+
+    def stats(self):
+        with self._busy_lock:
+            busy = self._busy
+        stats = {"workers": self.workers, "busy_workers": busy, "queue_depth": self.queue_depth(),
+                 "max_queue": self.max_queue}
+        stats.update(self.timing())
+        return stats
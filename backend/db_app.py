@@ -0,0 +1,20 @@
+"""
+Bare Flask app bound to the same database as app.py, for processes that need
+the models without the API: the facility sync CLI and the ASGI alert stream.
+Importing it does not start LLM clients, brokers or background workers.
+"""
+import os
+
+from flask import Flask
+
+from extensions import db
+
+
+def create_db_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL') or 'sqlite:///farmer_twin.db'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
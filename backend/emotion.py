@@ -0,0 +1,52 @@
+"""
+Shared pieces of the emotion analysis feature: prompt text for a single
+farmer text, result sanitization and the neutral fallbacks. Used by
+/api/analyze-emotion and the batch endpoint.
+"""
+
+VALID_EMOTIONS = ["Happy", "Calm", "Sad", "Angry", "Stressed", "Neutral", "Unclear",
+                  "மகிழ்ச்சி", "அமைதி", "வருத்தம்", "கோபம்", "மன அழுத்தம்", "நடுநிலை", "தெளிவற்ற"]
+
+
+def build_emotion_user_prompt(text):
+    return f"""Analyze the emotional state of this farmer's text. Be honest and evidence-based. Only identify emotions when there is clear evidence.
+
+Farmer's text: "{text}"
+
+Provide your analysis in JSON format following the specified structure."""
+
+
+def sanitize_emotion_analysis(analysis, language="en"):
+    # Validate and sanitize response
+    if not isinstance(analysis, dict):
+        return unparseable_emotion_response(language)
+    if analysis.get("emotion") not in VALID_EMOTIONS:
+        # If emotion is not in valid list, default to Neutral
+        analysis["emotion"] = "Neutral" if language != "ta" else "நடுநிலை"
+        analysis["confidence"] = "Low"
+        analysis["evidence"] = "No clear evidence" if language != "ta" else "தெளிவான சான்று இல்லை"
+    return analysis
+
+
+def unavailable_emotion_response(language="en"):
+    # Fallback response when OpenAI is not available
+    return {
+        "emotion": "Neutral" if language != "ta" else "நடுநிலை",
+        "confidence": "Low",
+        "evidence": "AI service temporarily unavailable" if language != "ta" else "AI சேவை தற்காலிகமாக கிடைக்கவில்லை",
+        "stress_level": "Unclear",
+        "decision_readiness": "Stable",
+        "confidence_trend": "Stable"
+    }
+
+
+def unparseable_emotion_response(language="en"):
+    # If JSON parsing fails, return neutral state
+    return {
+        "emotion": "Neutral" if language != "ta" else "நடுநிலை",
+        "confidence": "Low",
+        "evidence": "Unable to analyze" if language != "ta" else "பகுப்பாய்வு செய்ய முடியவில்லை",
+        "stress_level": "Unclear",
+        "decision_readiness": "Unclear",
+        "confidence_trend": "Unclear"
+    }
@@ -0,0 +1,169 @@
+"""
+Batch emotion analysis backends for /api/analyze-emotion/batch.
+
+A backend takes a list of texts and yields (index, analysis) pairs as soon as
+each result is available, so the endpoint can stream them back:
+
+- "packed":   several texts per structured completion (fewer calls, and the
+              long system prompt is paid once per pack instead of once per text)
+- "per_item": one completion per text, all in flight concurrently
+
+Select with EMOTION_BATCH_BACKEND; register new backends in BACKENDS.
+"""
+import abc
+import json
+import os
+from concurrent.futures import as_completed
+
+from emotion import build_emotion_user_prompt, sanitize_emotion_analysis, unparseable_emotion_response
+
+EMOTION_BATCH_PACK_SIZE = int(os.getenv("EMOTION_BATCH_PACK_SIZE", "20"))
+
+BATCH_INSTRUCTION = """
+
+BATCH MODE:
+You will receive several farmer texts, each with a numeric "id". Analyze each text independently using the rules above - never let one text influence the analysis of another.
+Respond with a single JSON object of this form:
+{"results": [{"id": <id>, "emotion": "...", "confidence": "...", "evidence": "...", "stress_level": "...", "decision_readiness": "...", "confidence_trend": "..."}]}
+Return exactly one result for every id."""
+
+
+def build_batch_user_prompt(items):
+    texts = [{"id": item_id, "text": text} for item_id, text in items]
+    return f"""Analyze the emotional state of each farmer's text below. Be honest and evidence-based. Only identify emotions when there is clear evidence.
+
+Farmer texts (JSON):
+{json.dumps(texts, ensure_ascii=False)}
+
+Provide your analysis in JSON format following the specified batch structure."""
+
+
+class EmotionBatchBackend(abc.ABC):
+    name = "base"
+
+    def __init__(self, llm, system_prompt_fn, model="gpt-4o-mini", temperature=0.3):
+        self.llm = llm
+        self.system_prompt_fn = system_prompt_fn
+        self.model = model
+        self.temperature = temperature
+        self.usage = {"upstream_calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    def _record_usage(self, response):
+        self.usage["upstream_calls"] += 1
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            self.usage["prompt_tokens"] += usage.prompt_tokens or 0
+            self.usage["completion_tokens"] += usage.completion_tokens or 0
+
+    @abc.abstractmethod
+    def analyze(self, texts, language="en"):
+        """Yields (index, analysis) for every text, in completion order."""
+
+
+class PerItemBackend(EmotionBatchBackend):
+    name = "per_item"
+
+    def analyze(self, texts, language="en", indexes=None):
+        system_prompt = self.system_prompt_fn(language)
+        indexes = list(range(len(texts))) if indexes is None else indexes
+        futures = {}
+        for index in indexes:
+            future = self.llm.submit(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": build_emotion_user_prompt(texts[index])}
+                ],
+                temperature=self.temperature,
+                response_format={"type": "json_object"}
+            )
+            futures[future] = index
+
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                response = future.result()
+                self._record_usage(response)
+                analysis = json.loads(response.choices[0].message.content.strip())
+                yield index, sanitize_emotion_analysis(analysis, language)
+            except json.JSONDecodeError:
+                yield index, unparseable_emotion_response(language)
+            except Exception as e:
+                yield index, {"error": f"Error analyzing emotion: {str(e)}"}
+
+
+class PackedCompletionBackend(EmotionBatchBackend):
+    name = "packed"
+
+    def __init__(self, llm, system_prompt_fn, pack_size=EMOTION_BATCH_PACK_SIZE, max_pack_chars=6000, **kwargs):
+        super().__init__(llm, system_prompt_fn, **kwargs)
+        self.pack_size = pack_size
+        self.max_pack_chars = max_pack_chars
+
+    def _packs(self, texts):
+        pack, size = [], 0
+        for index, text in enumerate(texts):
+            if pack and (len(pack) >= self.pack_size or size + len(text) > self.max_pack_chars):
+                yield pack
+                pack, size = [], 0
+            pack.append((index, text))
+            size += len(text)
+        if pack:
+            yield pack
+
+    def analyze(self, texts, language="en"):
+        system_prompt = self.system_prompt_fn(language) + BATCH_INSTRUCTION
+        futures = {}
+        for pack in self._packs(texts):
+            future = self.llm.submit(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": build_batch_user_prompt(pack)}
+                ],
+                temperature=self.temperature,
+                response_format={"type": "json_object"}
+            )
+            futures[future] = pack
+
+        missing = []
+        for future in as_completed(futures):
+            pack = futures[future]
+            try:
+                response = future.result()
+                self._record_usage(response)
+                results = json.loads(response.choices[0].message.content.strip()).get("results", [])
+            except Exception as e:
+                print(f"Packed emotion batch failed, retrying items individually: {e}")
+                missing.extend(index for index, _ in pack)
+                continue
+
+            by_id = {}
+            for result in results if isinstance(results, list) else []:
+                if isinstance(result, dict) and isinstance(result.get("id"), int):
+                    by_id[result.pop("id")] = result
+            for index, _ in pack:
+                if index in by_id:
+                    yield index, sanitize_emotion_analysis(by_id[index], language)
+                else:
+                    missing.append(index)
+
+        # Items the model dropped from its packed answer get a dedicated call
+        if missing:
+            fallback = PerItemBackend(self.llm, self.system_prompt_fn, model=self.model, temperature=self.temperature)
+            yield from fallback.analyze(texts, language, indexes=missing)
+            for key, value in fallback.usage.items():
+                self.usage[key] += value
+
+
+BACKENDS = {
+    PackedCompletionBackend.name: PackedCompletionBackend,
+    PerItemBackend.name: PerItemBackend,
+}
+
+
+def create_backend(name, llm, system_prompt_fn, **kwargs):
+    backend_cls = BACKENDS.get(name)
+    if backend_cls is None:
+        raise ValueError(f"Unknown emotion batch backend: {name}")
+    return backend_cls(llm, system_prompt_fn, **kwargs)
@@ -0,0 +1,209 @@
+"""
+Local first-stage emotion classifier.
+
+A small weighted lexicon (English + Tamil) covering the categories used by
+the emotion analysis prompt. Clear-cut texts like "I am happy" or "crop is
+fine today" are answered locally in microseconds; anything ambiguous (no
+cue words, mixed signals, negation, questions, long texts) is escalated to
+the LLM. Texts with any sign of distress or self-harm, and conditional or
+weakly negated sentences ("I would be happy if...", "hardly happy"), always
+go to the LLM whatever their score: a keyword lexicon reads "kill myself,
+everything is fine now" as Calm.
+
+    python emotion_classifier.py "I am worried about the loan"
+"""
+import os
+import re
+import sys
+import threading
+
+EMOTION_FASTPATH_ENABLED = os.getenv("EMOTION_FASTPATH", "1") == "1"
+EMOTION_FASTPATH_THRESHOLD = float(os.getenv("EMOTION_FASTPATH_THRESHOLD", "0.75"))
+
+# term -> weight. Strong, unambiguous cues weigh 2, moderate ones 1.5, weak ones 1.
+LEXICON = {
+    "Happy": {
+        "happy": 2, "glad": 2, "joy": 2, "joyful": 2, "delighted": 2, "excited": 1.5, "great": 1,
+        "wonderful": 2, "satisfied": 1.5, "good harvest": 2, "bumper": 2, "thankful": 1.5, "grateful": 1.5,
+        "மகிழ்ச்சி": 2, "சந்தோஷ": 2, "சந்தோச": 2, "ஆனந்த": 2, "நல்ல விளைச்சல்": 2, "திருப்தி": 1.5,
+    },
+    "Calm": {
+        "fine": 1.5, "okay": 1.5, "ok": 1, "alright": 1.5, "normal": 1.5, "calm": 2, "peaceful": 2,
+        "relaxed": 2, "steady": 1, "stable": 1, "as usual": 1.5, "no problem": 1.5,
+        "அமைதி": 2, "நன்றாக": 1.5, "சரியாக": 1.5, "பரவாயில்லை": 1.5, "நலமாக": 1.5, "வழக்கம் போல": 1.5,
+    },
+    "Sad": {
+        "sad": 2, "unhappy": 2, "heartbroken": 2, "crying": 2, "cry": 1.5, "depressed": 1.5, "lost": 1,
+        "loss": 1.5, "destroyed": 1.5, "ruined": 1.5, "disappointed": 2, "hopeless": 2, "miserable": 2,
+        "வருத்த": 2, "சோக": 2, "அழுகிறேன்": 2, "இழப்பு": 1.5, "நஷ்ட": 1.5, "ஏமாற்றம்": 1.5, "நம்பிக்கையில்லை": 2,
+    },
+    "Angry": {
+        "angry": 2, "furious": 2, "annoyed": 2, "irritated": 2, "frustrated": 1.5, "cheated": 2, "fed up": 2,
+        "outraged": 2, "hate": 1.5, "unfair": 1.5,
+        "கோப": 2, "எரிச்சல்": 2, "ஏமாற்றி": 2, "அநியாய": 1.5,
+    },
+    "Stressed": {
+        "worried": 2, "worry": 2, "anxious": 2, "stressed": 2, "stress": 2, "tension": 2, "tense": 2,
+        "afraid": 1.5, "scared": 1.5, "fear": 1.5, "pressure": 1.5, "debt": 1.5, "loan": 1, "can't sleep": 2,
+        "panic": 2, "nervous": 2, "concerned": 1.5,
+        "கவலை": 2, "பயம்": 1.5, "பதற்ற": 2, "மன அழுத்த": 2, "கடன்": 1.5, "டென்ஷன்": 2,
+    },
+}
+
+TAMIL_LABELS = {
+    "Happy": "மகிழ்ச்சி", "Calm": "அமைதி", "Sad": "வருத்தம்", "Angry": "கோபம்", "Stressed": "மன அழுத்தம்",
+}
+
+NEGATORS = {"not", "no", "never", "don't", "dont", "didn't", "isn't", "wasn't", "aren't", "can't", "cannot", "nothing"}
+TAMIL_NEGATORS = ("இல்லை", "இல்ல", "அல்ல")
+INTENSIFIERS = {"very", "so", "really", "extremely", "too", "மிகவும்", "ரொம்ப"}
+
+# Always escalated, whatever the lexicon score: the LLM prompt has a
+# "Possible emotional distress" category that the fast path cannot produce
+DISTRESS_CUES = (
+    "kill myself", "killing myself", "end my life", "ending my life", "end it all", "take my life",
+    "take my own life", "want to live", "nothing matters", "goodbye", "rest forever", "suicide", "suicidal", "want to die",
+    "wanna die", "wish i was dead", "wish i were dead", "better off dead", "no reason to live",
+    "not worth living", "tired of living", "tired of life", "tired of all this", "can't go on", "cannot go on",
+    "give up on life", "no way out", "no one cares", "nobody cares", "no one will miss", "nobody will miss",
+    "hang myself", "drink pesticide", "drink poison", "drinking pesticide", "consume poison", "take poison",
+    "hopeless", "worthless", "i am a burden", "i'm a burden", "can't take it anymore", "cannot take it anymore",
+    "தற்கொலை", "சாக வேண்டும்", "சாகப் போகிறேன்", "செத்துவிட", "உயிரை விட", "வாழ விருப்பமில்லை",
+    "வாழ பிடிக்கவில்லை", "யாருக்கும் அக்கறை இல்லை", "பூச்சிக்கொல்லி குடி", "விஷம் குடி",
+    "आत्महत्या", "मरना चाहता", "मरना चाहती", "जीना नहीं",
+)
+# Conditionals and weak negation flip or hedge the cue word next to them
+HEDGES = {"would", "i'd", "we'd", "if", "unless", "wish", "hardly", "barely", "scarcely", "seldom", "rarely", "almost"}
+TAMIL_HEDGES = ("என்றால்", "னால்", "ந்தால்", "ாவிட்டால்")
+
+MAX_FASTPATH_WORDS = 40
+_TOKEN_RE = re.compile(r"[\w']+", re.UNICODE)
+
+
+class EmotionClassifier:
+    def __init__(self, lexicon=LEXICON, threshold=EMOTION_FASTPATH_THRESHOLD):
+        self.threshold = threshold
+        # Multi-word and Tamil (agglutinative) terms are matched as substrings,
+        # single English words as whole tokens
+        self._token_terms = {}
+        self._substring_terms = []
+        for emotion, terms in lexicon.items():
+            for term, weight in terms.items():
+                if " " in term or not term.isascii():
+                    self._substring_terms.append((term, emotion, weight))
+                else:
+                    self._token_terms[term] = (emotion, weight)
+        self._lock = threading.Lock()
+        self.local_answers = 0
+        self.escalations = 0
+        self.forced_escalations = 0
+
+    @staticmethod
+    def must_escalate(text):
+        """True for texts the fast path must never answer: distress cues, conditionals, weak negation."""
+        lowered = text.casefold().replace("’", "'")
+        if any(cue in lowered for cue in DISTRESS_CUES):
+            return True
+        if any(token in HEDGES for token in _TOKEN_RE.findall(lowered)):
+            return True
+        return any(hedge in lowered for hedge in TAMIL_HEDGES)
+
+    def score(self, text):
+        """Returns (scores by emotion, confidence in [0, 1], matched terms)."""
+        lowered = text.casefold()
+        tokens = _TOKEN_RE.findall(lowered)
+        scores = {}
+        matched = []
+        negated = False
+
+        for i, token in enumerate(tokens):
+            entry = self._token_terms.get(token)
+            if entry is None:
+                continue
+            emotion, weight = entry
+            window = tokens[max(0, i - 3):i]
+            if any(w in NEGATORS for w in window):
+                negated = True
+                continue
+            if window and window[-1] in INTENSIFIERS:
+                weight *= 1.5
+            scores[emotion] = scores.get(emotion, 0) + weight
+            matched.append(token)
+
+        for term, emotion, weight in self._substring_terms:
+            if term in lowered:
+                scores[emotion] = scores.get(emotion, 0) + weight
+                matched.append(term)
+
+        if any(neg in lowered for neg in TAMIL_NEGATORS):
+            negated = True
+
+        if not scores:
+            return scores, 0.0, matched
+
+        ranked = sorted(scores.values(), reverse=True)
+        top = ranked[0]
+        second = ranked[1] if len(ranked) > 1 else 0.0
+        confidence = min(1.0, top / 2) * (top - second) / top
+        # Negation, questions and long texts are where keyword scoring goes wrong
+        if negated:
+            confidence *= 0.5
+        if "?" in text:
+            confidence *= 0.7
+        if len(tokens) > MAX_FASTPATH_WORDS:
+            confidence *= 0.6
+        return scores, confidence, matched
+
+    def classify(self, text, language="en"):
+        """
+        Returns an analysis dict (same shape as the LLM response) when the text
+        is confidently classifiable, otherwise None to escalate to the LLM.
+        """
+        if self.must_escalate(text or ""):
+            with self._lock:
+                self.escalations += 1
+                self.forced_escalations += 1
+            return None
+
+        scores, confidence, matched = self.score(text or "")
+        if not scores or confidence < self.threshold:
+            with self._lock:
+                self.escalations += 1
+            return None
+
+        with self._lock:
+            self.local_answers += 1
+        emotion = max(scores, key=scores.get)
+        positive = emotion in ("Happy", "Calm")
+        cues = ", ".join(f"'{term}'" for term in dict.fromkeys(matched))
+
+        if emotion == "Stressed":
+            stress_level = "High" if scores[emotion] >= 3 else "Moderate"
+        else:
+            stress_level = "Low" if positive else "Unclear"
+
+        return {
+            "emotion": TAMIL_LABELS[emotion] if language == "ta" else emotion,
+            "confidence": "High" if confidence >= 0.9 else "Medium",
+            "evidence": f"முக்கிய சொற்கள்: {cues}" if language == "ta" else f"The farmer used the words {cues}",
+            "stress_level": stress_level,
+            "decision_readiness": "Stable" if positive else "Needs Caution",
+            "confidence_trend": "Unclear"
+        }
+
+    def stats(self):
+        with self._lock:
+            total = self.local_answers + self.escalations
+            return {
+                "threshold": self.threshold,
+                "local_answers": self.local_answers,
+                "escalations": self.escalations,
+                "forced_escalations": self.forced_escalations,
+                "escalation_rate": round(self.escalations / total, 4) if total else 0.0,
+            }
+
+
+if __name__ == "__main__":
+    classifier = EmotionClassifier()
+    for arg in sys.argv[1:]:
+        print(arg, "->", classifier.score(arg)[1], classifier.classify(arg))
@@ -0,0 +1,50 @@
+"""
+Deterministic availability model for cold-storage facilities.
+
+There is no real-time booking feed, so availability is simulated - but it
+must be the same in every gunicorn worker and for every request within a
+time window, otherwise search results cannot be cached or compared. All
+randomness here is seeded from a stable SHA-256 of the facility key and the
+current window (never Python's per-process salted hash() or the global
+random module):
+
+- whether a facility takes bookings at all is fixed per facility (~70%)
+- how much capacity is free changes once per AVAILABILITY_WINDOW_SECONDS
+"""
+import datetime
+import hashlib
+import os
+import random
+import time
+
+AVAILABILITY_WINDOW_SECONDS = int(os.getenv("AVAILABILITY_WINDOW_SECONDS", "900"))
+
+
+def stable_hash(*parts):
+    """64-bit hash of the parts that is identical across processes and restarts."""
+    digest = hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def seeded_random(*parts):
+    return random.Random(stable_hash(*parts))
+
+
+def current_window(now=None, window_seconds=AVAILABILITY_WINDOW_SECONDS):
+    return int((time.time() if now is None else now) // window_seconds)
+
+
+def window_bounds(window, window_seconds=AVAILABILITY_WINDOW_SECONDS):
+    """(start, end) of the window as UTC datetimes."""
+    start = datetime.datetime.fromtimestamp(window * window_seconds, tz=datetime.timezone.utc)
+    return start, start + datetime.timedelta(seconds=window_seconds)
+
+
+def availability(facility_key, total_capacity, window=None):
+    """Returns (is_available, available_capacity) for the facility in the given window."""
+    is_available = stable_hash("open", facility_key) % 10 > 2 # 70% of facilities take bookings
+    if not is_available:
+        return False, 0
+    window = current_window() if window is None else window
+    free_share = seeded_random("free", facility_key, window).uniform(0.10, 0.40)
+    return True, int(round(total_capacity * free_share / 50) * 50)
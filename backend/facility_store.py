@@ -0,0 +1,194 @@
+"""
+In-memory spatial index over the local cold-storage facility store.
+
+Facilities synced by facility_sync.py are loaded from the database into
+geohash buckets (precision 4, roughly 39 x 20 km cells). A radius query
+only measures distances (one vectorized pass, see geo_distance.py) to
+facilities in the cells overlapping the search circle's bounding box; k-nearest widens the radius until it has k results.
+
+Searches are answered from the index when every 1x1 degree sync tile under
+the search circle has been synced; otherwise the caller falls back to live
+Overpass and, with FACILITY_SYNC_ON_MISS, the missing tiles are synced in
+the background so the next search there is local. Tiles whose last sync
+is older than FACILITY_TILE_TTL_DAYS are still answered locally and
+re-synced in the background.
+"""
+import os
+import queue
+import threading
+import time
+
+from sqlalchemy import func
+
+from models import ColdStorageFacility, FacilitySyncTile
+import geohash
+from geo_distance import within_radius, NUMPY_AVAILABLE
+if NUMPY_AVAILABLE:
+    import numpy as np
+from facility_sync import sync_tile, tile_expired, tiles_for_bbox
+
+FACILITY_INDEX_ENABLED = os.getenv("FACILITY_INDEX", "1") == "1"
+FACILITY_INDEX_REFRESH_SECONDS = int(os.getenv("FACILITY_INDEX_REFRESH_SECONDS", "60"))
+FACILITY_SYNC_ON_MISS = os.getenv("FACILITY_SYNC_ON_MISS", "1") == "1"
+INDEX_PRECISION = 4
+SYNC_RETRY_SECONDS = 600
+
+
+class FacilityIndex:
+    def __init__(self, facilities=(), precision=INDEX_PRECISION):
+        self.precision = precision
+        # Facilities sorted by cell so each cell is one contiguous slice of the coordinate arrays
+        cells = [geohash.encode(f["lat"], f["lon"], precision) for f in facilities]
+        order = sorted(range(len(cells)), key=cells.__getitem__)
+        self.facilities = [facilities[i] for i in order]
+        self._slices = {}
+        for position, i in enumerate(order):
+            start, _ = self._slices.get(cells[i], (position, position))
+            self._slices[cells[i]] = (start, position + 1)
+        lats = [f["lat"] for f in self.facilities]
+        lons = [f["lon"] for f in self.facilities]
+        self._lats = np.array(lats, dtype=np.float64) if NUMPY_AVAILABLE else lats
+        self._lons = np.array(lons, dtype=np.float64) if NUMPY_AVAILABLE else lons
+        self.size = len(self.facilities)
+
+    def _candidates(self, lat, lon, radius_km):
+        cells = geohash.cells_for_bbox(*geohash.bbox_around(lat, lon, radius_km), precision=self.precision)
+        ranges = [self._slices[cell] for cell in cells if cell in self._slices]
+        if NUMPY_AVAILABLE:
+            if not ranges:
+                return np.empty(0, dtype=np.intp)
+            return np.concatenate([np.arange(start, end) for start, end in ranges])
+        return [i for start, end in ranges for i in range(start, end)]
+
+    def radius(self, lat, lon, radius_km, limit=None):
+        """[(facility, distance_km)] within radius_km, nearest first."""
+        candidates = self._candidates(lat, lon, radius_km)
+        if not len(candidates):
+            return []
+        if NUMPY_AVAILABLE:
+            lats, lons = self._lats[candidates], self._lons[candidates]
+        else:
+            lats = [self._lats[i] for i in candidates]
+            lons = [self._lons[i] for i in candidates]
+        hits, distances = within_radius(lat, lon, radius_km, lats, lons)
+        if limit:
+            hits, distances = hits[:limit], distances[:limit]
+        return [(self.facilities[candidates[h]], float(d)) for h, d in zip(hits, distances)]
+
+    def nearest(self, lat, lon, k=10, max_km=200):
+        radius_km = 10.0
+        while True:
+            results = self.radius(lat, lon, min(radius_km, max_km))
+            # Anything beyond the searched radius could be closer than a result
+            # outside it, so only stop once k results sit inside the circle
+            if len(results) >= k or radius_km >= max_km:
+                return results[:k]
+            radius_km *= 2
+
+
+class FacilityStore:
+    def __init__(self, app, refresh_seconds=FACILITY_INDEX_REFRESH_SECONDS, sync_on_miss=FACILITY_SYNC_ON_MISS):
+        self.app = app
+        self.refresh_seconds = refresh_seconds
+        self.sync_on_miss = sync_on_miss
+        self.index = FacilityIndex()
+        self.tiles = {}  # tile -> synced_at
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._sync_queue = queue.Queue()
+        self._pending = set()
+        self._failed = {}  # tile -> time of the last failed sync
+        self._sync_thread = None
+        self.hits = 0
+        self.misses = 0
+
+    def refresh(self, force=False):
+        """Reload the index when the facility table or tile list changed. Needs an app context."""
+        if not force and time.time() - self._checked_at < self.refresh_seconds:
+            return
+        with self._lock:
+            if not force and time.time() - self._checked_at < self.refresh_seconds:
+                return
+            self._checked_at = time.time()
+            count, latest = ColdStorageFacility.query.with_entities(
+                func.count(ColdStorageFacility.id), func.max(ColdStorageFacility.updated_at)).one()
+            tile_count, tile_latest = FacilitySyncTile.query.with_entities(
+                func.count(FacilitySyncTile.id), func.max(FacilitySyncTile.synced_at)).one()
+            version = (count, latest, tile_count, tile_latest)
+            if version == self._version:
+                return
+            started = time.time()
+            rows = ColdStorageFacility.query.with_entities(
+                ColdStorageFacility.osm_id, ColdStorageFacility.name,
+                ColdStorageFacility.lat, ColdStorageFacility.lon).all()
+            facilities = [{"osm_id": r.osm_id, "name": r.name, "lat": r.lat, "lon": r.lon} for r in rows]
+            self.index = FacilityIndex(facilities)
+            self.tiles = dict(FacilitySyncTile.query.with_entities(FacilitySyncTile.tile, FacilitySyncTile.synced_at))
+            self._version = version
+            print(f"Facility index loaded: {len(facilities)} facilities, {len(self.tiles)} tiles "
+                  f"in {(time.time() - started) * 1000:.0f} ms")
+
+    def missing_tiles(self, lat, lon, radius_km):
+        return tiles_for_bbox(*geohash.bbox_around(lat, lon, radius_km)) - self.tiles.keys()
+
+    def search(self, lat, lon, radius_km):
+        """[(facility, distance_km)] from the local index, or None if the area is not synced yet."""
+        self.refresh()
+        missing = self.missing_tiles(lat, lon, radius_km)
+        if missing:
+            self.misses += 1
+            if self.sync_on_miss:
+                self.request_sync(missing)
+            return None
+        self.hits += 1
+        if self.sync_on_miss:
+            expired = [t for t in tiles_for_bbox(*geohash.bbox_around(lat, lon, radius_km))
+                       if tile_expired(self.tiles[t])]
+            if expired:
+                self.request_sync(expired)
+        return self.index.radius(lat, lon, radius_km)
+
+    # --- background sync of tiles searched but not yet covered ---
+
+    def request_sync(self, tiles):
+        with self._lock:
+            now = time.time()
+            new = [t for t in tiles if t not in self._pending
+                   and now - self._failed.get(t, 0) > SYNC_RETRY_SECONDS]
+            self._pending.update(new)
+            if self._sync_thread is None:
+                self._sync_thread = threading.Thread(target=self._sync_loop, name="facility-sync", daemon=True)
+                self._sync_thread.start()
+        for tile in new:
+            self._sync_queue.put(tile)
+
+    def _sync_loop(self):
+        while True:
+            tile = self._sync_queue.get()
+            try:
+                with self.app.app_context():
+                    row = FacilitySyncTile.query.filter_by(tile=tile).first()
+                    if row is None or tile_expired(row.synced_at):  # another worker may have synced it already
+                        count = sync_tile(tile)
+                        print(f"Synced facility tile {tile}: {count} facilities")
+                    self.refresh(force=True)
+            except Exception as e:
+                print(f"Facility tile sync failed for {tile}: {e}")
+                with self._lock:
+                    self._failed[tile] = time.time()
+            finally:
+                with self._lock:
+                    self._pending.discard(tile)
+            time.sleep(1.0)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "facilities": self.index.size,
+            "tiles": len(self.tiles),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "pending_syncs": len(self._pending),
+        }
@@ -0,0 +1,307 @@
+"""
+Sync cold-storage facilities from OpenStreetMap into the local facility store.
+
+The store is split into 1x1 degree tiles. Syncing a tile fetches every
+cold storage / warehouse in it from Overpass, upserts them into
+cold_storage_facilities, deletes ones that disappeared, and marks the tile
+as covered so searches inside it are answered from the local index.
+
+Overpass answers 200 with a `remark` when a query timed out or ran out of
+memory, and the elements are then partial or empty. Such a result is
+treated as a failed sync: nothing is replaced and the tile is not marked.
+Tiles older than FACILITY_TILE_TTL_DAYS are synced again, in the
+background when searched and with --stale from a scheduled job.
+
+    python facility_sync.py --bbox 8.0,76.0,13.6,80.4            # Tamil Nadu
+    python facility_sync.py --around 11.0168,76.9558 --radius 100
+    python facility_sync.py --geojson facilities.geojson [--bbox ...]
+    python facility_sync.py --stale                              # re-sync expired tiles
+    python facility_sync.py --status
+"""
+import argparse
+import datetime
+import json
+import math
+import os
+import sys
+import time
+
+import requests
+
+from db_app import create_db_app
+from extensions import db
+from models import ColdStorageFacility, FacilitySyncTile
+import geohash
+
+OVERPASS_URL = os.getenv("OVERPASS_URL", "https://overpass-api.de/api/interpreter")
+OVERPASS_TIMEOUT = int(os.getenv("OVERPASS_TIMEOUT", "90"))
+FACILITY_TILE_TTL_DAYS = float(os.getenv("FACILITY_TILE_TTL_DAYS", "30"))
+TILE_DEGREES = 1
+FACILITY_GEOHASH_PRECISION = 7
+
+
+class OverpassError(Exception):
+    pass
+
+
+def tile_key(lat, lon):
+    return f"{math.floor(lat)}:{math.floor(lon)}"
+
+
+def tile_bbox(key):
+    lat, lon = (int(part) for part in key.split(":"))
+    return lat, lon, lat + TILE_DEGREES, lon + TILE_DEGREES
+
+
+def tiles_for_bbox(south, west, north, east):
+    return {
+        f"{lat}:{lon}"
+        for lat in range(math.floor(south), math.floor(north) + 1)
+        for lon in range(math.floor(west), math.floor(east) + 1)
+    }
+
+
+def overpass_query(south, west, north, east, timeout=OVERPASS_TIMEOUT):
+    box = f"{south},{west},{north},{east}"
+    return f"""
+    [out:json][timeout:{timeout}];
+    (
+      node["industrial"="cold_storage"]({box});
+      way["industrial"="cold_storage"]({box});
+      node["amenity"="warehouse"]({box});
+      way["amenity"="warehouse"]({box});
+    );
+    out center;
+    """
+
+
+def parse_overpass(elements):
+    facilities = []
+    for element in elements:
+        lat = element.get('lat') or element.get('center', {}).get('lat')
+        lon = element.get('lon') or element.get('center', {}).get('lon')
+        if lat is None or lon is None:
+            continue
+        tags = element.get('tags', {})
+        facilities.append({
+            "osm_id": f"{element.get('type', 'node')}/{element['id']}",
+            "name": tags.get('name'),
+            "lat": float(lat),
+            "lon": float(lon),
+            "tags": tags,
+        })
+    return facilities
+
+
+def parse_geojson(data):
+    facilities = []
+    for i, feature in enumerate(data.get("features", [])):
+        geometry = feature.get("geometry") or {}
+        props = feature.get("properties") or {}
+        coords = geometry.get("coordinates")
+        if geometry.get("type") == "Point":
+            lon, lat = coords[:2]
+        elif geometry.get("type") == "Polygon" and coords:
+            ring = coords[0]
+            lon = sum(p[0] for p in ring) / len(ring)
+            lat = sum(p[1] for p in ring) / len(ring)
+        else:
+            continue
+        osm_id = props.get("@id") or feature.get("id") or props.get("id") or f"geojson/{i}"
+        facilities.append({
+            "osm_id": str(osm_id)[:32],
+            "name": props.get("name"),
+            "lat": float(lat),
+            "lon": float(lon),
+            "tags": {k: v for k, v in props.items() if isinstance(v, (str, int, float))},
+        })
+    return facilities
+
+
+def fetch_bbox(south, west, north, east):
+    response = requests.post(
+        OVERPASS_URL,
+        data={'data': overpass_query(south, west, north, east)},
+        headers={'User-Agent': 'FarmerDigitalTwin/1.0'},
+        timeout=OVERPASS_TIMEOUT + 30
+    )
+    response.raise_for_status()
+    data = response.json()
+    if data.get('remark'):
+        # Timeout or out-of-memory: the elements are incomplete, do not let them replace the tile
+        raise OverpassError(f"incomplete Overpass result: {data['remark']}")
+    return parse_overpass(data.get('elements', []))
+
+
+def upsert_facilities(facilities, source, replace_bbox=None):
+    """
+    Insert or update facilities by osm_id. With replace_bbox, facilities of the
+    same source inside the box that are no longer present are deleted.
+    """
+    now = datetime.datetime.utcnow()
+    by_id = {f["osm_id"]: f for f in facilities}
+    existing = {}
+    ids = list(by_id)
+    for start in range(0, len(ids), 500):
+        for row in ColdStorageFacility.query.filter(ColdStorageFacility.osm_id.in_(ids[start:start + 500])):
+            existing[row.osm_id] = row
+
+    for osm_id, facility in by_id.items():
+        row = existing.get(osm_id)
+        if row is None:
+            row = ColdStorageFacility(osm_id=osm_id)
+            db.session.add(row)
+        row.name = facility["name"]
+        row.lat = facility["lat"]
+        row.lon = facility["lon"]
+        row.geohash = geohash.encode(facility["lat"], facility["lon"], FACILITY_GEOHASH_PRECISION)
+        row.tags = json.dumps(facility["tags"], ensure_ascii=False)
+        row.source = source
+        row.updated_at = now
+
+    removed = 0
+    if replace_bbox is not None:
+        south, west, north, east = replace_bbox
+        stale = ColdStorageFacility.query.filter(
+            ColdStorageFacility.source == source,
+            ColdStorageFacility.lat >= south, ColdStorageFacility.lat < north,
+            ColdStorageFacility.lon >= west, ColdStorageFacility.lon < east,
+            ColdStorageFacility.updated_at < now
+        )
+        for row in stale:
+            db.session.delete(row)
+            removed += 1
+    db.session.commit()
+    return len(by_id), removed
+
+
+def mark_tiles(tiles, counts=None):
+    now = datetime.datetime.utcnow()
+    for key in tiles:
+        row = FacilitySyncTile.query.filter_by(tile=key).first()
+        if row is None:
+            row = FacilitySyncTile(tile=key)
+            db.session.add(row)
+        row.synced_at = now
+        row.facility_count = (counts or {}).get(key, 0)
+    db.session.commit()
+
+
+def tile_expired(synced_at, now=None):
+    if synced_at is None:
+        return True
+    now = now or datetime.datetime.utcnow()
+    return now - synced_at > datetime.timedelta(days=FACILITY_TILE_TTL_DAYS)
+
+
+def stale_tiles():
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=FACILITY_TILE_TTL_DAYS)
+    return [row.tile for row in FacilitySyncTile.query.filter(
+        db.or_(FacilitySyncTile.synced_at < cutoff, FacilitySyncTile.synced_at.is_(None))
+    ).order_by(FacilitySyncTile.synced_at)]
+
+
+def sync_tiles(tiles, pause=1.0):
+    tiles = sorted(tiles)
+    total = 0
+    for i, key in enumerate(tiles):
+        started = time.time()
+        try:
+            count = sync_tile(key)
+        except Exception as e:
+            db.session.rollback()
+            print(f"[{i + 1}/{len(tiles)}] tile {key}: failed ({e})")
+            continue
+        total += count
+        print(f"[{i + 1}/{len(tiles)}] tile {key}: {count} facilities in {time.time() - started:.1f}s")
+        time.sleep(pause)  # be polite to the public Overpass instance
+    return total
+
+
+def sync_tile(key):
+    """Fetch one tile from Overpass and mark it covered. Returns the facility count."""
+    south, west, north, east = tile_bbox(key)
+    facilities = fetch_bbox(south, west, north, east)
+    # Overpass bboxes are inclusive; keep each facility in exactly one tile
+    facilities = [f for f in facilities if tile_key(f["lat"], f["lon"]) == key]
+    upsert_facilities(facilities, "overpass", replace_bbox=(south, west, north, east))
+    mark_tiles([key], {key: len(facilities)})
+    return len(facilities)
+
+
+def sync_bbox(south, west, north, east, pause=1.0):
+    return sync_tiles(tiles_for_bbox(south, west, north, east), pause)
+
+
+def _floats(text, count):
+    values = [float(v) for v in text.split(",")]
+    if len(values) != count:
+        raise argparse.ArgumentTypeError(f"expected {count} comma-separated numbers")
+    return values
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sync cold-storage facilities into the local store")
+    parser.add_argument("--bbox", type=lambda s: _floats(s, 4), help="south,west,north,east")
+    parser.add_argument("--around", type=lambda s: _floats(s, 2), help="lat,lon")
+    parser.add_argument("--radius", type=float, default=100.0, help="km, with --around")
+    parser.add_argument("--geojson", help="import facilities from a GeoJSON file instead of Overpass")
+    parser.add_argument("--stale", action="store_true",
+                        help=f"re-sync tiles older than FACILITY_TILE_TTL_DAYS ({FACILITY_TILE_TTL_DAYS:g})")
+    parser.add_argument("--status", action="store_true", help="show synced tiles and facility count")
+    args = parser.parse_args(argv)
+
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+
+    app = create_db_app()
+    with app.app_context():
+        if args.status:
+            tiles = FacilitySyncTile.query.order_by(FacilitySyncTile.tile).all()
+            for tile in tiles:
+                print(f"{tile.tile:>10}  {tile.facility_count:6d} facilities  synced {tile.synced_at:%Y-%m-%d %H:%M}")
+            print(f"{len(tiles)} tiles, {ColdStorageFacility.query.count()} facilities")
+            return 0
+
+        if args.stale:
+            tiles = stale_tiles()
+            print(f"{len(tiles)} tiles older than {FACILITY_TILE_TTL_DAYS:g} days")
+            print(f"Synced {sync_tiles(tiles)} facilities")
+            return 0
+
+        bbox = args.bbox
+        if args.around:
+            bbox = geohash.bbox_around(args.around[0], args.around[1], args.radius)
+
+        if args.geojson:
+            with open(args.geojson, encoding="utf-8") as f:
+                facilities = parse_geojson(json.load(f))
+            if bbox:
+                facilities = [f for f in facilities if bbox[0] <= f["lat"] < bbox[2] and bbox[1] <= f["lon"] < bbox[3]]
+            count, _ = upsert_facilities(facilities, "geojson")
+            print(f"Imported {count} facilities from {args.geojson}")
+            if bbox:
+                # Only tiles entirely inside the extract's box are known to be complete
+                tiles = [t for t in tiles_for_bbox(*bbox)
+                         if tile_bbox(t)[0] >= bbox[0] and tile_bbox(t)[1] >= bbox[1]
+                         and tile_bbox(t)[2] <= bbox[2] and tile_bbox(t)[3] <= bbox[3]]
+                counts = {}
+                for facility in facilities:
+                    key = tile_key(facility["lat"], facility["lon"])
+                    counts[key] = counts.get(key, 0) + 1
+                mark_tiles(tiles, counts)
+                print(f"Marked {len(tiles)} tiles as covered")
+            return 0
+
+        if not bbox:
+            parser.error("one of --bbox, --around, --geojson, --stale or --status is required")
+        total = sync_bbox(*bbox)
+        print(f"Synced {total} facilities")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+Distances and ranking for cold-storage search.
+
+One haversine implementation for the whole search path. Candidate sets are
+handled as NumPy arrays: a cheap bounding-box mask drops far-away points,
+exact haversine runs once over the survivors, and top-k selection uses
+argpartition (O(n)) before sorting only the k winners. Without NumPy the
+same functions fall back to plain Python.
+"""
+import math
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    print("Warning: numpy not available. Facility distances will be computed in pure Python.")
+
+from geohash import bbox_around
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def haversine_many(lat, lon, lats, lons):
+    """Distances in km from (lat, lon) to every point of the lats/lons arrays."""
+    if not NUMPY_AVAILABLE:
+        return [haversine_km(lat, lon, a, b) for a, b in zip(lats, lons)]
+    lat1 = math.radians(lat)
+    lat2 = np.radians(lats)
+    dlat = lat2 - lat1
+    dlon = np.radians(lons) - math.radians(lon)
+    a = np.sin(dlat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def bbox_mask(lat, lon, radius_km, lats, lons):
+    """Boolean mask of points inside the box around the search circle (a superset of the circle)."""
+    south, west, north, east = bbox_around(lat, lon, radius_km)
+    if not NUMPY_AVAILABLE:
+        return [south <= a <= north and west <= b <= east for a, b in zip(lats, lons)]
+    return (lats >= south) & (lats <= north) & (lons >= west) & (lons <= east)
+
+
+def within_radius(lat, lon, radius_km, lats, lons):
+    """(indices, distances) of the points within radius_km, nearest first."""
+    if not NUMPY_AVAILABLE:
+        mask = bbox_mask(lat, lon, radius_km, lats, lons)
+        hits = [(i, haversine_km(lat, lon, lats[i], lons[i])) for i, keep in enumerate(mask) if keep]
+        hits = sorted((h for h in hits if h[1] <= radius_km), key=lambda h: h[1])
+        return [i for i, _ in hits], [d for _, d in hits]
+    candidates = np.flatnonzero(bbox_mask(lat, lon, radius_km, lats, lons))
+    distances = haversine_many(lat, lon, lats[candidates], lons[candidates])
+    inside = distances <= radius_km
+    candidates, distances = candidates[inside], distances[inside]
+    order = np.argsort(distances, kind="stable")
+    return candidates[order], distances[order]
+
+
+def top_k(keys, k):
+    """Indices of the k smallest keys in ascending order; none for k <= 0."""
+    n = len(keys)
+    if k is not None and k <= 0:
+        return np.array([], dtype=np.intp) if NUMPY_AVAILABLE else []
+    if k is None or k >= n:
+        if not NUMPY_AVAILABLE:
+            return sorted(range(n), key=keys.__getitem__)
+        return np.argsort(keys, kind="stable")
+    if not NUMPY_AVAILABLE:
+        return sorted(range(n), key=keys.__getitem__)[:k]
+    keys = np.asarray(keys)
+    part = np.argpartition(keys, k - 1)[:k]
+    return part[np.argsort(keys[part], kind="stable")]
+
+
+def ranking_key(available, distance_km, cost_per_kg):
+    """
+    Single sortable number equivalent to the tuple (not available, distance, cost):
+    availability dominates, then distance at 10 m resolution, then cost.
+    """
+    return (0.0 if available else 1e9) + round(distance_km * 100) + min(cost_per_kg, 9.99) / 10
+
+
+def rank_facilities(facilities, k=None):
+    """Facilities ordered by availability, distance, then price; only the best k when k is given."""
+    keys = [ranking_key(f['status'] == 'Available', f['distance'], f['costPerKg']) for f in facilities]
+    if NUMPY_AVAILABLE:
+        keys = np.array(keys, dtype=np.float64)
+    return [facilities[i] for i in top_k(keys, k)]
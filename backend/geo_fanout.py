@@ -0,0 +1,104 @@
+"""
+Geo-targeting for intrusion alerts.
+
+A subscriber (SSE connection or push subscription) may register a farm
+location and radius; an alert with coordinates then only goes to subscribers
+whose farm is within their radius of the alert. Subscribers without a
+location keep receiving every alert.
+
+GeoSubscriberIndex puts each subscriber in every geohash cell its circle
+touches, so matching an alert is one dict lookup for the alert's cell plus
+an exact distance check on the few subscribers found there - the cost
+follows the number of nearby farms, not the total number of subscribers.
+"""
+import os
+from collections import defaultdict
+
+from geo_distance import haversine_km
+from geohash import encode, bbox_around, cells_for_bbox
+
+AREA_PRECISION = 4 # cells of ~39 x 20 km
+ALERT_DEFAULT_RADIUS_KM = float(os.getenv("ALERT_DEFAULT_RADIUS_KM", "10"))
+ALERT_MAX_RADIUS_KM = float(os.getenv("ALERT_MAX_RADIUS_KM", "50"))
+
+
+def parse_farm_location(data):
+    """
+    (lat, lon, radius_km) from a dict with lat/lon and optional radius_km, or
+    None when no coordinates are given. Raises ValueError for bad values.
+    """
+    if not data or data.get("lat") in (None, "") or data.get("lon") in (None, ""):
+        return None
+    try:
+        lat, lon = float(data["lat"]), float(data["lon"])
+        radius = float(data.get("radius_km") or ALERT_DEFAULT_RADIUS_KM)
+    except (TypeError, ValueError):
+        raise ValueError("location needs numeric lat, lon and radius_km")
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError("location is out of range")
+    return lat, lon, min(max(radius, 0.5), ALERT_MAX_RADIUS_KM)
+
+
+def alert_point(event):
+    """(lat, lon) of an alert's location, or None for alerts without coordinates."""
+    location = (event or {}).get("location")
+    if not isinstance(location, dict):
+        return None
+    try:
+        return float(location["lat"]), float(location["lon"])
+    except (TypeError, KeyError, ValueError):
+        return None
+
+
+def in_range(event, farm):
+    """Whether a subscriber with farm (lat, lon, radius_km) or None should get the alert."""
+    point = alert_point(event)
+    if farm is None or point is None:
+        return True
+    return haversine_km(point[0], point[1], farm[0], farm[1]) <= farm[2]
+
+
+def area_cells(lat, lon, radius_km=ALERT_MAX_RADIUS_KM, precision=AREA_PRECISION):
+    """Geohash cells a circle of radius_km around (lat, lon) touches."""
+    return cells_for_bbox(*bbox_around(lat, lon, radius_km), precision=precision)
+
+
+class GeoSubscriberIndex:
+    """Subscribers by the geohash cells their alert radius covers. Not thread-safe."""
+
+    def __init__(self, precision=AREA_PRECISION):
+        self.precision = precision
+        self._cells = defaultdict(dict) # cell -> {key: (lat, lon, radius_km)}
+        self._members = {} # key -> cells
+
+    def add(self, key, lat, lon, radius_km):
+        self.remove(key)
+        cells = area_cells(lat, lon, radius_km, self.precision)
+        for cell in cells:
+            self._cells[cell][key] = (lat, lon, radius_km)
+        self._members[key] = cells
+
+    def remove(self, key):
+        for cell in self._members.pop(key, ()):
+            bucket = self._cells.get(cell)
+            if bucket is not None:
+                bucket.pop(key, None)
+                if not bucket:
+                    del self._cells[cell]
+
+    def match(self, lat, lon):
+        """Keys of subscribers whose farm is within their radius of (lat, lon)."""
+        bucket = self._cells.get(encode(lat, lon, self.precision))
+        if not bucket:
+            return []
+        return [key for key, (farm_lat, farm_lon, radius) in bucket.items()
+                if haversine_km(lat, lon, farm_lat, farm_lon) <= radius]
+
+    def keys(self):
+        return list(self._members)
+
+    def __len__(self):
+        return len(self._members)
+
+    def __contains__(self, key):
+        return key in self._members
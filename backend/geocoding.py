@@ -0,0 +1,225 @@
+"""
+Geocoding for cold-storage search.
+
+Farmers search the same few hundred villages, taluks and districts over and
+over, so a place name is resolved in this order and only goes to Nominatim
+on a miss:
+
+1. in-process TTL cache
+2. bundled gazetteer of Indian districts and taluks (data/india_gazetteer.csv)
+3. geocode_cache table in the app database (shared by all workers)
+4. Nominatim, throttled to its 1 request/second policy, with a timeout
+
+Network results (including "not found") are written back to the database
+with a TTL.
+"""
+import csv
+import datetime
+import os
+import re
+import threading
+import time
+import unicodedata
+
+import requests
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import GeocodeCache
+from response_cache import TTLCache
+
+GEOCODE_GAZETTEER_ENABLED = os.getenv("GEOCODE_GAZETTEER", "1") == "1"
+GEOCODE_GAZETTEER_PATH = os.getenv("GEOCODE_GAZETTEER_PATH") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "data", "india_gazetteer.csv")
+GEOCODE_TTL_DAYS = int(os.getenv("GEOCODE_TTL_DAYS", "90"))
+GEOCODE_NEGATIVE_TTL_HOURS = int(os.getenv("GEOCODE_NEGATIVE_TTL_HOURS", "24"))
+NOMINATIM_URL = os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")
+NOMINATIM_TIMEOUT = float(os.getenv("NOMINATIM_TIMEOUT", "5"))
+NOMINATIM_MIN_INTERVAL = 1.0
+
+_PUNCT_RE = re.compile(r"[^\w\s,]", re.UNICODE)
+_SPACE_RE = re.compile(r"\s+")
+# Administrative words people append to place names ("Salem district", "Attur tk")
+GENERIC_WORDS = {"district", "dist", "dt", "taluk", "taluka", "tk", "tehsil", "city", "town", "block",
+                 "mandal", "மாவட்டம்", "வட்டம்", "நகரம்"}
+COUNTRY_WORDS = {"india", "இந்தியா"}
+
+
+def normalize_place(query):
+    """'  Salem Dist., Tamil Nadu, INDIA ' -> 'salem dist, tamil nadu'"""
+    text = unicodedata.normalize("NFKC", str(query or "")).casefold()
+    text = _PUNCT_RE.sub(" ", text)
+    parts = [_SPACE_RE.sub(" ", part).strip() for part in text.split(",")]
+    parts = [part for part in parts if part and part not in COUNTRY_WORDS]
+    return ", ".join(parts)
+
+
+def _strip_generic(name):
+    words = [w for w in name.split(" ") if w not in GENERIC_WORDS]
+    return " ".join(words)
+
+
+class Gazetteer:
+    """In-memory name -> coordinates index over a CSV of name,kind,state,lat,lon,aliases."""
+
+    def __init__(self, path=GEOCODE_GAZETTEER_PATH):
+        self._index = {}
+        self.states = set()
+        with open(path, encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                entry = {
+                    "name": row["name"],
+                    "kind": row["kind"],
+                    "state": row["state"],
+                    "lat": float(row["lat"]),
+                    "lon": float(row["lon"]),
+                }
+                self.states.add(normalize_place(row["state"]))
+                names = [row["name"]] + [a for a in (row.get("aliases") or "").split("|") if a]
+                for name in names:
+                    self._index.setdefault(normalize_place(name), []).append(entry)
+
+    def __len__(self):
+        return len(self._index)
+
+    def lookup(self, normalized):
+        parts = normalized.split(", ") if normalized else []
+        if not parts:
+            return None
+        name = _strip_generic(parts[0])
+        hints = [p for p in parts[1:] if p]
+        if not hints:
+            # "coimbatore tamil nadu" without a comma
+            for state in self.states:
+                if name.endswith(" " + state):
+                    name, hints = name[:-len(state) - 1], [state]
+                    break
+
+        candidates = self._index.get(name)
+        if not candidates:
+            return None
+        state_hints = [h for h in hints if h in self.states]
+        if state_hints:
+            candidates = [c for c in candidates if normalize_place(c["state"]) in state_hints]
+            if not candidates:
+                # Same name in another state (e.g. "Salem, Oregon"): let the network decide
+                return None
+        elif hints:
+            # Extra qualifiers we cannot check locally (village, street): not our answer
+            return None
+        # Prefer districts over taluks sharing a name
+        return sorted(candidates, key=lambda c: c["kind"] != "district")[0]
+
+
+class Geocoder:
+    def __init__(self, gazetteer=None, ttl_days=GEOCODE_TTL_DAYS, negative_ttl_hours=GEOCODE_NEGATIVE_TTL_HOURS,
+                 timeout=NOMINATIM_TIMEOUT):
+        self.gazetteer = gazetteer
+        self.ttl = datetime.timedelta(days=ttl_days)
+        self.negative_ttl = datetime.timedelta(hours=negative_ttl_hours)
+        self.timeout = timeout
+        self._memory = TTLCache(maxsize=2048, ttl=3600)
+        self._network_lock = threading.Lock()
+        self._last_network_call = 0.0
+        self._stats_lock = threading.Lock()
+        self.counts = {"memory": 0, "gazetteer": 0, "database": 0, "nominatim": 0, "not_found": 0}
+
+    def _count(self, source):
+        with self._stats_lock:
+            self.counts[source] += 1
+
+    def geocode(self, query):
+        """Returns {"lat", "lon", "name", "source"} or None when the place cannot be resolved."""
+        key = normalize_place(query)
+        if not key:
+            return None
+
+        cached = self._memory.get(key)
+        if cached is not None:
+            self._count("memory")
+            return dict(cached, source="memory") if cached["lat"] is not None else None
+
+        if self.gazetteer is not None:
+            entry = self.gazetteer.lookup(key)
+            if entry is not None:
+                place = {"lat": entry["lat"], "lon": entry["lon"],
+                         "name": f"{entry['name']}, {entry['state']}", "source": "gazetteer"}
+                self._memory.set(key, place)
+                self._count("gazetteer")
+                return place
+
+        row = GeocodeCache.query.filter_by(normalized_query=key).first()
+        if row is not None:
+            ttl = self.ttl if row.lat is not None else self.negative_ttl
+            if row.created_at and datetime.datetime.utcnow() - row.created_at < ttl:
+                place = {"lat": row.lat, "lon": row.lon, "name": row.display_name, "source": "database"}
+                self._memory.set(key, place)
+                self._count("database")
+                return place if row.lat is not None else None
+
+        try:
+            place = self._nominatim(query)
+        except Exception as e:
+            # Network trouble is not cached: the next request tries again
+            print(f"Geocoding error: {e}")
+            return None
+
+        self._store(key, row, place)
+        self._memory.set(key, place or {"lat": None, "lon": None, "name": None, "source": "nominatim"})
+        self._count("nominatim" if place else "not_found")
+        return place
+
+    def _nominatim(self, query):
+        # Nominatim's usage policy allows at most one request per second
+        with self._network_lock:
+            wait = NOMINATIM_MIN_INTERVAL - (time.monotonic() - self._last_network_call)
+            if wait > 0:
+                time.sleep(wait)
+            self._last_network_call = time.monotonic()
+            response = requests.get(
+                NOMINATIM_URL,
+                params={"q": query, "format": "json", "limit": 1},
+                headers={"User-Agent": "FarmerDigitalTwin/1.0"},
+                timeout=self.timeout
+            )
+        response.raise_for_status()
+        results = response.json()
+        if not results:
+            return None
+        return {"lat": float(results[0]["lat"]), "lon": float(results[0]["lon"]),
+                "name": results[0].get("display_name", "")[:255], "source": "nominatim"}
+
+    def _store(self, key, row, place):
+        try:
+            if row is None:
+                row = GeocodeCache(normalized_query=key, source="nominatim")
+                db.session.add(row)
+            row.lat = place["lat"] if place else None
+            row.lon = place["lon"] if place else None
+            row.display_name = place["name"] if place else None
+            row.created_at = datetime.datetime.utcnow()
+            db.session.commit()
+        except IntegrityError:
+            # Another worker cached the same place first
+            db.session.rollback()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Geocode cache write failed: {e}")
+
+    def stats(self):
+        with self._stats_lock:
+            counts = dict(self.counts)
+        total = sum(counts.values())
+        counts["network_rate"] = round((counts["nominatim"] + counts["not_found"]) / total, 4) if total else 0.0
+        counts["gazetteer_places"] = len(self.gazetteer) if self.gazetteer is not None else 0
+        return counts
+
+
+def create_geocoder():
+    gazetteer = None
+    if GEOCODE_GAZETTEER_ENABLED and os.path.exists(GEOCODE_GAZETTEER_PATH):
+        try:
+            gazetteer = Gazetteer(GEOCODE_GAZETTEER_PATH)
+        except Exception as e:
+            print(f"Warning: gazetteer not loaded: {e}")
+    return Geocoder(gazetteer=gazetteer)
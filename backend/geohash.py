@@ -0,0 +1,95 @@
+"""
+Minimal geohash encoding used to bucket points by area.
+
+A geohash of precision p names a lat/lon cell; points in nearby cells share
+prefixes. Cell sizes near the equator: p=4 ~39 x 20 km, p=5 ~4.9 x 4.9 km,
+p=6 ~1.2 x 0.6 km.
+"""
+import math
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE = {c: i for i, c in enumerate(BASE32)}
+EARTH_RADIUS_KM = 6371.0
+
+
+def encode(lat, lon, precision=5):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True  # bits alternate lon, lat, lon, ...
+    while len(chars) < precision:
+        rng, coord = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if coord >= mid:
+            value = (value << 1) | 1
+            rng[0] = mid
+        else:
+            value <<= 1
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+
+def bounds(geohash):
+    """Returns (south, west, north, east) of the cell."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = _DECODE[char]
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if (value >> shift) & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def cell_size(precision):
+    """(lat height, lon width) in degrees of a cell at this precision."""
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def cells_for_bbox(south, west, north, east, precision=5):
+    """All cells at this precision intersecting the box."""
+    lat_step, lon_step = cell_size(precision)
+    south, north = max(south, -90.0), min(north, 90.0)
+    cells = set()
+    lat = math.floor(south / lat_step) * lat_step + lat_step / 2
+    while lat - lat_step / 2 <= north:
+        lon = math.floor(west / lon_step) * lon_step + lon_step / 2
+        while lon - lon_step / 2 <= east:
+            wrapped = (lon + 180.0) % 360.0 - 180.0
+            cells.add(encode(min(lat, 89.999999), wrapped, precision))
+            lon += lon_step
+        lat += lat_step
+    return cells
+
+
+def bbox_around(lat, lon, radius_km):
+    """(south, west, north, east) of the smallest box containing the circle of radius_km."""
+    angular = radius_km / EARTH_RADIUS_KM
+    dlat = math.degrees(angular)
+    cos_lat = math.cos(math.radians(lat))
+    if angular >= math.pi / 2 or _sin_ratio(angular, cos_lat) >= 1:
+        dlon = 180.0
+    else:
+        # The circle is widest in longitude slightly poleward of its centre
+        dlon = math.degrees(math.asin(_sin_ratio(angular, cos_lat)))
+    return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+
+def _sin_ratio(angular, cos_lat):
+    return math.sin(angular) / cos_lat if cos_lat > 1e-12 else float("inf")
@@ -1,169 +1,261 @@
-from flask import Flask, request, jsonify
+"""
+Crop image diagnosis, mounted into app.py as the `crop_bp` blueprint.
+
+Uploads are streamed with a size cap (upload_stream.py), preprocessed
+(image_preprocess.py), looked up in the perceptual-hash cache
+(image_cache.py) and sent to the vision model through the shared LLM
+gateway, either inline or via the durable job queue (crop_jobs.py).
+"""
+from flask import Blueprint, request, jsonify, Response
 import base64
-import requests
-import os
-
-# Try to import optional dependencies
-try:
-    from flask_cors import CORS
-    CORS_AVAILABLE = True
-except ImportError:
-    CORS_AVAILABLE = False
-    print("Warning: flask-cors not available. CORS may not work properly.")
-
-try:
-    from dotenv import load_dotenv
-    load_dotenv()
-    DOTENV_AVAILABLE = True
-except ImportError:
-    DOTENV_AVAILABLE = False
-    print("Warning: python-dotenv not available. Using environment variables only.")
-
-app = Flask(__name__)
-if CORS_AVAILABLE:
-    CORS(app)
-else:
-    print("Warning: CORS not enabled due to missing flask-cors library")
-
-# OpenAI API Configuration
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-VISION_API_ENDPOINT = 'https://api.openai.com/v1/chat/completions'
-
-@app.route('/api/analyze-crop-image', methods=['POST'])
-def analyze_crop_image():
+import json
+import time
+
+from llm_gateway import get_gateway
+from prompt_registry import registry as prompt_registry
+from image_preprocess import preprocess_image, sniff_mime, UnsupportedImageError, VISION_DETAIL
+from image_cache import ImageDiagnosisCache, dhash_bytes, IMAGE_CACHE_ENABLED, PIL_AVAILABLE as PHASH_AVAILABLE
+from crop_jobs import CropJobQueue, JobFailed, QueueFull, CROP_JOB_WORKERS, FINISHED_STATUSES
+from upload_stream import read_upload, UploadTooLarge
+
+crop_bp = Blueprint('crop_analysis', __name__)
+
+# Shared LLM gateway (pooled connections, deadlines, bounded concurrency, retries)
+llm = get_gateway()
+
+# Perceptual-hash cache of diagnoses (near-duplicate re-uploads skip the vision call)
+diagnosis_cache = None
+if IMAGE_CACHE_ENABLED and PHASH_AVAILABLE:
+    try:
+        diagnosis_cache = ImageDiagnosisCache()
+    except Exception as e:
+        print(f"Warning: image diagnosis cache disabled: {e}")
+
+def add_cache_headers(response, status, distance=None):
+    response.headers['X-Image-Cache'] = status
+    if distance is not None:
+        response.headers['X-Image-Cache-Distance'] = str(distance)
+    if diagnosis_cache:
+        stats = diagnosis_cache.stats()
+        response.headers['X-Image-Cache-Hit-Rate'] = str(stats['hit_rate'])
+        response.headers['X-Image-Cache-Hits'] = str(stats['hits'])
+        response.headers['X-Image-Cache-Misses'] = str(stats['misses'])
+    return response
+
+def diagnose_image(image_data, mime="image/jpeg"):
     """
-    Real AI-powered crop disease detection using OpenAI Vision API.
-    Switching to gpt-4o-mini for better cost efficiency and quota management.
+    Diagnose a preprocessed image (cache first, then the vision model).
+    Returns (body, cache_status, distance); raises JobFailed with the error body and HTTP status.
     """
-    try:
-        # Get the uploaded image
-        if 'image' not in request.files:
-            return jsonify({'error': 'No image provided'}), 400
-        
-        image_file = request.files['image']
-        
-        # Read and encode image to base64
-        image_data = image_file.read()
-        base64_image = base64.b64encode(image_data).decode('utf-8')
-        
-        # System Prompt for Real Agricultural Analysis (Enhanced for Cures)
-        system_prompt = """You are an expert agricultural pathologist and plant disease specialist with years of field experience.
-
-Analyze this crop image using your expertise in:
-- Plant pathology and disease identification
-- Pest and insect damage patterns
-- Nutrient deficiency symptoms
-- Environmental stress indicators
-
-Provide a REAL, SCIENTIFIC analysis based on what you actually see in the image.
-
-MANDATORY RESPONSE SECTIONS:
-
-1. **Disease/Issue Identification**: What specific disease, pest, or problem do you see? Be specific.
-2. **Visual Evidence**: Describe the visual symptoms you observe (leaf spots, discoloration, wilting, etc.)
-3. **Severity Assessment**: Rate the severity (Mild/Moderate/Severe) and explain why
-4. **Cure & Treatment (Step-by-Step)**: THIS IS THE MOST IMPORTANT SECTION.
-   - **Immediate Action**: What to do RIGHT NOW (e.g., isolate plant, prune leaves).
-   - **Organic Solution**: Home remedies, neem oil, bio-fungicides, or natural predators.
-   - **Chemical Solution**: Specific chemical names (e.g., "Copper Oxychloride", "Imidacloprid") if severe, with safety warnings.
-5. **Prevention Tips**: How to prevent this in the future
-6. **Recovery Time**: Estimated time for recovery.
-
-Be honest - if the image quality is poor or you cannot make a definitive diagnosis, say so.
-Format your response as JSON with these keys: disease_name, visual_symptoms, severity, confidence_level, treatment, prevention, explanation. The 'treatment' field should contain the detailed step-by-step cure info."""
-
-        # Call OpenAI Vision API for REAL analysis
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {OPENAI_API_KEY}'
-        }
-        
-        payload = {
-            "model": "gpt-4o-mini", # 15x cheaper than gpt-4o, supports vision
-            "messages": [
+    image_hash = dhash_bytes(image_data) if diagnosis_cache else None
+    if image_hash is not None:
+        cached_analysis, distance = diagnosis_cache.lookup(image_hash)
+        if cached_analysis is not None:
+            print(f"♻️ Diagnosis cache hit (distance {distance})")
+            return {
+                'success': True,
+                'analysis': cached_analysis,
+                'note': 'This is a REAL AI analysis using gpt-4o-mini (cached result for a matching photo).'
+            }, 'HIT', distance
+
+    # System Prompt for Real Agricultural Analysis (Enhanced for Cures)
+    system_prompt = prompt_registry.text("crop_image")
+
+    if not llm:
+        raise JobFailed({'error': 'AI service not configured (OPENAI_API_KEY missing)'}, 503)
+
+    # Call OpenAI Vision API for REAL analysis
+    messages = [
+        {
+            "role": "system",
+            "content": system_prompt
+        },
+        {
+            "role": "user",
+            "content": [
                 {
-                    "role": "system",
-                    "content": system_prompt
+                    "type": "text",
+                    "text": "Analyze this crop image and provide a detailed diagnosis."
                 },
                 {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "Analyze this crop image and provide a detailed diagnosis."
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:{mime};base64,{base64.b64encode(image_data).decode('ascii')}",
+                        "detail": VISION_DETAIL
+                    }
                 }
-            ],
-            "max_tokens": 1000,
-            "temperature": 0.3
+            ]
         }
+    ]
+    
+    print(f"📡 Sending request to OpenAI (Model: gpt-4o-mini)...")
+    try:
+        response = llm.complete(
+            model="gpt-4o-mini", # 15x cheaper than gpt-4o, supports vision
+            messages=messages,
+            max_tokens=1000,
+            temperature=0.3
+        )
+    except Exception as api_error:
+        error_msg = str(api_error)
+        print(f"❌ OpenAI API Error: {error_msg}")
         
-        print(f"📡 Sending request to OpenAI (Model: gpt-4o-mini)...")
-        response = requests.post(VISION_API_ENDPOINT, headers=headers, json=payload)
-        response_data = response.json()
-        
-        if 'error' in response_data:
-            error_msg = response_data['error']['message']
-            print(f"❌ OpenAI API Error: {error_msg}")
+        # Special handling for quota issues
+        if "quota" in error_msg.lower():
+            raise JobFailed({
+                'error': 'OpenAI Quota Exceeded. Please check your billing or try a different key.',
+                'details': error_msg
+            }, 429)
             
-            # Special handling for quota issues
-            if "quota" in error_msg.lower():
-                return jsonify({
-                    'error': 'OpenAI Quota Exceeded. Please check your billing or try a different key.',
-                    'details': error_msg
-                }), 429
-                
-            return jsonify({'error': error_msg}), 500
-        
-        # Extract the AI's analysis
-        analysis_text = response_data['choices'][0]['message']['content']
+        raise JobFailed({'error': error_msg}, 500)
+    
+    # Extract the AI's analysis
+    analysis_text = response.choices[0].message.content
+    
+    # Try to parse as JSON, otherwise return as text
+    try:
+        # Remove markdown code blocks if present
+        if '```json' in analysis_text:
+            analysis_text = analysis_text.split('```json')[1].split('```')[0].strip()
+        elif '```' in analysis_text:
+            analysis_text = analysis_text.split('```')[1].split('```')[0].strip()
         
-        # Try to parse as JSON, otherwise return as text
+        analysis_json = json.loads(analysis_text)
+        if image_hash is not None:
+            diagnosis_cache.store(image_hash, analysis_json)
+    except:
+        # If JSON parsing fails, structure the text response
+        analysis_json = {
+            'disease_name': 'Analysis Complete',
+            'visual_symptoms': analysis_text,
+            'severity': 'See analysis',
+            'confidence_level': 'High',
+            'treatment': 'See detailed analysis',
+            'prevention': 'See detailed analysis',
+            'explanation': analysis_text
+        }
+    
+    print(f"✅ Analysis successful: {analysis_json.get('disease_name', 'Complete')}")
+    return {
+        'success': True,
+        'analysis': analysis_json,
+        'note': 'This is a REAL AI analysis using gpt-4o-mini.'
+    }, 'MISS' if image_hash is not None else 'BYPASS', None
+
+def run_crop_job(image_data, mime):
+    body, _, _ = diagnose_image(image_data, mime)
+    return body
+
+# Durable job queue for async submissions (POST ...?mode=async)
+crop_jobs = CropJobQueue(run_crop_job).start() if CROP_JOB_WORKERS > 0 else None
+
+def wants_async(fields):
+    return (request.args.get('mode') == 'async' or fields.get('mode') == 'async'
+            or 'respond-async' in request.headers.get('Prefer', ''))
+
+def check_image_head(head):
+    if sniff_mime(head) is None:
+        raise UnsupportedImageError("Unsupported image format. Please upload a JPEG, PNG, WebP or GIF photo.")
+
+@crop_bp.route('/api/analyze-crop-image', methods=['POST'])
+def analyze_crop_image():
+    """
+    Real AI-powered crop disease detection using OpenAI Vision API.
+    Switching to gpt-4o-mini for better cost efficiency and quota management.
+    With ?mode=async (or Prefer: respond-async) a job id is returned immediately.
+    """
+    try:
+        # Stream the multipart body with a size cap; the file part is rejected
+        # on its first bytes if it is not an image
+        started = time.time()
         try:
-            import json
-            # Remove markdown code blocks if present
-            if '```json' in analysis_text:
-                analysis_text = analysis_text.split('```json')[1].split('```')[0].strip()
-            elif '```' in analysis_text:
-                analysis_text = analysis_text.split('```')[1].split('```')[0].strip()
-            
-            analysis_json = json.loads(analysis_text)
-        except:
-            # If JSON parsing fails, structure the text response
-            analysis_json = {
-                'disease_name': 'Analysis Complete',
-                'visual_symptoms': analysis_text,
-                'severity': 'See analysis',
-                'confidence_level': 'High',
-                'treatment': 'See detailed analysis',
-                'prevention': 'See detailed analysis',
-                'explanation': analysis_text
-            }
+            upload = read_upload(request, field='image', check_head=check_image_head)
+        except UploadTooLarge as e:
+            return jsonify({'error': str(e)}), 413
+        except UnsupportedImageError as e:
+            return jsonify({'error': str(e)}), 415
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if upload.file is None:
+            return jsonify({'error': 'No image provided'}), 400
+
+        # Sniff format, strip EXIF, auto-orient and downsize to what the vision model uses
+        try:
+            prepared = preprocess_image(upload.file)
+        except UnsupportedImageError as e:
+            return jsonify({'error': str(e)}), 415
+        finally:
+            upload.close()
+        print(f"🖼️ Preprocessed image: {prepared.original_bytes} -> {len(prepared.data)} bytes "
+              f"({prepared.width}x{prepared.height}) in {(time.time() - started) * 1000:.0f} ms")
+
+        if wants_async(upload.fields) and crop_jobs:
+            try:
+                job_id = crop_jobs.submit(prepared.data, prepared.mime)
+            except QueueFull as e:
+                response = jsonify({'error': 'Too many images are being analyzed right now. Please retry shortly.',
+                                    'retry_after': e.retry_after})
+                response.status_code = 503
+                response.headers['Retry-After'] = str(e.retry_after)
+                return response
+            response = jsonify({
+                'job_id': job_id,
+                'status': 'queued',
+                'status_url': f"/api/analyze-crop-image/jobs/{job_id}",
+                'events_url': f"/api/analyze-crop-image/jobs/{job_id}/events"
+            })
+            response.status_code = 202
+            response.headers['Location'] = f"/api/analyze-crop-image/jobs/{job_id}"
+            return response
         
-        print(f"✅ Analysis successful: {analysis_json.get('disease_name', 'Complete')}")
-        return jsonify({
-            'success': True,
-            'analysis': analysis_json,
-            'note': 'This is a REAL AI analysis using gpt-4o-mini.'
-        })
+        try:
+            body, cache_status, distance = diagnose_image(prepared.data, prepared.mime)
+        except JobFailed as e:
+            return jsonify(e.body), e.status
+
+        response = jsonify(body)
+        response.headers['X-Image-Original-Bytes'] = str(prepared.original_bytes)
+        response.headers['X-Image-Sent-Bytes'] = str(len(prepared.data))
+        return add_cache_headers(response, cache_status, distance)
         
     except Exception as e:
         print(f"❌ Unexpected Error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/health', methods=['GET'])
-def health_check():
-    return jsonify({'status': 'healthy', 'service': 'AI Crop Image Analysis'})
+@crop_bp.route('/api/analyze-crop-image/jobs/<job_id>', methods=['GET'])
+def get_crop_job(job_id):
+    job = crop_jobs.get(job_id) if crop_jobs else None
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@crop_bp.route('/api/analyze-crop-image/jobs/<job_id>/events')
+def stream_crop_job(job_id):
+    if not crop_jobs or not crop_jobs.get(job_id):
+        return jsonify({'error': 'Job not found'}), 404
+
+    def job_stream():
+        last_status = None
+        last_sent = time.time()
+        while True:
+            job = crop_jobs.get(job_id)
+            if job is None:
+                yield f"event: error\ndata: {json.dumps({'error': 'Job not found'})}\n\n"
+                return
+            if job['status'] != last_status:
+                last_status = job['status']
+                last_sent = time.time()
+                yield f"event: status\ndata: {json.dumps(job, ensure_ascii=False)}\n\n"
+                if last_status in FINISHED_STATUSES:
+                    return
+            elif time.time() - last_sent > 15:
+                last_sent = time.time()
+                yield ": keep-alive\n\n"
+            time.sleep(0.5)
+
+    return Response(job_stream(), mimetype="text/event-stream")
 
-if __name__ == '__main__':
-    print("Starting Real AI Crop Image Analysis Service...")
-    print("Using gpt-4o-mini for efficient VISION analysis")
-    print("Not fake detection - actual computer vision analysis")
-    app.run(debug=True, port=5001, host='0.0.0.0')
+@crop_bp.route('/api/analyze-crop-image/jobs/stats', methods=['GET'])
+def crop_job_stats():
+    return jsonify(crop_jobs.stats() if crop_jobs else {'workers': 0})
@@ -0,0 +1,214 @@
+"""
+Perceptual-hash cache for crop image diagnoses.
+
+Re-uploads of the same leaf photo (retries, forwarded WhatsApp copies) are
+rarely byte-identical but have nearly identical perceptual hashes. Each
+diagnosis is stored under the 64-bit dHash of the preprocessed image; a
+lookup returns the stored analysis for any entry within a small Hamming
+distance.
+
+Near neighbours are found with a multi-index: the hash is split into 8
+bands of 8 bits and any hash within distance 7 shares at least one band
+exactly (pigeonhole), so only entries in matching band buckets are compared.
+
+Entries live in a SQLite file (survives restarts, shared by all workers on
+the host) with TTL and a size bound (least recently used entries are
+evicted). Each process keeps only the hashes in memory and picks up rows
+written by other workers incrementally.
+"""
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+IMAGE_CACHE_ENABLED = os.getenv("IMAGE_CACHE", "1") == "1"
+IMAGE_CACHE_PATH = os.getenv("IMAGE_CACHE_PATH") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "instance", "image_cache.db")
+IMAGE_CACHE_TTL = int(os.getenv("IMAGE_CACHE_TTL", str(7 * 24 * 3600)))
+IMAGE_CACHE_MAX_ENTRIES = int(os.getenv("IMAGE_CACHE_MAX_ENTRIES", "20000"))
+IMAGE_CACHE_MAX_DISTANCE = int(os.getenv("IMAGE_CACHE_MAX_DISTANCE", "5"))
+
+BANDS = 8
+BAND_BITS = 64 // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+
+def dhash(image, size=8):
+    """64-bit difference hash: compares horizontally adjacent pixels of a 9x8 grayscale thumbnail."""
+    small = image.convert("L").resize((size + 1, size), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+
+def dhash_bytes(data):
+    if not PIL_AVAILABLE:
+        return None
+    image = Image.open(io.BytesIO(data))
+    image.draft("L", (64, 64))
+    return dhash(image)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def _to_signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+def _bands(value):
+    return [(band, (value >> (band * BAND_BITS)) & BAND_MASK) for band in range(BANDS)]
+
+
+class ImageDiagnosisCache:
+    def __init__(self, path=IMAGE_CACHE_PATH, ttl=IMAGE_CACHE_TTL, max_entries=IMAGE_CACHE_MAX_ENTRIES,
+                 max_distance=IMAGE_CACHE_MAX_DISTANCE):
+        if max_distance >= BANDS:
+            raise ValueError(f"max_distance must be below {BANDS} for the band index to be exact")
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._hashes = {}    # row id -> hash
+        self._buckets = {}   # (band, band value) -> set(row id)
+        self._watermark = 0  # highest row id loaded into memory
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS diagnoses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                phash INTEGER NOT NULL,
+                analysis TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_hit REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_diagnoses_last_hit ON diagnoses (last_hit)")
+        with self._lock:
+            self._purge_expired()
+            self._sync()
+
+    # --- in-memory band index ---
+
+    def _index(self, row_id, value):
+        self._hashes[row_id] = value
+        for key in _bands(value):
+            self._buckets.setdefault(key, set()).add(row_id)
+
+    def _unindex(self, row_id):
+        value = self._hashes.pop(row_id, None)
+        if value is None:
+            return
+        for key in _bands(value):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(row_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def _sync(self):
+        """Load rows written since the last sync (by this or another worker)."""
+        rows = self._conn.execute(
+            "SELECT id, phash FROM diagnoses WHERE id > ? AND created_at >= ?",
+            (self._watermark, time.time() - self.ttl)
+        ).fetchall()
+        for row_id, value in rows:
+            self._index(row_id, _to_unsigned(value))
+            self._watermark = max(self._watermark, row_id)
+
+    def _purge_expired(self):
+        cutoff = time.time() - self.ttl
+        expired = [row[0] for row in self._conn.execute("SELECT id FROM diagnoses WHERE created_at < ?", (cutoff,))]
+        if expired:
+            self._conn.execute("DELETE FROM diagnoses WHERE created_at < ?", (cutoff,))
+            for row_id in expired:
+                self._unindex(row_id)
+
+    # --- public API ---
+
+    def lookup(self, value):
+        """Returns (analysis, distance) for the nearest cached diagnosis, or (None, None)."""
+        with self._lock:
+            self._sync()
+            candidates = set()
+            for key in _bands(value):
+                candidates.update(self._buckets.get(key, ()))
+            ranked = sorted((hamming(value, self._hashes[c]), c) for c in candidates)
+
+            for distance, row_id in ranked:
+                if distance > self.max_distance:
+                    break
+                row = self._conn.execute(
+                    "SELECT analysis, created_at FROM diagnoses WHERE id = ?", (row_id,)
+                ).fetchone()
+                if row is None or row[1] < time.time() - self.ttl:
+                    # Evicted by another worker, or expired
+                    self._unindex(row_id)
+                    continue
+                self._conn.execute(
+                    "UPDATE diagnoses SET hits = hits + 1, last_hit = ? WHERE id = ?", (time.time(), row_id)
+                )
+                self.hits += 1
+                return json.loads(row[0]), distance
+
+            self.misses += 1
+            return None, None
+
+    def store(self, value, analysis):
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO diagnoses (phash, analysis, created_at, last_hit) VALUES (?, ?, ?, ?)",
+                (_to_signed(value), json.dumps(analysis, ensure_ascii=False), now, now)
+            )
+            self._index(cursor.lastrowid, value)
+            self._evict()
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM diagnoses").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        self._purge_expired()
+        excess = self._conn.execute("SELECT COUNT(*) FROM diagnoses").fetchone()[0] - self.max_entries
+        if excess <= 0:
+            return
+        victims = [row[0] for row in self._conn.execute(
+            "SELECT id FROM diagnoses ORDER BY last_hit LIMIT ?", (excess,)
+        )]
+        self._conn.executemany("DELETE FROM diagnoses WHERE id = ?", [(v,) for v in victims])
+        for row_id in victims:
+            self._unindex(row_id)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._hashes),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,187 @@
+"""
+Image preprocessing before crop-disease analysis.
+
+Phone photos arrive as 8-12 MB JPEGs (or PNG/WebP), often rotated via EXIF
+and carrying GPS metadata. The vision model never looks at more than
+2048px on the long side and 768px on the short side ("high" detail) or
+512px ("low" detail), so everything beyond that is wasted upload.
+
+`preprocess_image` sniffs the real format from magic bytes, decodes at
+reduced size where the codec allows it (JPEG DCT scaling via draft()),
+applies the EXIF orientation, downsizes to what the model uses and
+re-encodes as JPEG without metadata. The upload stays in its spooled
+temp file; only the small re-encoded image is held in memory.
+
+An upright JPEG or PNG that needs no resize is already compressed, and
+re-encoding it usually makes it larger. In that case the original bytes are
+kept, with EXIF/XMP/text metadata segments cut out losslessly, whenever that
+is smaller than the re-encoded JPEG.
+"""
+import base64
+import io
+import os
+import struct
+from collections import namedtuple
+
+try:
+    from PIL import Image, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+    print("Warning: Pillow not available. Images will be sent to the vision model unprocessed.")
+
+VISION_DETAIL = os.getenv("VISION_DETAIL", "high")  # "high" or "low", matches the API's image detail
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "82"))
+IMAGE_MAX_LONG_SIDE = 2048
+IMAGE_MAX_SHORT_SIDE = 768
+IMAGE_LOW_DETAIL_SIDE = 512
+
+_MAGIC = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+
+# Metadata that may carry GPS, device or personal data; dropped when the original is kept
+_JPEG_METADATA_MARKERS = {0xE1, 0xED, 0xFE} # APP1 (EXIF, XMP), APP13 (IPTC), COM
+_PNG_METADATA_CHUNKS = {b"eXIf", b"tEXt", b"zTXt", b"iTXt", b"tIME"}
+
+PreparedImage = namedtuple("PreparedImage", ["data", "mime", "width", "height", "original_bytes"])
+
+
+class UnsupportedImageError(ValueError):
+    pass
+
+
+def sniff_mime(head):
+    """Detect the image type from its first bytes (the filename and client MIME type are not trusted)."""
+    for magic, mime in _MAGIC:
+        if head.startswith(magic):
+            return mime
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"heic", b"heix", b"mif1", b"msf1"):
+        return "image/heic"
+    return None
+
+
+def target_size(width, height, detail=VISION_DETAIL):
+    """Size the vision model will actually use; never upscales. Symmetric in orientation."""
+    if detail == "low":
+        scale = IMAGE_LOW_DETAIL_SIDE / max(width, height)
+    else:
+        scale = min(IMAGE_MAX_LONG_SIDE / max(width, height), IMAGE_MAX_SHORT_SIDE / min(width, height))
+    scale = min(1.0, scale)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _strip_jpeg_metadata(data):
+    out = [data[:2]] # SOI
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            return None
+        marker = data[position + 1]
+        if marker == 0xFF: # fill byte
+            position += 1
+            continue
+        if marker == 0xDA: # start of scan: entropy-coded data follows, keep the rest
+            out.append(data[position:])
+            return b"".join(out)
+        length = struct.unpack(">H", data[position + 2:position + 4])[0]
+        segment_end = position + 2 + length
+        if marker not in _JPEG_METADATA_MARKERS:
+            out.append(data[position:segment_end])
+        position = segment_end
+    return None
+
+
+def _strip_png_metadata(data):
+    out = [data[:8]] # signature
+    position = 8
+    while position + 8 <= len(data):
+        length, chunk_type = struct.unpack(">I4s", data[position:position + 8])
+        chunk_end = position + 12 + length # length, type, data, crc
+        if chunk_type not in _PNG_METADATA_CHUNKS:
+            out.append(data[position:chunk_end])
+        position = chunk_end
+        if chunk_type == b"IEND":
+            return b"".join(out)
+    return None
+
+
+def strip_metadata(data, mime):
+    """Original image bytes without metadata segments, or None if the file cannot be parsed."""
+    try:
+        if mime == "image/jpeg":
+            return _strip_jpeg_metadata(data)
+        if mime == "image/png":
+            return _strip_png_metadata(data)
+    except struct.error:
+        return None
+    return None
+
+
+def _stream_size(stream):
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+
+def preprocess_image(stream, detail=VISION_DETAIL, quality=IMAGE_JPEG_QUALITY):
+    """Read an uploaded image from a seekable stream and return a PreparedImage."""
+    stream.seek(0)
+    head = stream.read(16)
+    stream.seek(0)
+    mime = sniff_mime(head)
+    if mime is None:
+        raise UnsupportedImageError("Unsupported image format. Please upload a JPEG, PNG, WebP or GIF photo.")
+    original_bytes = _stream_size(stream)
+
+    if not PIL_AVAILABLE:
+        if mime == "image/heic":
+            raise UnsupportedImageError("HEIC photos need Pillow on the server. Please upload a JPEG.")
+        return PreparedImage(stream.read(), mime, None, None, original_bytes)
+
+    try:
+        image = Image.open(stream)
+        full_size = image.size
+        upright = image.getexif().get(0x0112, 1) == 1 # EXIF orientation
+        size = target_size(*image.size, detail=detail)
+        if image.format == "JPEG":
+            # Decode at 1/2, 1/4 or 1/8 scale directly instead of materializing all pixels
+            image.draft("RGB", size)
+        image = ImageOps.exif_transpose(image)
+    except Exception as e:
+        raise UnsupportedImageError(f"Could not read image: {e}")
+
+    transparent = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    if transparent:
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+
+    image.thumbnail(target_size(*image.size, detail=detail), Image.LANCZOS, reducing_gap=3.0)
+
+    out = io.BytesIO()
+    # No exif= argument: metadata (including GPS) is dropped
+    image.save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+    encoded = out.getvalue()
+
+    if image.size == full_size and upright and not transparent and mime in ("image/jpeg", "image/png"):
+        # Nothing to resize or rotate: the original is often smaller than a re-encode
+        stream.seek(0)
+        stripped = strip_metadata(stream.read(), mime)
+        if stripped is not None and len(stripped) < len(encoded):
+            return PreparedImage(stripped, mime, image.width, image.height, original_bytes)
+    return PreparedImage(encoded, "image/jpeg", image.width, image.height, original_bytes)
+
+
+def to_data_url(prepared):
+    return f"data:{prepared.mime};base64,{base64.b64encode(prepared.data).decode('ascii')}"
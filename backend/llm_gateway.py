@@ -0,0 +1,386 @@
+"""
+Shared gateway for all LLM calls.
+
+- One pooled HTTP client per process (keep-alive connections are reused)
+- Per-call deadline covering connect, retries and backoff
+- Bounded concurrency so a slow provider cannot pin every worker thread
+- Jittered exponential backoff on 429/5xx/timeouts, limited by a global retry
+  budget so retries cannot amplify an outage
+- An asyncio path running on a background event loop, so a single worker can
+  multiplex many in-flight completions (see `complete_many`)
+- Single-flight coalescing: identical concurrent non-streaming requests share
+  one upstream call (optionally across workers, see singleflight.py)
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+
+from singleflight import SingleFlight, SqliteFlightStore, make_flight_key
+
+try:
+    import httpx
+    from openai import (OpenAI, AsyncOpenAI, APIConnectionError, APIStatusError,
+                        APITimeoutError, RateLimitError)
+    from openai.types.chat import ChatCompletion
+    OPENAI_AVAILABLE = True
+except ImportError:
+    OPENAI_AVAILABLE = False
+
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BUDGET_RATIO = float(os.getenv("LLM_RETRY_BUDGET_RATIO", "0.2"))
+LLM_SINGLEFLIGHT = os.getenv("LLM_SINGLEFLIGHT", "1") == "1"
+# Path to a SQLite file shared by all workers on the host; empty = in-process coalescing only
+LLM_SINGLEFLIGHT_STORE = os.getenv("LLM_SINGLEFLIGHT_STORE", "")
+
+
+class LLMGatewayError(Exception):
+    pass
+
+
+class LLMGatewayBusy(LLMGatewayError):
+    """No concurrency slot became free before the call's deadline."""
+
+
+class RetryBudget:
+    """
+    Token bucket shared by all calls: every request deposits `ratio` tokens and
+    every retry withdraws one, with a small per-second floor so low-traffic
+    processes can still retry.
+    """
+
+    def __init__(self, ratio=0.2, min_per_second=1.0, max_tokens=100.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens * ratio
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+        self.exhausted = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.max_tokens, self._tokens + (now - self._last) * self.min_per_second)
+        self._last = now
+
+    def record_request(self):
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_spend(self):
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            self.exhausted += 1
+            return False
+
+
+def _is_retryable(exc):
+    if not OPENAI_AVAILABLE:
+        return False
+    if isinstance(exc, (RateLimitError, APITimeoutError, APIConnectionError)):
+        return True
+    return isinstance(exc, APIStatusError) and exc.status_code >= 500
+
+
+def _retry_after(exc):
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _serialize_completion(completion):
+    return completion.model_dump_json()
+
+
+def _deserialize_completion(text):
+    return ChatCompletion.model_validate_json(text)
+
+
+def backoff_delay(attempt, base=0.25, cap=4.0):
+    # "Full jitter": spreads synchronized retries from many workers
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class LLMGateway:
+    def __init__(self, api_key=None, base_url=None, timeout=LLM_TIMEOUT,
+                 connect_timeout=LLM_CONNECT_TIMEOUT, max_concurrency=LLM_MAX_CONCURRENCY,
+                 max_retries=LLM_MAX_RETRIES, retry_budget=None,
+                 singleflight=LLM_SINGLEFLIGHT, singleflight_store=LLM_SINGLEFLIGHT_STORE):
+        if not OPENAI_AVAILABLE:
+            raise LLMGatewayError("openai library not available")
+
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.retry_budget = retry_budget or RetryBudget(ratio=LLM_RETRY_BUDGET_RATIO)
+        self._api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self._base_url = base_url or os.getenv("OPENAI_BASE_URL")
+        self._httpx_timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self._limits = httpx.Limits(max_connections=max_concurrency,
+                                    max_keepalive_connections=max_concurrency)
+
+        # Retries are handled here (with the shared budget), not by the SDK
+        self.client = OpenAI(
+            api_key=self._api_key,
+            base_url=self._base_url,
+            max_retries=0,
+            timeout=self._httpx_timeout,
+            http_client=httpx.Client(limits=self._limits, timeout=self._httpx_timeout)
+        )
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._async_client = None
+        self._async_slots = None
+        self._async_flights = {}
+
+        self.singleflight = None
+        if singleflight:
+            store = None
+            if singleflight_store:
+                try:
+                    store = SqliteFlightStore(singleflight_store)
+                except Exception as e:
+                    print(f"Warning: shared single-flight store unavailable, coalescing in-process only: {e}")
+            self.singleflight = SingleFlight(store)
+
+        self._stats_lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.busy_rejections = 0
+
+    # --- sync path ---
+
+    def _acquire(self, deadline):
+        if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            with self._stats_lock:
+                self.busy_rejections += 1
+            raise LLMGatewayBusy("LLM gateway is at capacity, try again shortly")
+
+    def _retry_delay(self, attempt, exc, deadline):
+        """Seconds to wait before the next attempt, or False to give up."""
+        if attempt >= self.max_retries or not _is_retryable(exc):
+            return False
+        delay = _retry_after(exc) or backoff_delay(attempt)
+        if time.monotonic() + delay >= deadline or not self.retry_budget.try_spend():
+            return False
+        with self._stats_lock:
+            self.retries += 1
+        return delay
+
+    def complete(self, timeout=None, coalesce=True, **kwargs):
+        """
+        Blocking chat completion. Accepts the same kwargs as chat.completions.create.
+        Identical concurrent calls share one upstream request unless coalesce=False.
+        """
+        if not coalesce or self.singleflight is None:
+            return self._complete(timeout, **kwargs)
+        result, _ = self.singleflight.do(
+            make_flight_key(kwargs),
+            lambda: self._complete(timeout, **kwargs),
+            timeout=timeout or self.timeout,
+            serialize=_serialize_completion,
+            deserialize=_deserialize_completion
+        )
+        return result
+
+    def _complete(self, timeout, **kwargs):
+        deadline = time.monotonic() + (timeout or self.timeout)
+        self.retry_budget.record_request()
+        with self._stats_lock:
+            self.calls += 1
+        self._acquire(deadline)
+        try:
+            attempt = 0
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise LLMGatewayError("LLM call deadline exceeded")
+                try:
+                    return self.client.with_options(timeout=remaining).chat.completions.create(**kwargs)
+                except Exception as exc:
+                    delay = self._retry_delay(attempt, exc, deadline)
+                    if delay is False:
+                        with self._stats_lock:
+                            self.failures += 1
+                        raise
+                    time.sleep(delay)
+                    attempt += 1
+        finally:
+            self._slots.release()
+
+    def stream(self, timeout=None, **kwargs):
+        """
+        Streaming chat completion. Only opening the stream is retried; the
+        concurrency slot is held until the caller finishes iterating.
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        self.retry_budget.record_request()
+        with self._stats_lock:
+            self.calls += 1
+        self._acquire(deadline)
+        try:
+            attempt = 0
+            while True:
+                try:
+                    response = self.client.with_options(
+                        timeout=max(0.1, deadline - time.monotonic())
+                    ).chat.completions.create(stream=True, **kwargs)
+                    break
+                except Exception as exc:
+                    delay = self._retry_delay(attempt, exc, deadline)
+                    if delay is False:
+                        with self._stats_lock:
+                            self.failures += 1
+                        raise
+                    time.sleep(delay)
+                    attempt += 1
+            for chunk in response:
+                yield chunk
+        finally:
+            self._slots.release()
+
+    # --- async path ---
+
+    def _ensure_loop(self):
+        with self._loop_lock:
+            if self._loop is not None:
+                return self._loop
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                self._async_slots = asyncio.Semaphore(self.max_concurrency)
+                self._async_client = AsyncOpenAI(
+                    api_key=self._api_key,
+                    base_url=self._base_url,
+                    max_retries=0,
+                    timeout=self._httpx_timeout,
+                    http_client=httpx.AsyncClient(limits=self._limits, timeout=self._httpx_timeout)
+                )
+                ready.set()
+                loop.run_forever()
+
+            threading.Thread(target=run, name="llm-gateway-loop", daemon=True).start()
+            ready.wait()
+            self._loop = loop
+            return loop
+
+    async def acomplete(self, timeout=None, coalesce=True, **kwargs):
+        """Async chat completion; must run on the gateway loop (use `submit`)."""
+        if not coalesce or self.singleflight is None:
+            return await self._acomplete(timeout, **kwargs)
+
+        # The loop is single-threaded, so a plain dict is enough to coalesce here
+        key = make_flight_key(kwargs)
+        pending = self._async_flights.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        flight = asyncio.get_running_loop().create_future()
+        self._async_flights[key] = flight
+        try:
+            result = await self._acomplete(timeout, **kwargs)
+            flight.set_result(result)
+            return result
+        except Exception as e:
+            flight.set_exception(e)
+            flight.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            del self._async_flights[key]
+
+    async def _acomplete(self, timeout, **kwargs):
+        deadline = time.monotonic() + (timeout or self.timeout)
+        self.retry_budget.record_request()
+        with self._stats_lock:
+            self.calls += 1
+        try:
+            await asyncio.wait_for(self._async_slots.acquire(), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            with self._stats_lock:
+                self.busy_rejections += 1
+            raise LLMGatewayBusy("LLM gateway is at capacity, try again shortly")
+        try:
+            attempt = 0
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise LLMGatewayError("LLM call deadline exceeded")
+                try:
+                    return await self._async_client.with_options(timeout=remaining).chat.completions.create(**kwargs)
+                except Exception as exc:
+                    delay = self._retry_delay(attempt, exc, deadline)
+                    if delay is False:
+                        with self._stats_lock:
+                            self.failures += 1
+                        raise
+                    await asyncio.sleep(delay)
+                    attempt += 1
+        finally:
+            self._async_slots.release()
+
+    def submit(self, timeout=None, coalesce=True, **kwargs):
+        """Schedule a completion on the gateway loop; returns a concurrent.futures.Future."""
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(self.acomplete(timeout=timeout, coalesce=coalesce, **kwargs), loop)
+
+    def complete_many(self, requests, timeout=None, coalesce=True):
+        """
+        Run many completions concurrently from one thread. Returns a list in the
+        same order containing either the response or the raised exception.
+        """
+        futures = [self.submit(timeout=timeout, coalesce=coalesce, **kwargs) for kwargs in requests]
+        wait_timeout = (timeout or self.timeout) * (1 + len(requests) // max(1, self.max_concurrency))
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result(timeout=wait_timeout))
+            except Exception as exc:
+                results.append(exc)
+        return results
+
+    def stats(self):
+        with self._stats_lock:
+            stats = {
+                "calls": self.calls,
+                "retries": self.retries,
+                "failures": self.failures,
+                "busy_rejections": self.busy_rejections,
+                "retry_budget_exhausted": self.retry_budget.exhausted,
+                "max_concurrency": self.max_concurrency,
+            }
+        if self.singleflight is not None:
+            stats["singleflight"] = self.singleflight.stats()
+        return stats
+
+
+_default_gateway = None
+_default_lock = threading.Lock()
+
+
+def get_gateway():
+    """Process-wide gateway shared by app.py and image_analysis.py (None if unavailable)."""
+    global _default_gateway
+    with _default_lock:
+        if _default_gateway is None and OPENAI_AVAILABLE and os.getenv("OPENAI_API_KEY"):
+            try:
+                _default_gateway = LLMGateway()
+            except Exception as e:
+                print(f"Warning: Could not initialize LLM gateway: {e}")
+        return _default_gateway
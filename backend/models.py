@@ -25,3 +25,88 @@ class User(db.Model):
             'last_readiness': self.last_readiness,
             'profile_image': self.profile_image
         }
+
+class GeocodeCache(db.Model):
+    __tablename__ = 'geocode_cache'
+
+    id = db.Column(db.Integer, primary_key=True)
+    normalized_query = db.Column(db.String(255), unique=True, nullable=False, index=True)
+    lat = db.Column(db.Float, nullable=True) # NULL records a lookup that found nothing
+    lon = db.Column(db.Float, nullable=True)
+    display_name = db.Column(db.String(255), nullable=True)
+    source = db.Column(db.String(20), nullable=False) # nominatim, gazetteer
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ColdStorageFacility(db.Model):
+    __tablename__ = 'cold_storage_facilities'
+
+    id = db.Column(db.Integer, primary_key=True)
+    osm_id = db.Column(db.String(32), unique=True, nullable=False, index=True) # e.g. node/123, way/456
+    name = db.Column(db.String(200), nullable=True)
+    lat = db.Column(db.Float, nullable=False)
+    lon = db.Column(db.Float, nullable=False)
+    geohash = db.Column(db.String(12), nullable=False, index=True)
+    tags = db.Column(db.Text, nullable=True) # JSON of the OSM tags
+    source = db.Column(db.String(20), nullable=False) # overpass, geojson
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class FacilitySyncTile(db.Model):
+    __tablename__ = 'facility_sync_tiles'
+
+    id = db.Column(db.Integer, primary_key=True)
+    tile = db.Column(db.String(16), unique=True, nullable=False, index=True) # "<floor lat>:<floor lon>"
+    facility_count = db.Column(db.Integer, default=0)
+    synced_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SearchResponseCache(db.Model):
+    __tablename__ = 'search_response_cache'
+
+    id = db.Column(db.Integer, primary_key=True)
+    cache_key = db.Column(db.String(128), unique=True, nullable=False, index=True) # "<namespace>:<sha256>"
+    body = db.Column(db.Text, nullable=False) # JSON
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class IntrusionAlert(db.Model):
+    __tablename__ = 'intrusion_alerts'
+    __table_args__ = {'sqlite_autoincrement': True} # ids are SSE event ids and must never be reused
+
+    id = db.Column(db.Integer, primary_key=True)
+    alert_type = db.Column(db.String(40), nullable=False, default='ANIMAL_INTRUSION')
+    animal = db.Column(db.String(100), nullable=True)
+    severity = db.Column(db.String(20), nullable=True)
+    location = db.Column(db.Text, nullable=True) # JSON
+    message = db.Column(db.String(300), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class PushSubscription(db.Model):
+    __tablename__ = 'push_subscriptions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    endpoint_hash = db.Column(db.String(64), unique=True, nullable=False, index=True) # sha256 of the endpoint URL
+    endpoint = db.Column(db.Text, nullable=False)
+    p256dh = db.Column(db.String(200), nullable=False)
+    auth = db.Column(db.String(100), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, index=True)
+    # Targeting: alerts reach the subscription when they are within radius_km of the farm.
+    # Subscriptions without a farm location receive every alert, or only alerts
+    # for their region when one is set.
+    farm_lat = db.Column(db.Float, nullable=True)
+    farm_lon = db.Column(db.Float, nullable=True)
+    radius_km = db.Column(db.Float, nullable=True)
+    area_geohash = db.Column(db.String(4), nullable=True, index=True) # geohash cell (~39 x 20 km) of the farm
+    region = db.Column(db.String(100), nullable=True, index=True) # e.g. district or state name, lower-cased
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_subscription_info(self):
+        return {'endpoint': self.endpoint, 'keys': {'p256dh': self.p256dh, 'auth': self.auth}}
+
+class RevokedToken(db.Model):
+    __tablename__ = 'revoked_tokens'
+
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(32), unique=True, nullable=False, index=True) # token id (jti) or family id (fam) claim
+    token_type = db.Column(db.String(10), nullable=False) # access, refresh or family
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, index=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True) # row can be purged after the token expires
+    revoked_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,110 @@
+"""
+Prompt registry.
+
+All system prompts live as data files under prompts/<feature>/:
+- base.txt      the language-independent prompt
+- <lang>.txt    optional instructions appended for that language
+
+Every (feature, language) variant is assembled once at import time and
+frozen. The base always comes first so variants of a feature share a stable
+prefix (which is what provider-side prompt caching keys on), and each variant
+carries a short content hash usable as a cache key. To add a language, drop
+a <lang>.txt file into the feature folder; manifest.json sets the language
+used when a request asks for one that has no file.
+
+    python prompt_registry.py    # token counts per variant, biggest first
+"""
+import hashlib
+import json
+import os
+from collections import namedtuple
+from types import MappingProxyType
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")  # gpt-4o family tokenizer
+    TIKTOKEN_AVAILABLE = True
+except Exception:
+    _ENCODING = None
+    TIKTOKEN_AVAILABLE = False
+
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts")
+
+PromptVariant = namedtuple("PromptVariant", ["feature", "language", "text", "version", "tokens"])
+
+
+def count_tokens(text):
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    # Rough estimate: ~4 bytes per token (Tamil script is much more token-heavy than English)
+    return max(1, len(text.encode("utf-8")) // 4)
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    # Editors add a final newline; it is not part of the prompt
+    return text[:-1] if text.endswith("\n") else text
+
+
+def _version(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+
+class PromptRegistry:
+    def __init__(self, prompts_dir=PROMPTS_DIR):
+        self.prompts_dir = prompts_dir
+        with open(os.path.join(prompts_dir, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        variants = {}
+        fallbacks = {}
+        for feature, options in manifest.items():
+            feature_dir = os.path.join(prompts_dir, feature)
+            base = _read(os.path.join(feature_dir, "base.txt"))
+            variants[(feature, None)] = self._make(feature, None, base)
+            for filename in sorted(os.listdir(feature_dir)):
+                language, ext = os.path.splitext(filename)
+                if ext != ".txt" or language == "base":
+                    continue
+                text = base + "\n\n" + _read(os.path.join(feature_dir, filename))
+                variants[(feature, language)] = self._make(feature, language, text)
+            fallbacks[feature] = options.get("fallback_language")
+
+        self._variants = MappingProxyType(variants)
+        self._fallbacks = MappingProxyType(fallbacks)
+        self.version = _version("".join(v.version for _, v in sorted(variants.items(), key=lambda kv: str(kv[0]))))
+
+    @staticmethod
+    def _make(feature, language, text):
+        return PromptVariant(feature, language, text, _version(text), count_tokens(text))
+
+    def get(self, feature, language="en"):
+        """Frozen PromptVariant for feature/language, falling back per manifest.json."""
+        variant = self._variants.get((feature, language))
+        if variant is None:
+            variant = self._variants.get((feature, self._fallbacks.get(feature)))
+        if variant is None:
+            variant = self._variants.get((feature, None))
+        if variant is None:
+            raise KeyError(f"Unknown prompt feature: {feature}")
+        return variant
+
+    def text(self, feature, language="en"):
+        return self.get(feature, language).text
+
+    def variants(self):
+        return list(self._variants.values())
+
+    def languages(self, feature):
+        return sorted(lang for (feat, lang) in self._variants if feat == feature and lang)
+
+
+registry = PromptRegistry()
+
+
+if __name__ == "__main__":
+    counter = "tiktoken o200k_base" if TIKTOKEN_AVAILABLE else "estimate (install tiktoken for exact counts)"
+    print(f"Prompt registry version {registry.version}, token counts via {counter}")
+    for variant in sorted(registry.variants(), key=lambda v: v.tokens, reverse=True):
+        print(f"{variant.tokens:6d}  {variant.feature:<11} {variant.language or 'base':<5} {variant.version}")
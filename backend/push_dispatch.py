@@ -0,0 +1,151 @@
+"""
+Background Web Push delivery for intrusion alerts.
+
+Sending used to happen one subscription at a time inside the request, with
+pywebpush re-parsing the VAPID key and re-signing the JWT for every send.
+PushDispatcher instead:
+
+- runs deliveries on a bounded thread pool (PUSH_WORKERS), in batches, so
+  the report endpoint returns immediately
+- shares one keep-alive requests.Session, pooled per push service host
+- parses the VAPID key once and caches the signed VAPID headers per
+  audience origin (fcm.googleapis.com, updates.push.services.mozilla.com,
+  ...) until shortly before the JWT expires
+- calls on_gone(subscription) when the push service answers 404/410, so
+  dead subscriptions are pruned instead of retried forever
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from pywebpush import WebPusher
+    from py_vapid import Vapid
+    PYWEBPUSH_AVAILABLE = True
+except ImportError:
+    PYWEBPUSH_AVAILABLE = False
+
+PUSH_WORKERS = int(os.getenv("PUSH_WORKERS", "16"))
+PUSH_BATCH_SIZE = int(os.getenv("PUSH_BATCH_SIZE", "50"))
+PUSH_TIMEOUT = float(os.getenv("PUSH_TIMEOUT", "10"))
+PUSH_TTL = int(os.getenv("PUSH_TTL", "3600")) # how long push services may hold an undelivered alert
+VAPID_CLAIMS_SUB = os.getenv("VAPID_CLAIMS_SUB", "mailto:admin@farmer.ai")
+VAPID_TOKEN_LIFETIME = 12 * 3600 # the maximum push services accept is 24 h
+GONE_STATUSES = (404, 410)
+
+
+def audience(endpoint):
+    url = urlparse(endpoint)
+    return f"{url.scheme}://{url.netloc}"
+
+
+class PushDispatcher:
+    def __init__(self, private_key, claims_sub=VAPID_CLAIMS_SUB, workers=PUSH_WORKERS,
+                 batch_size=PUSH_BATCH_SIZE, timeout=PUSH_TIMEOUT, ttl=PUSH_TTL, on_gone=None):
+        self.vapid = Vapid.from_string(private_key=private_key)
+        self.claims_sub = claims_sub
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.ttl = ttl
+        self.on_gone = on_gone
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="push")
+        self._vapid_headers = {} # audience -> (headers, expires_at)
+        self._lock = threading.Lock()
+        self.counts = {"queued": 0, "sent": 0, "failed": 0, "pruned": 0, "vapid_signed": 0}
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counts[name] += n
+
+    def vapid_headers(self, endpoint):
+        aud = audience(endpoint)
+        now = time.time()
+        with self._lock:
+            cached = self._vapid_headers.get(aud)
+        # Re-sign an hour before expiry so a token never expires in flight
+        if cached and cached[1] - 3600 > now:
+            return cached[0]
+        expires_at = int(now) + VAPID_TOKEN_LIFETIME
+        headers = self.vapid.sign({"aud": aud, "exp": expires_at, "sub": self.claims_sub})
+        with self._lock:
+            self._vapid_headers[aud] = (headers, expires_at)
+            self.counts["vapid_signed"] += 1
+        return headers
+
+    def dispatch(self, payload, subscriptions):
+        """
+        Queues payload for every subscription and returns at once. The returned
+        future resolves to the list of batch futures.
+        """
+        subscriptions = list(subscriptions)
+        self._count("queued", len(subscriptions))
+        # Even splitting into batches happens off the request thread
+        return self._executor.submit(self._fan_out, payload, subscriptions)
+
+    def _fan_out(self, payload, subscriptions):
+        return [
+            self._executor.submit(self._send_batch, payload, subscriptions[i:i + self.batch_size])
+            for i in range(0, len(subscriptions), self.batch_size)
+        ]
+
+    def _send_batch(self, payload, subscriptions):
+        for subscription in subscriptions:
+            self.send(payload, subscription)
+
+    def send(self, payload, subscription):
+        """Delivers one notification; returns True when the push service accepted it."""
+        try:
+            response = WebPusher(subscription, requests_session=self.session).send(
+                payload,
+                headers=dict(self.vapid_headers(subscription["endpoint"])),
+                ttl=self.ttl,
+                timeout=self.timeout
+            )
+        except Exception as e:
+            self._count("failed")
+            print(f"Push error: {e}")
+            return False
+
+        if response.status_code in GONE_STATUSES:
+            self._count("pruned")
+            if self.on_gone:
+                try:
+                    self.on_gone(subscription)
+                except Exception as e:
+                    print(f"Push prune failed: {e}")
+            return False
+        if response.status_code > 202:
+            self._count("failed")
+            print(f"Push failed: {response.status_code} {response.text[:200]}")
+            return False
+        self._count("sent")
+        return True
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counts)
+            stats["audiences"] = len(self._vapid_headers)
+        return stats
+
+
+def create_dispatcher(on_gone=None):
+    """PushDispatcher configured from VAPID_PRIVATE_KEY, or None when push is unavailable."""
+    if not PYWEBPUSH_AVAILABLE:
+        return None
+    private_key = os.getenv("VAPID_PRIVATE_KEY")
+    if not private_key:
+        return None
+    try:
+        return PushDispatcher(private_key, on_gone=on_gone)
+    except Exception as e:
+        print(f"Warning: invalid VAPID_PRIVATE_KEY, push notifications disabled: {e}")
+        return None
@@ -0,0 +1,150 @@
+"""
+Persistent Web Push subscriptions.
+
+Subscriptions live in the push_subscriptions table, keyed by a SHA-256 of
+the endpoint URL, so subscribing is a single indexed upsert and survives
+deploys. A subscription may carry a farm location and radius; an alert with
+coordinates is only sent to subscriptions whose farm lies within their
+radius, looked up through the area_geohash index instead of scanning
+every row. Subscriptions without a farm location may name a region instead
+(e.g. a district) and then only receive alerts whose location carries the
+same region, through the region index.
+"""
+import datetime
+import hashlib
+
+from extensions import db
+from geo_distance import haversine_km
+from geo_fanout import AREA_PRECISION, parse_farm_location, alert_point, area_cells
+from geohash import encode
+from models import PushSubscription
+
+UPSERT_CHUNK = 500
+
+
+class InvalidSubscription(ValueError):
+    pass
+
+
+def endpoint_hash(endpoint):
+    return hashlib.sha256(endpoint.encode("utf-8")).hexdigest()
+
+
+def normalize_region(region):
+    """Region names are matched case-insensitively; blank means none."""
+    if not isinstance(region, str) or not region.strip():
+        return None
+    return region.strip().lower()
+
+
+def alert_region(alert):
+    location = (alert or {}).get("location")
+    return normalize_region(location.get("region")) if isinstance(location, dict) else None
+
+
+def subscription_row(subscription, user_id=None, location=None, region=None):
+    """Validated column values for one browser subscription (+ optional farm location)."""
+    endpoint = (subscription or {}).get("endpoint")
+    keys = (subscription or {}).get("keys") or {}
+    if not endpoint or not keys.get("p256dh") or not keys.get("auth"):
+        raise InvalidSubscription("subscription needs endpoint, keys.p256dh and keys.auth")
+
+    row = {
+        "endpoint_hash": endpoint_hash(endpoint),
+        "endpoint": endpoint,
+        "p256dh": keys["p256dh"],
+        "auth": keys["auth"],
+        "user_id": user_id,
+        "farm_lat": None,
+        "farm_lon": None,
+        "radius_km": None,
+        "area_geohash": None,
+        "region": normalize_region(region),
+        "updated_at": datetime.datetime.utcnow(),
+    }
+    try:
+        farm = parse_farm_location(location)
+    except ValueError as e:
+        raise InvalidSubscription(str(e))
+    if farm:
+        lat, lon, radius = farm
+        row.update(farm_lat=lat, farm_lon=lon, radius_km=radius, area_geohash=encode(lat, lon, AREA_PRECISION))
+    return row
+
+
+def upsert_subscriptions(rows):
+    """
+    Inserts or updates subscription rows by endpoint_hash in chunks. Uses the
+    database's native upsert (PostgreSQL / SQLite ON CONFLICT) when available.
+    """
+    if not rows:
+        return 0
+    # One browser may appear twice in a batch; the last one wins
+    rows = list({row["endpoint_hash"]: row for row in rows}.values())
+    dialect = db.engine.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        for i in range(0, len(rows), UPSERT_CHUNK):
+            chunk = rows[i:i + UPSERT_CHUNK]
+            statement = insert(PushSubscription).values(chunk)
+            updates = {column: statement.excluded[column] for column in chunk[0] if column != "endpoint_hash"}
+            # An anonymous re-subscribe keeps the owner recorded earlier
+            updates["user_id"] = db.func.coalesce(statement.excluded.user_id, PushSubscription.user_id)
+            statement = statement.on_conflict_do_update(index_elements=["endpoint_hash"], set_=updates)
+            db.session.execute(statement)
+    else:
+        for row in rows:
+            existing = PushSubscription.query.filter_by(endpoint_hash=row["endpoint_hash"]).first()
+            if existing is None:
+                db.session.add(PushSubscription(**row))
+            else:
+                for column, value in row.items():
+                    if column != "user_id" or value is not None:
+                        setattr(existing, column, value)
+    db.session.commit()
+    return len(rows)
+
+
+def save_subscription(subscription, user_id=None, location=None, region=None):
+    row = subscription_row(subscription, user_id, location, region)
+    upsert_subscriptions([row])
+    return row["endpoint_hash"]
+
+
+def remove_subscription(subscription):
+    try:
+        PushSubscription.query.filter_by(endpoint_hash=endpoint_hash(subscription["endpoint"])).delete()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def subscriptions_for_alert(alert):
+    """
+    Subscription infos that should receive the alert: farms within range of its
+    location, and region-only subscriptions for the alert's region. Without
+    coordinates every farm qualifies; without a region every region does.
+    """
+    point = alert_point(alert)
+    region = alert_region(alert)
+    # Subscriptions without a farm location, narrowed by region when the alert has one
+    unlocated = PushSubscription.area_geohash.is_(None)
+    if region is not None:
+        unlocated = db.and_(unlocated, db.or_(PushSubscription.region.is_(None), PushSubscription.region == region))
+    if point is None:
+        rows = PushSubscription.query.filter(db.or_(PushSubscription.area_geohash.isnot(None), unlocated)).all()
+        return [row.to_subscription_info() for row in rows]
+
+    # Subscriptions are shared by all workers, so they are matched in the
+    # database (area_geohash and region indexes) rather than in a per-process index
+    lat, lon = point
+    cells = area_cells(lat, lon)
+    nearby = PushSubscription.query.filter(db.or_(PushSubscription.area_geohash.in_(cells), unlocated)).all()
+    return [
+        row.to_subscription_info() for row in nearby
+        if row.area_geohash is None or haversine_km(lat, lon, row.farm_lat, row.farm_lon) <= row.radius_km
+    ]
@@ -0,0 +1,292 @@
+"""
+In-process response cache for the LLM-backed endpoints.
+
+Two tiers:
+- exact: normalized (question, context, language, prompt version) -> response,
+  with TTL and LRU eviction.
+- near-duplicate (optional, off by default): MinHash signatures over character
+  shingles of the canonicalized question, bucketed with LSH, so lightly
+  reworded questions in the same context/language/prompt version reuse an
+  existing answer. Shingle similarity cannot tell "sell" from "not sell", so
+  a near hit is only served when both questions also have the same negation
+  words and the same content words; it catches rewordings like
+  "leaf-curl in tomatoes" vs "leaf curl in tomato", not true synonyms.
+
+Everything is computed locally - no embedding API calls.
+"""
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCT_RE = re.compile(r"[\s\?\.!,;:।]+$")
+_WORD_RE = re.compile(r"\w+")
+_CONTRACTIONS = [("can't", "can not"), ("won't", "will not"), ("n't", " not")]
+
+NEGATIONS = frozenset([
+    "not", "no", "never", "nor", "neither", "none", "nothing", "without", "cannot", "stop", "avoid",
+    "नहीं", "मत", "न", "இல்லை", "வேண்டாம்", "కాదు", "వద్దు", "नको", "नाही",
+])
+STOPWORDS = frozenset([
+    "a", "an", "the", "i", "me", "my", "we", "our", "you", "your", "it", "its", "this", "that", "these",
+    "those", "is", "are", "was", "were", "be", "been", "am", "do", "does", "did", "can", "could",
+    "should", "shall", "will", "would", "may", "might", "must", "to", "of", "in", "on", "at", "for",
+    "from", "with", "by", "about", "into", "and", "or", "how", "what", "when", "where", "which", "why",
+    "who", "whom", "there", "here", "please", "tell", "some", "any", "so",
+])
+
+
+def normalize_text(text):
+    """Normalize free text so trivially different inputs share a cache key."""
+    if text is None:
+        return ""
+    text = unicodedata.normalize("NFKC", str(text)).casefold()
+    text = _WHITESPACE_RE.sub(" ", text).strip()
+    return _TRAILING_PUNCT_RE.sub("", text)
+
+
+def _stem(word):
+    # Just enough to fold plurals: tomatoes -> tomato, varieties -> variety, pests -> pest
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("oes", "ses", "xes", "ches", "shes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def question_terms(text):
+    """
+    (canonical text, negation words, content words) of a question. Content
+    words are the stemmed tokens left after dropping negations and stopwords.
+    """
+    text = normalize_text(text)
+    for contraction, expanded in _CONTRACTIONS:
+        text = text.replace(contraction, expanded).replace(contraction.replace("'", "’"), expanded)
+    tokens = [_stem(token) for token in _WORD_RE.findall(text)]
+    negations = frozenset(token for token in tokens if token in NEGATIONS)
+    content = frozenset(token for token in tokens if token not in NEGATIONS and token not in STOPWORDS)
+    return " ".join(tokens), negations, content
+
+
+def make_cache_key(*parts):
+    joined = "\x1f".join(normalize_text(p) for p in parts)
+    return hashlib.sha256(joined.encode("utf-8")).hexdigest()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize=1024, ttl=3600, on_evict=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        evicted = None
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                evicted = key
+                value = None
+            else:
+                self._data.move_to_end(key)
+        if evicted is not None and self.on_evict:
+            self.on_evict(evicted)
+        return value
+
+    def set(self, key, value):
+        evicted = []
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                old_key, _ = self._data.popitem(last=False)
+                evicted.append(old_key)
+        if self.on_evict:
+            for old_key in evicted:
+                self.on_evict(old_key)
+
+    def pop(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+        return item[1] if item else None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# --- Near-duplicate tier (MinHash + LSH) ---
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def _shingles(text, size=3):
+    text = normalize_text(text)
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class MinHasher:
+    def __init__(self, num_perm=64, seed=1):
+        # Deterministic permutation parameters so signatures are stable across workers
+        rng = hashlib.sha256(f"minhash-{seed}".encode()).digest()
+        self.params = []
+        counter = 0
+        while len(self.params) < num_perm:
+            block = hashlib.sha256(rng + counter.to_bytes(4, "big")).digest()
+            a = int.from_bytes(block[:8], "big") % _MERSENNE_PRIME or 1
+            b = int.from_bytes(block[8:16], "big") % _MERSENNE_PRIME
+            self.params.append((a, b))
+            counter += 1
+
+    def signature(self, text):
+        hashed = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "big")
+                  for s in _shingles(text)]
+        if not hashed:
+            return None
+        return tuple(min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashed)
+                     for a, b in self.params)
+
+
+def _similarity(sig_a, sig_b):
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+class ResponseCache:
+    """
+    Cache for answers keyed on (question, context, language, prompt version).
+
+    `get` returns (value, tier) where tier is "exact", "near" or None on a miss.
+    """
+
+    def __init__(self, maxsize=2048, ttl=3600, near_duplicates=False,
+                 similarity_threshold=0.8, num_perm=64, bands=16):
+        self._exact = TTLCache(maxsize=maxsize, ttl=ttl, on_evict=self._forget)
+        self.near_duplicates = near_duplicates
+        self.similarity_threshold = similarity_threshold
+        self._hasher = MinHasher(num_perm=num_perm) if near_duplicates else None
+        self._bands = bands
+        self._rows = num_perm // bands
+        self._buckets = {}     # (namespace, band, band_hash) -> set(exact_key)
+        self._signatures = {}  # exact_key -> (namespace, signature, (negations, content words))
+        self._near_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _namespace(context, language, version):
+        return make_cache_key(context, language, version)
+
+    def _band_keys(self, namespace, signature):
+        for band in range(self._bands):
+            chunk = signature[band * self._rows:(band + 1) * self._rows]
+            yield (namespace, band, hash(chunk))
+
+    def _forget(self, key):
+        with self._near_lock:
+            entry = self._signatures.pop(key, None)
+            if entry is None:
+                return
+            namespace, signature, _ = entry
+            for bucket_key in self._band_keys(namespace, signature):
+                bucket = self._buckets.get(bucket_key)
+                if bucket is not None:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self._buckets[bucket_key]
+
+    def _count(self, tier):
+        with self._stats_lock:
+            if tier == "exact":
+                self.hits += 1
+            elif tier == "near":
+                self.near_hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, question, context="", language="en", version=""):
+        key = make_cache_key(question, context, language, version)
+        value = self._exact.get(key)
+        if value is not None:
+            self._count("exact")
+            return value, "exact"
+
+        if self.near_duplicates:
+            canonical, negations, content = question_terms(question)
+            signature = self._hasher.signature(canonical)
+            if signature is not None:
+                namespace = self._namespace(context, language, version)
+                best_key, best_score = None, 0.0
+                with self._near_lock:
+                    candidates = set()
+                    for bucket_key in self._band_keys(namespace, signature):
+                        candidates.update(self._buckets.get(bucket_key, ()))
+                    for candidate in candidates:
+                        _, candidate_signature, terms = self._signatures[candidate]
+                        # Similar spelling is not enough: "sell" and "not sell" must not share an answer
+                        if terms != (negations, content):
+                            continue
+                        score = _similarity(signature, candidate_signature)
+                        if score > best_score:
+                            best_key, best_score = candidate, score
+                if best_key is not None and best_score >= self.similarity_threshold:
+                    value = self._exact.get(best_key)
+                    if value is not None:
+                        self._count("near")
+                        return value, "near"
+
+        self._count(None)
+        return None, None
+
+    def set(self, question, value, context="", language="en", version=""):
+        key = make_cache_key(question, context, language, version)
+        self._exact.set(key, value)
+        if not self.near_duplicates:
+            return
+        canonical, negations, content = question_terms(question)
+        signature = self._hasher.signature(canonical)
+        if signature is None:
+            return
+        namespace = self._namespace(context, language, version)
+        with self._near_lock:
+            if key in self._signatures:
+                return
+            self._signatures[key] = (namespace, signature, (negations, content))
+            for bucket_key in self._band_keys(namespace, signature):
+                self._buckets.setdefault(bucket_key, set()).add(key)
+
+    def clear(self):
+        self._exact.clear()
+        with self._near_lock:
+            self._buckets.clear()
+            self._signatures.clear()
+
+    def stats(self):
+        with self._stats_lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                "entries": len(self._exact),
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.near_hits) / lookups, 4) if lookups else 0.0,
+            }
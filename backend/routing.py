@@ -0,0 +1,147 @@
+"""
+Driving routes and travel-time matrices for cold-storage directions.
+
+Directions and matrix cells are cached by coordinates rounded to ~100 m
+(ROUTE_CACHE_PRECISION decimals), so a farm asking about the same
+facilities again does not hit OpenRouteService. A matrix request for one
+farm and N facilities is a single upstream call covering only the pairs not
+already cached; when the provider is unavailable (no key, timeout, quota)
+each missing pair is estimated from the straight-line distance.
+"""
+import os
+import threading
+
+import requests
+
+from geo_distance import haversine_km
+from response_cache import TTLCache
+
+ORS_BASE_URL = os.getenv("ORS_BASE_URL", "https://api.openrouteservice.org")
+ORS_TIMEOUT = float(os.getenv("ORS_TIMEOUT", "10"))
+ROUTE_CACHE_SIZE = int(os.getenv("ROUTE_CACHE_SIZE", "2000"))
+ROUTE_CACHE_TTL = int(os.getenv("ROUTE_CACHE_TTL", str(24 * 3600)))
+ROUTE_CACHE_PRECISION = 3
+MAX_MATRIX_DESTINATIONS = 50
+
+# Straight-line fallback: typical rural road detour and average truck speed
+ROAD_DETOUR_FACTOR = 1.3
+AVERAGE_SPEED_KMH = 35.0
+
+
+class RoutingError(Exception):
+    def __init__(self, message, details=None):
+        super().__init__(message)
+        self.details = details
+
+
+def _point_key(point):
+    return f"{round(float(point[0]), ROUTE_CACHE_PRECISION)},{round(float(point[1]), ROUTE_CACHE_PRECISION)}"
+
+
+def estimate_leg(start, end):
+    """Straight-line estimate of a road trip: (distance_km, duration_s)."""
+    distance = haversine_km(start[0], start[1], end[0], end[1]) * ROAD_DETOUR_FACTOR
+    return distance, distance / AVERAGE_SPEED_KMH * 3600
+
+
+class RouteClient:
+    def __init__(self, api_key, timeout=ORS_TIMEOUT, cache_size=ROUTE_CACHE_SIZE, cache_ttl=ROUTE_CACHE_TTL):
+        self.api_key = api_key
+        self.timeout = timeout
+        self._routes = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._legs = TTLCache(maxsize=cache_size * 20, ttl=cache_ttl)
+        self._session = requests.Session()
+        self._lock = threading.Lock()
+        self.counts = {"route_hits": 0, "route_calls": 0, "leg_hits": 0, "matrix_calls": 0, "estimated_legs": 0}
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.counts[key] += n
+
+    def directions(self, start, end):
+        """Returns (GeoJSON route, cached). Raises RoutingError when the provider fails."""
+        key = f"{_point_key(start)}>{_point_key(end)}"
+        cached = self._routes.get(key)
+        if cached is not None:
+            self._count("route_hits")
+            return cached, True
+
+        self._count("route_calls")
+        response = self._session.post(
+            f"{ORS_BASE_URL}/v2/directions/driving-car/geojson",
+            json={"coordinates": [[start[1], start[0]], [end[1], end[0]]]}, # ORS uses [lon, lat]
+            headers={'Authorization': self.api_key, 'Content-Type': 'application/json'},
+            timeout=self.timeout
+        )
+        if response.status_code != 200:
+            raise RoutingError('ORS API Error', response.text)
+        route = response.json()
+        self._routes.set(key, route)
+        return route, False
+
+    def matrix(self, origin, destinations):
+        """
+        Distance (km) and duration (s) from origin to each destination.
+        Returns a list of {"distance_km", "duration_s", "source"} in destination order,
+        where source is "cache", "ors" or "estimate".
+        """
+        origin_key = _point_key(origin)
+        results = [None] * len(destinations)
+        missing = []
+        for i, destination in enumerate(destinations):
+            leg = self._legs.get(f"{origin_key}>{_point_key(destination)}")
+            if leg is not None:
+                results[i] = dict(leg, source="cache")
+            else:
+                missing.append(i)
+        self._count("leg_hits", len(destinations) - len(missing))
+
+        if missing and self.api_key:
+            try:
+                legs = self._ors_matrix(origin, [destinations[i] for i in missing])
+                for i, leg in zip(missing, legs):
+                    if leg is not None:
+                        self._legs.set(f"{origin_key}>{_point_key(destinations[i])}", leg)
+                        results[i] = dict(leg, source="ors")
+            except Exception as e:
+                print(f"ORS matrix error: {e}")
+
+        for i, result in enumerate(results):
+            if result is None:
+                distance, duration = estimate_leg(origin, destinations[i])
+                results[i] = {"distance_km": round(distance, 1), "duration_s": round(duration), "source": "estimate"}
+                self._count("estimated_legs")
+        return results
+
+    def _ors_matrix(self, origin, destinations):
+        self._count("matrix_calls")
+        locations = [[origin[1], origin[0]]] + [[d[1], d[0]] for d in destinations]
+        response = self._session.post(
+            f"{ORS_BASE_URL}/v2/matrix/driving-car",
+            json={
+                "locations": locations,
+                "sources": [0],
+                "destinations": list(range(1, len(locations))),
+                "metrics": ["distance", "duration"],
+                "units": "km"
+            },
+            headers={'Authorization': self.api_key, 'Content-Type': 'application/json'},
+            timeout=self.timeout
+        )
+        if response.status_code != 200:
+            raise RoutingError('ORS matrix error', response.text[:200])
+        body = response.json()
+        distances = body.get("distances", [[]])[0]
+        durations = body.get("durations", [[]])[0]
+        legs = []
+        for distance, duration in zip(distances, durations):
+            # ORS returns null for destinations it cannot route to
+            if distance is None or duration is None:
+                legs.append(None)
+            else:
+                legs.append({"distance_km": round(distance, 1), "duration_s": round(duration)})
+        return legs
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts)
@@ -0,0 +1,201 @@
+"""
+Single-flight request coalescing.
+
+Concurrent callers asking for the same key share one execution of the
+underlying function: the first caller (the leader) runs it and every other
+caller waits for and receives the same result or exception.
+
+`SqliteFlightStore` optionally extends this across gunicorn workers on one
+host: the leader claims the key in a shared SQLite file and publishes the
+serialized result there for a short time; followers in other processes poll
+for it. Only callers that arrived while the leader was still running get
+its result: a request made after the flight finished starts a new one, so
+this is coalescing, not caching.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+
+def make_flight_key(payload):
+    """Stable key for a JSON-serializable request payload."""
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SqliteFlightStore:
+    """Cross-process claim/publish store backed by a local SQLite file (WAL mode)."""
+
+    def __init__(self, path, lease_seconds=60, result_ttl=5, poll_interval=0.02):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS flights (
+                    key TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    started_at REAL NOT NULL,
+                    finished_at REAL,
+                    status TEXT NOT NULL,
+                    result TEXT
+                )
+            """)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def claim(self, key):
+        """Returns True if this process became the leader for key."""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Drop stale leases and results that nobody is waiting for anymore
+            conn.execute(
+                "DELETE FROM flights WHERE (status = 'running' AND started_at < ?) "
+                "OR (status != 'running' AND finished_at < ?)",
+                (now - self.lease_seconds, now - self.result_ttl)
+            )
+            # A finished flight only serves the callers that were waiting on it
+            conn.execute("DELETE FROM flights WHERE key = ? AND status != 'running'", (key,))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO flights (key, owner, started_at, status) VALUES (?, ?, ?, 'running')",
+                (key, self.owner, now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.rowcount == 1
+
+    def publish(self, key, result_text, ok=True):
+        self._connect().execute(
+            "UPDATE flights SET status = ?, result = ?, finished_at = ? WHERE key = ? AND owner = ?",
+            ("done" if ok else "failed", result_text, time.time(), key, self.owner)
+        )
+
+    def wait(self, key, timeout, since):
+        """
+        Poll for another process's result. Returns the result text of a flight
+        that finished after `since` (the caller's arrival), or None to run locally.
+        """
+        deadline = time.monotonic() + timeout
+        conn = self._connect()
+        while time.monotonic() < deadline:
+            row = conn.execute("SELECT status, result, finished_at FROM flights WHERE key = ?", (key,)).fetchone()
+            if row is None or row[0] == "failed":
+                return None
+            if row[0] == "done":
+                return row[1] if row[2] >= since else None
+            time.sleep(self.poll_interval)
+        return None
+
+
+class SingleFlight:
+    def __init__(self, store=None):
+        self.store = store
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+
+    def do(self, key, fn, timeout=60, serialize=None, deserialize=None):
+        """
+        Run fn() once per key among concurrent callers. Returns (result, shared)
+        where shared is True if the result came from another caller's execution.
+        `serialize`/`deserialize` convert results to/from text for the
+        cross-process store; without them only in-process coalescing is used.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            if not call.event.wait(timeout):
+                return fn(), False
+            with self._stats_lock:
+                self.shared += 1
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        shared = False
+        try:
+            call.result, shared = self._lead(key, fn, timeout, serialize, deserialize)
+            return call.result, shared
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._stats_lock:
+                if shared:
+                    self.shared += 1
+                else:
+                    self.leaders += 1
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def _lead(self, key, fn, timeout, serialize, deserialize):
+        if self.store is None or serialize is None or deserialize is None:
+            return fn(), False
+
+        arrived = time.time()
+        try:
+            claimed = self.store.claim(key)
+        except sqlite3.Error as e:
+            print(f"Single-flight store unavailable: {e}")
+            return fn(), False
+
+        if not claimed:
+            # Another worker process is already running this call
+            text = self.store.wait(key, timeout, since=arrived)
+            if text is not None:
+                return deserialize(text), True
+            return fn(), False
+
+        try:
+            result = fn()
+        except Exception:
+            try:
+                self.store.publish(key, None, ok=False)
+            except Exception as e:
+                # Waiters run locally after their timeout; keep the original error
+                print(f"Single-flight publish failed: {e}")
+            raise
+        try:
+            self.store.publish(key, serialize(result))
+        except sqlite3.Error as e:
+            print(f"Single-flight publish failed: {e}")
+        return result, False
+
+    def stats(self):
+        with self._stats_lock:
+            return {"executions": self.leaders, "coalesced": self.shared}
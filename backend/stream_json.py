@@ -0,0 +1,159 @@
+"""
+Incremental parser for a streamed JSON object.
+
+The LLM streams its JSON answer a few characters at a time. This parser is fed
+those chunks and reports top-level fields as soon as they are available, so a
+client can render `path_now` while `path_wait` is still being generated.
+"""
+import json
+
+_SIMPLE_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class IncrementalJSONObjectParser:
+    """
+    Feed text chunks of a single JSON object; `feed` returns a list of events:
+    - ("delta", key, text): more characters of a string value
+    - ("field", key, value): a top-level value is complete
+    """
+
+    def __init__(self):
+        self.state = "start"
+        self.fields = {}
+        self._key = None
+        self._buf = []
+        self._escape = None     # pending escape sequence (without the backslash)
+        self._high_surrogate = None
+        self._depth = 0
+        self._raw_in_string = False
+        self._raw_escaped = False
+
+    @property
+    def done(self):
+        return self.state == "done"
+
+    def _decode_escape(self, seq):
+        if seq[0] != 'u':
+            return _SIMPLE_ESCAPES.get(seq[0], seq[0])
+        code = int(seq[1:], 16)
+        if 0xD800 <= code <= 0xDBFF:
+            self._high_surrogate = code
+            return ""
+        if 0xDC00 <= code <= 0xDFFF and self._high_surrogate is not None:
+            code = 0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+            self._high_surrogate = None
+        return chr(code)
+
+    def _read_string(self, chunk, i, events, emit_deltas):
+        """Consume string characters from chunk[i:]; returns (index, finished)."""
+        start_len = len(self._buf)
+        n = len(chunk)
+        while i < n:
+            ch = chunk[i]
+            if self._escape is not None:
+                self._escape += ch
+                i += 1
+                if self._escape[0] == 'u' and len(self._escape) < 5:
+                    continue
+                self._buf.append(self._decode_escape(self._escape))
+                self._escape = None
+                continue
+            if ch == '\\':
+                self._escape = ""
+                i += 1
+                continue
+            if ch == '"':
+                i += 1
+                if emit_deltas and len(self._buf) > start_len:
+                    events.append(("delta", self._key, "".join(self._buf[start_len:])))
+                return i, True
+            self._buf.append(ch)
+            i += 1
+        if emit_deltas and len(self._buf) > start_len:
+            events.append(("delta", self._key, "".join(self._buf[start_len:])))
+        return i, False
+
+    def _finish_field(self, value, events):
+        self.fields[self._key] = value
+        events.append(("field", self._key, value))
+        self._key = None
+        self._buf = []
+        self.state = "comma_or_end"
+
+    def feed(self, chunk):
+        events = []
+        i, n = 0, len(chunk)
+        while i < n:
+            ch = chunk[i]
+            if self.state == "start":
+                if ch == '{':
+                    self.state = "key_or_end"
+                i += 1
+            elif self.state == "key_or_end":
+                if ch == '"':
+                    self.state = "in_key"
+                    self._buf = []
+                elif ch == '}':
+                    self.state = "done"
+                i += 1
+            elif self.state == "in_key":
+                i, finished = self._read_string(chunk, i, events, emit_deltas=False)
+                if finished:
+                    self._key = "".join(self._buf)
+                    self._buf = []
+                    self.state = "colon"
+            elif self.state == "colon":
+                if ch == ':':
+                    self.state = "value_start"
+                i += 1
+            elif self.state == "value_start":
+                if ch.isspace():
+                    i += 1
+                elif ch == '"':
+                    self.state = "in_string_value"
+                    self._buf = []
+                    i += 1
+                else:
+                    self.state = "in_raw_value"
+                    self._buf = []
+                    self._depth = 0
+                    self._raw_in_string = False
+                    self._raw_escaped = False
+            elif self.state == "in_string_value":
+                i, finished = self._read_string(chunk, i, events, emit_deltas=True)
+                if finished:
+                    self._finish_field("".join(self._buf), events)
+            elif self.state == "in_raw_value":
+                # Numbers, booleans, null or nested containers: collect raw text
+                if self._raw_in_string:
+                    if self._raw_escaped:
+                        self._raw_escaped = False
+                    elif ch == '\\':
+                        self._raw_escaped = True
+                    elif ch == '"':
+                        self._raw_in_string = False
+                elif ch == '"':
+                    self._raw_in_string = True
+                elif ch in '[{':
+                    self._depth += 1
+                elif ch in ']}' and self._depth > 0:
+                    self._depth -= 1
+                elif self._depth == 0 and ch in ',}':
+                    raw = "".join(self._buf).strip()
+                    try:
+                        value = json.loads(raw)
+                    except ValueError:
+                        value = raw
+                    self._finish_field(value, events)
+                    continue  # let comma_or_end consume the delimiter
+                self._buf.append(ch)
+                i += 1
+            elif self.state == "comma_or_end":
+                if ch == ',':
+                    self.state = "key_or_end"
+                elif ch == '}':
+                    self.state = "done"
+                i += 1
+            else:  # done - ignore trailing text
+                break
+        return events
@@ -0,0 +1,175 @@
+"""
+Stale-while-revalidate response cache.
+
+Entries are fresh for `fresh_ttl` seconds and may be served stale for up to
+`stale_ttl` seconds. A stale hit returns the old value immediately and
+refreshes it on a background thread (one refresh per key at a time), so
+only the very first request for a key ever waits for the slow path.
+
+Two tiers: a bounded in-process LRU, and a database table shared by all
+workers and surviving restarts. A memory miss that finds a row in the
+database is promoted to memory.
+"""
+import datetime
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from extensions import db
+from models import SearchResponseCache
+
+FRESH = "fresh"
+STALE = "stale"
+MISS = "miss"
+
+
+class DatabaseTier:
+    """Second tier in the search_response_cache table; values are JSON."""
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+
+    def get(self, key):
+        row = SearchResponseCache.query.filter_by(cache_key=f"{self.namespace}:{key}").first()
+        if row is None:
+            return None
+        created = row.created_at.replace(tzinfo=datetime.timezone.utc).timestamp()
+        return json.loads(row.body), created
+
+    def set(self, key, value, created):
+        cache_key = f"{self.namespace}:{key}"
+        try:
+            row = SearchResponseCache.query.filter_by(cache_key=cache_key).first()
+            if row is None:
+                row = SearchResponseCache(cache_key=cache_key)
+                db.session.add(row)
+            row.body = json.dumps(value, ensure_ascii=False)
+            row.created_at = datetime.datetime.fromtimestamp(created, tz=datetime.timezone.utc).replace(tzinfo=None)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Search cache write failed: {e}")
+
+    def purge(self, older_than):
+        cutoff = datetime.datetime.fromtimestamp(older_than, tz=datetime.timezone.utc).replace(tzinfo=None)
+        try:
+            SearchResponseCache.query.filter(
+                SearchResponseCache.cache_key.like(f"{self.namespace}:%"),
+                SearchResponseCache.created_at < cutoff
+            ).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Search cache purge failed: {e}")
+
+
+class StaleWhileRevalidateCache:
+    def __init__(self, app, fresh_ttl=300, stale_ttl=86400, maxsize=500, second_tier=None, refresh_workers=2):
+        self.app = app
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = stale_ttl
+        self.maxsize = maxsize
+        self.second_tier = second_tier
+        self._memory = OrderedDict()  # key -> (created, value)
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="swr-refresh")
+        self._writes = 0
+        self.counts = {"fresh_hits": 0, "stale_served": 0, "misses": 0, "db_hits": 0,
+                       "refreshes": 0, "refresh_failures": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def _remember(self, key, created, value):
+        with self._lock:
+            self._memory[key] = (created, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.maxsize:
+                self._memory.popitem(last=False)
+
+    def _lookup(self, key):
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                self._memory.move_to_end(key)
+                return item
+        if self.second_tier is None:
+            return None
+        found = self.second_tier.get(key)
+        if found is None:
+            return None
+        value, created = found
+        if time.time() - created > self.stale_ttl:
+            return None
+        self._count("db_hits")
+        self._remember(key, created, value)
+        return created, value
+
+    def _store(self, key, value):
+        created = time.time()
+        self._remember(key, created, value)
+        if self.second_tier is not None:
+            self.second_tier.set(key, value, created)
+            self._writes += 1
+            if self._writes % 200 == 0:
+                self.second_tier.purge(created - self.stale_ttl)
+        return created
+
+    def get_or_compute(self, key, compute, cacheable=None):
+        """
+        Returns (value, status, age_seconds). `compute()` runs inline on a miss and
+        in the background for stale entries; values failing `cacheable(value)`
+        are returned but not stored.
+        """
+        item = self._lookup(key)
+        now = time.time()
+        if item is not None:
+            created, value = item
+            age = now - created
+            if age <= self.fresh_ttl:
+                self._count("fresh_hits")
+                return value, FRESH, age
+            if age <= self.stale_ttl:
+                self._count("stale_served")
+                self._schedule_refresh(key, compute, cacheable)
+                return value, STALE, age
+
+        self._count("misses")
+        value = compute()
+        if cacheable is None or cacheable(value):
+            self._store(key, value)
+        return value, MISS, 0.0
+
+    def _schedule_refresh(self, key, compute, cacheable):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        self._executor.submit(self._refresh, key, compute, cacheable)
+
+    def _refresh(self, key, compute, cacheable):
+        try:
+            with self.app.app_context():
+                value = compute()
+                if cacheable is None or cacheable(value):
+                    self._store(key, value)
+            self._count("refreshes")
+        except Exception as e:
+            self._count("refresh_failures")
+            print(f"Background refresh failed for {key}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counts)
+            stats["entries"] = len(self._memory)
+            stats["refreshing"] = len(self._refreshing)
+        served = stats["fresh_hits"] + stats["stale_served"] + stats["misses"]
+        stats["hit_rate"] = round((stats["fresh_hits"] + stats["stale_served"]) / served, 4) if served else 0.0
+        return stats
@@ -0,0 +1,111 @@
+"""
+Refresh-token rotation, token families and the jti revocation store.
+
+    cd backend && python -m pytest -q test_auth.py
+"""
+import os
+import tempfile
+import uuid
+
+import pytest
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db"))
+os.environ.setdefault("ALERT_BROKER", "memory")
+
+import app as backend
+import token_revocation
+from auth import revocations
+from token_revocation import BloomFilter
+
+
+@pytest.fixture
+def client():
+    email = f"farmer-{uuid.uuid4().hex[:8]}@example.com"
+    with backend.app.app_context():
+        password_hash = backend.bcrypt.generate_password_hash("pw").decode("utf-8")
+        backend.db.session.add(backend.User(email=email, name="Test Farmer", password_hash=password_hash))
+        backend.db.session.commit()
+    client = backend.app.test_client()
+    client.credentials = {"email": email, "password": "pw"}
+    return client
+
+
+def login(client):
+    response = client.post("/api/auth/login", json=client.credentials)
+    assert response.status_code == 200
+    return response.json["access_token"], response.json["refresh_token"]
+
+
+def refresh(client, refresh_token):
+    return client.post("/api/auth/refresh", json={"refresh_token": refresh_token})
+
+
+def me(client, access_token):
+    return client.get("/api/auth/me", headers={"Authorization": f"Bearer {access_token}"})
+
+
+def test_refresh_rotates_tokens(client):
+    access, first = login(client)
+    response = refresh(client, first)
+    assert response.status_code == 200
+    assert response.json["refresh_token"] != first
+    assert me(client, response.json["access_token"]).status_code == 200
+    assert me(client, access).status_code == 200
+
+
+def test_reused_refresh_token_revokes_the_family(client):
+    access, first = login(client)
+    rotated = refresh(client, first).json
+
+    reused = refresh(client, first)
+    assert reused.status_code == 401
+    assert reused.json["error"] == "Token has been revoked"
+
+    # Everything issued from that login is gone, including the tokens the first use returned
+    assert refresh(client, rotated["refresh_token"]).status_code == 401
+    assert me(client, rotated["access_token"]).status_code == 401
+    assert me(client, access).status_code == 401
+
+
+def test_reuse_leaves_other_logins_alone(client):
+    _, first = login(client)
+    other_access, other_refresh = login(client)
+    refresh(client, first)
+    refresh(client, first)
+    assert me(client, other_access).status_code == 200
+    assert refresh(client, other_refresh).status_code == 200
+
+
+def test_logout_revokes_access_token(client):
+    access, refresh_token = login(client)
+    assert me(client, access).status_code == 200
+
+    response = client.post("/api/auth/logout", json={"refresh_token": refresh_token},
+                           headers={"Authorization": f"Bearer {access}"})
+    assert response.status_code == 200
+
+    response = me(client, access)
+    assert response.status_code == 401
+    assert response.json["error"] == "Token has been revoked"
+    assert refresh(client, refresh_token).status_code == 401
+
+
+def test_bloom_false_positive_is_checked_against_the_store(client, monkeypatch):
+    access, _ = login(client)
+    assert me(client, access).status_code == 200
+    before = revocations.stats()["false_positives"]
+
+    # Every jti now looks revoked to the filter; the jti index has the final word
+    monkeypatch.setattr(token_revocation.BloomFilter, "__contains__", lambda self, item: True)
+    assert me(client, access).status_code == 200
+    assert revocations.stats()["false_positives"] > before
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    items = [uuid.uuid4().hex for _ in range(1000)]
+    for item in items:
+        bloom.add(item)
+    assert all(item in bloom for item in items)
+    false_positives = sum(uuid.uuid4().hex in bloom for _ in range(10000))
+    assert false_positives < 300
@@ -0,0 +1,54 @@
+"""
+Cold-storage search cache across availability windows.
+
+    cd backend && python -m pytest -q test_cold_storage_cache.py
+"""
+import os
+import tempfile
+
+import pytest
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db"))
+os.environ.setdefault("ALERT_BROKER", "memory")
+
+import app as backend
+from swr_cache import StaleWhileRevalidateCache
+
+
+@pytest.fixture
+def search(monkeypatch):
+    windows = {"now": 1000}
+    searches = []
+
+    def run(location_query, radius_km, limit, window):
+        searches.append(window)
+        return {"facilities": [{"id": "real-node-1", "window": window}], "geocode_source": "default",
+                "facility_source": "index", "window": window}
+
+    monkeypatch.setattr(backend, "current_window", lambda: windows["now"])
+    monkeypatch.setattr(backend, "run_cold_storage_search", run)
+    monkeypatch.setattr(backend, "cold_storage_cache",
+                        StaleWhileRevalidateCache(backend.app, fresh_ttl=300, stale_ttl=900))
+    client = backend.app.test_client()
+
+    def get(window):
+        windows["now"] = window
+        return client.get("/api/cold-storage/search", query_string={"location": "Ooty"})
+
+    get.searches = searches
+    return get
+
+
+def test_same_window_is_served_from_cache(search):
+    assert search(1000).headers["X-Cache"] == "MISS"
+    assert search(1000).headers["X-Cache"] == "HIT"
+    assert search.searches == [1000]
+
+
+def test_new_window_misses_instead_of_serving_the_old_one(search):
+    first = search(1000)
+    second = search(1001)
+    assert second.headers["X-Cache"] == "MISS"
+    assert second.json["facilities"][0]["window"] == 1001
+    assert second.last_modified > first.last_modified
+    assert search.searches == [1000, 1001]
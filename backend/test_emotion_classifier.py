@@ -0,0 +1,41 @@
+"""
+Local emotion fast path: texts it must hand to the LLM.
+
+    cd backend && python -m pytest -q test_emotion_classifier.py
+"""
+import json
+import os
+
+import pytest
+
+from emotion_classifier import EmotionClassifier
+
+HELDOUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "data", "emotion_heldout.jsonl")
+
+
+def must_escalate_samples():
+    with open(HELDOUT, encoding="utf-8") as f:
+        samples = [json.loads(line) for line in f if line.strip()]
+    return [sample["text"] for sample in samples if sample.get("escalate")]
+
+
+@pytest.mark.parametrize("text", [
+    "I want to kill myself, everything is fine now",
+    "no one cares, I am so tired of all this, fine",
+    "I would be happy if prices rose but they fell",
+    "I am hardly happy",
+] + must_escalate_samples())
+def test_escalated_to_llm(text):
+    assert EmotionClassifier().classify(text) is None
+
+
+def test_clear_cut_text_answered_locally():
+    classifier = EmotionClassifier()
+    assert classifier.classify("I am happy")["emotion"] == "Happy"
+    assert classifier.classify("நல்ல விளைச்சல், மிகவும் சந்தோஷம்", "ta")["emotion"] == "மகிழ்ச்சி"
+
+
+def test_forced_escalations_are_counted():
+    classifier = EmotionClassifier()
+    classifier.classify("I am hardly happy")
+    assert classifier.stats()["forced_escalations"] == 1
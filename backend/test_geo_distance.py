@@ -0,0 +1,51 @@
+"""
+Top-k facility ranking and the search limit parameter.
+
+    cd backend && python -m pytest -q test_geo_distance.py
+"""
+import os
+import tempfile
+
+import pytest
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db"))
+os.environ.setdefault("ALERT_BROKER", "memory")
+
+import geo_distance
+from geo_distance import rank_facilities, top_k
+
+
+def facility(distance, status="Available", cost=0.5):
+    return {"distance": distance, "status": status, "costPerKg": cost}
+
+
+@pytest.fixture(params=[True, False], ids=["numpy", "python"])
+def numpy_available(request, monkeypatch):
+    if request.param and not geo_distance.NUMPY_AVAILABLE:
+        pytest.skip("numpy not installed")
+    monkeypatch.setattr(geo_distance, "NUMPY_AVAILABLE", request.param)
+    return request.param
+
+
+@pytest.mark.parametrize("k", [0, -1, -3])
+def test_top_k_non_positive_is_empty(numpy_available, k):
+    assert list(top_k([3.0, 1.0, 2.0], k)) == []
+
+
+def test_top_k_returns_smallest_in_order(numpy_available):
+    assert list(top_k([5.0, 1.0, 4.0, 2.0, 3.0], 3)) == [1, 3, 4]
+    assert list(top_k([2.0, 1.0], 5)) == [1, 0]
+
+
+def test_rank_facilities_keeps_nearest(numpy_available):
+    facilities = [facility(d) for d in (9.0, 1.0, 7.0, 3.0)] + [facility(0.5, status="Not Available")]
+    ranked = rank_facilities(facilities, k=2)
+    assert [f["distance"] for f in ranked] == [1.0, 3.0]
+    assert rank_facilities(facilities, k=0) == []
+
+
+@pytest.mark.parametrize("limit", ["0", "-3", "abc"])
+def test_search_rejects_non_positive_limit(limit):
+    import app as backend
+    response = backend.app.test_client().get("/api/cold-storage/search", query_string={"location": "Ooty", "limit": limit})
+    assert response.status_code == 400
@@ -0,0 +1,56 @@
+"""
+Push subscription targeting by farm location and region.
+
+    cd backend && python -m pytest -q test_push_subscriptions.py
+"""
+import os
+import tempfile
+
+import pytest
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db"))
+os.environ.setdefault("ALERT_BROKER", "memory")
+
+import app as backend
+from models import PushSubscription
+from push_subscriptions import save_subscription, subscriptions_for_alert
+
+
+def subscription(name):
+    return {"endpoint": f"https://push.example.com/{name}", "keys": {"p256dh": "p", "auth": "a"}}
+
+
+@pytest.fixture
+def subscribers():
+    with backend.app.app_context():
+        PushSubscription.query.delete()
+        backend.db.session.commit()
+        save_subscription(subscription("everyone"))
+        save_subscription(subscription("coimbatore-farm"), location={"lat": 11.0168, "lon": 76.9558, "radius_km": 20})
+        save_subscription(subscription("madurai-farm"), location={"lat": 9.9252, "lon": 78.1198, "radius_km": 20})
+        save_subscription(subscription("coimbatore-district"), region=" Coimbatore ")
+        save_subscription(subscription("madurai-district"), region="madurai")
+        yield
+
+
+def recipients(alert):
+    return sorted(info["endpoint"].rsplit("/", 1)[1] for info in subscriptions_for_alert(alert))
+
+
+def test_alert_with_location_and_region(subscribers):
+    alert = {"location": {"lat": 11.02, "lon": 76.96, "region": "COIMBATORE"}}
+    assert recipients(alert) == ["coimbatore-district", "coimbatore-farm", "everyone"]
+
+
+def test_alert_with_region_only(subscribers):
+    alert = {"location": {"name": "Madurai market", "region": "Madurai"}}
+    assert recipients(alert) == ["coimbatore-farm", "everyone", "madurai-district", "madurai-farm"]
+
+
+def test_alert_with_location_only(subscribers):
+    alert = {"location": {"lat": 9.93, "lon": 78.12}}
+    assert recipients(alert) == ["coimbatore-district", "everyone", "madurai-district", "madurai-farm"]
+
+
+def test_alert_without_location(subscribers):
+    assert len(recipients({"location": {"name": "Farm perimeter"}})) == 5
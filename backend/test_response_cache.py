@@ -0,0 +1,80 @@
+"""
+/api/ask-twin response cache with a stubbed OpenAI client.
+
+    cd backend && python -m pytest -q test_response_cache.py
+"""
+import os
+import tempfile
+from types import SimpleNamespace
+
+import pytest
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db"))
+os.environ.setdefault("ALERT_BROKER", "memory")
+
+import app as backend
+from response_cache import ResponseCache, question_terms
+
+
+class StubLLM:
+    """Stands in for the LLM gateway; answers with a numbered reply and counts calls."""
+
+    def __init__(self):
+        self.calls = []
+
+    def complete(self, **kwargs):
+        self.calls.append(kwargs["messages"][-1]["content"])
+        message = SimpleNamespace(content=f"answer {len(self.calls)}")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+@pytest.fixture
+def client(monkeypatch):
+    stub = StubLLM()
+    monkeypatch.setattr(backend, "llm", stub)
+    monkeypatch.setattr(backend, "ask_twin_cache", ResponseCache(near_duplicates=True))
+    client = backend.app.test_client()
+    client.stub = stub
+    return client
+
+
+def ask(client, doubt):
+    response = client.post("/api/ask-twin", json={"doubt": doubt, "context": "Onion farm", "language": "en"})
+    assert response.status_code == 200
+    return response.json["answer"], response.headers["X-Cache"]
+
+
+def test_exact_repeat_is_served_from_cache(client):
+    assert ask(client, "How to control leaf curl in tomato") == ("answer 1", "MISS")
+    assert ask(client, "  how to control LEAF CURL in tomato?") == ("answer 1", "EXACT")
+    assert len(client.stub.calls) == 1
+
+
+def test_paraphrase_hits_near_duplicate_tier(client):
+    ask(client, "How to control leaf curl in tomato")
+    assert ask(client, "How to control leaf-curl in tomatoes?") == ("answer 1", "NEAR")
+    assert len(client.stub.calls) == 1
+
+
+def test_negation_pair_misses(client):
+    ask(client, "should I sell my onions now")
+    assert ask(client, "should I not sell my onions now") == ("answer 2", "MISS")
+    assert ask(client, "shouldn't I sell my onions now") == ("answer 3", "MISS")
+    assert len(client.stub.calls) == 3
+
+
+def test_different_content_word_misses(client):
+    ask(client, "when should I plant onions")
+    assert ask(client, "when should I harvest onions") == ("answer 2", "MISS")
+
+
+def test_near_tier_is_off_by_default():
+    cache = ResponseCache()
+    cache.set("How to control leaf curl in tomato", "cached")
+    assert cache.get("How to control leaf-curl in tomatoes?") == (None, None)
+
+
+def test_question_terms():
+    _, negations, content = question_terms("Don't spray the tomatoes")
+    assert negations == {"not"}
+    assert content == {"spray", "tomato"}
@@ -0,0 +1,106 @@
+"""
+Single-flight coalescing of LLM calls, in-process and through the shared SQLite store.
+
+    cd backend && python -m pytest -q test_singleflight.py
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from singleflight import SingleFlight, SqliteFlightStore
+
+openai = pytest.importorskip("openai")
+from openai.types.chat import ChatCompletion
+from llm_gateway import LLMGateway
+
+
+class StubCompletions:
+    """Upstream stand-in: slow enough for callers to overlap, numbers every answer."""
+
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def create(self, **kwargs):
+        with self._lock:
+            self.calls += 1
+            number = self.calls
+        time.sleep(self.delay)
+        return ChatCompletion.model_validate({
+            "id": f"stub-{number}", "object": "chat.completion", "created": 0, "model": kwargs["model"],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": f"answer {number}"}}],
+        })
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def gateway(request, tmp_path):
+    store = str(tmp_path / "flights.db") if request.param == "sqlite" else ""
+    gateway = LLMGateway(api_key="test", singleflight_store=store)
+    completions = StubCompletions()
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    gateway.client = SimpleNamespace(with_options=lambda **_: client)
+    gateway.upstream = completions
+    return gateway
+
+
+def ask(gateway):
+    response = gateway.complete(model="gpt-4o-mini", messages=[{"role": "user", "content": "When to sow onions?"}])
+    return response.choices[0].message.content
+
+
+def test_concurrent_identical_calls_share_one_request(gateway):
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        answers = list(pool.map(lambda _: ask(gateway), range(8)))
+    assert answers == ["answer 1"] * 8
+    assert gateway.upstream.calls == 1
+    assert gateway.singleflight.stats() == {"executions": 1, "coalesced": 7}
+
+
+def test_finished_flight_is_not_served_to_later_callers(gateway):
+    assert ask(gateway) == "answer 1"
+    assert ask(gateway) == "answer 2"
+    assert gateway.upstream.calls == 2
+
+
+def run_slowly(result, calls, delay=0.2):
+    def fn():
+        calls.append(result)
+        time.sleep(delay)
+        return result
+    return fn
+
+
+def test_store_does_not_replay_a_finished_flight_to_another_process(tmp_path):
+    path = str(tmp_path / "flights.db")
+    worker_a, worker_b = SingleFlight(SqliteFlightStore(path)), SingleFlight(SqliteFlightStore(path))
+    calls = []
+    assert worker_a.do("k", run_slowly("a", calls, 0), serialize=str, deserialize=str) == ("a", False)
+    # Well within the store's result_ttl, but worker B arrived after the flight finished
+    assert worker_b.do("k", run_slowly("b", calls, 0), serialize=str, deserialize=str) == ("b", False)
+    assert calls == ["a", "b"]
+
+
+def test_store_shares_a_running_flight_across_processes(tmp_path):
+    path = str(tmp_path / "flights.db")
+    worker_a, worker_b = SingleFlight(SqliteFlightStore(path)), SingleFlight(SqliteFlightStore(path))
+    calls = []
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(worker_a.do, "k", run_slowly("a", calls), serialize=str, deserialize=str)
+        time.sleep(0.05)
+        follower = pool.submit(worker_b.do, "k", run_slowly("b", calls), serialize=str, deserialize=str)
+        assert leader.result() == ("a", False)
+        assert follower.result() == ("a", True)
+    assert calls == ["a"]
+
+
+def test_wait_ignores_results_from_before_arrival(tmp_path):
+    store = SqliteFlightStore(str(tmp_path / "flights.db"))
+    assert store.claim("k")
+    store.publish("k", "old")
+    assert store.wait("k", timeout=0.1, since=time.time() + 1) is None
+    assert store.wait("k", timeout=0.1, since=0) == "old"
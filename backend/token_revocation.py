@@ -0,0 +1,151 @@
+"""
+Revocation store for JWT ids (jti).
+
+Revoked tokens are rows in revoked_tokens, unique on jti. Each process also
+keeps a Bloom filter of the revoked jtis, so checking a token that was never
+revoked - almost every request - is a few in-memory hash probes with no
+database access. Only a filter hit (a revoked token, or a rare false
+positive) is confirmed against the jti index.
+
+Rows revoked by other workers are pulled into the filter by an incremental
+`id > last_seen` query at most every REVOCATION_SYNC_INTERVAL seconds.
+Refresh-token rotation does not depend on that delay: the unique jti
+insert in revoke() is what lets a refresh token be used only once.
+
+Token families (the `fam` claim shared by all tokens from one login) are
+revoked the same way, with the family id stored in the jti column.
+"""
+import datetime
+import hashlib
+import math
+import os
+import threading
+import time
+
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import RevokedToken
+
+REVOCATION_BLOOM_CAPACITY = int(os.getenv("REVOCATION_BLOOM_CAPACITY", "100000"))
+REVOCATION_BLOOM_ERROR_RATE = float(os.getenv("REVOCATION_BLOOM_ERROR_RATE", "0.001"))
+REVOCATION_SYNC_INTERVAL = float(os.getenv("REVOCATION_SYNC_INTERVAL", "5"))
+PURGE_EVERY = 1000 # revocations between purges of expired rows
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings. No false negatives; `error_rate` false positives at capacity."""
+
+    def __init__(self, capacity=REVOCATION_BLOOM_CAPACITY, error_rate=REVOCATION_BLOOM_ERROR_RATE):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationStore:
+    """Per-process view of revoked_tokens. Methods need an app context."""
+
+    def __init__(self, capacity=REVOCATION_BLOOM_CAPACITY, sync_interval=REVOCATION_SYNC_INTERVAL):
+        self.capacity = capacity
+        self.sync_interval = sync_interval
+        self._bloom = None
+        self._last_id = 0
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"checks": 0, "bloom_negative": 0, "db_checks": 0, "false_positives": 0, "revoked": 0}
+
+    def _count(self, name):
+        self._stats[name] += 1
+
+    def _rebuild(self):
+        """Filter of every stored jti, sized for at least twice the current rows."""
+        rows = db.session.query(RevokedToken.id, RevokedToken.jti).all()
+        bloom = BloomFilter(max(self.capacity, len(rows) * 2))
+        for _, jti in rows:
+            bloom.add(jti)
+        self._bloom = bloom
+        self._last_id = max((row_id for row_id, _ in rows), default=0)
+        self._synced_at = time.monotonic()
+
+    def _sync(self):
+        with self._lock:
+            if self._bloom is None:
+                self._rebuild()
+                return
+            if time.monotonic() - self._synced_at < self.sync_interval:
+                return
+            rows = (db.session.query(RevokedToken.id, RevokedToken.jti)
+                    .filter(RevokedToken.id > self._last_id).all())
+            for row_id, jti in rows:
+                self._bloom.add(jti)
+                self._last_id = max(self._last_id, row_id)
+            self._synced_at = time.monotonic()
+            if self._bloom.count > self._bloom.capacity:
+                self._rebuild()
+
+    def is_revoked(self, jti):
+        self._count("checks")
+        self._sync()
+        if jti not in self._bloom:
+            self._count("bloom_negative")
+            return False
+        self._count("db_checks")
+        revoked = db.session.query(RevokedToken.id).filter_by(jti=jti).first() is not None
+        if not revoked:
+            self._count("false_positives")
+        return revoked
+
+    def revoke(self, jti, token_type, expires_at, user_id=None):
+        """Records the jti. Returns False if it was already revoked (e.g. a refresh token used twice)."""
+        row = RevokedToken(jti=jti, token_type=token_type, user_id=user_id,
+                           expires_at=datetime.datetime.utcfromtimestamp(expires_at))
+        db.session.add(row)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return False
+        self._sync()
+        with self._lock:
+            self._bloom.add(jti)
+        self._count("revoked")
+        if row.id % PURGE_EVERY == 0:
+            self.purge_expired()
+        return True
+
+    def purge_expired(self):
+        """Deletes rows for tokens that have expired anyway and rebuilds the filter without them."""
+        try:
+            RevokedToken.query.filter(RevokedToken.expires_at < datetime.datetime.utcnow()).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Revoked token purge failed: {e}")
+            return
+        with self._lock:
+            self._rebuild()
+
+    def stats(self):
+        bloom = self._bloom
+        return dict(self._stats, bloom_entries=bloom.count if bloom else 0,
+                    bloom_bytes=len(bloom._bits) if bloom else 0)
+
+
+revocations = RevocationStore()
@@ -0,0 +1,110 @@
+"""
+Streaming multipart upload reader with a size cap.
+
+`request.files` parses the whole body before the view runs, so an oversized
+or bogus upload is only rejected after it has been received in full.
+`read_upload` decodes the multipart body from `request.stream` chunk by
+chunk, checks the first bytes of the file part as soon as they arrive, and
+stops with UploadTooLarge the moment the file part crosses the cap. File
+data is written to a spooled temp file (in memory up to UPLOAD_SPOOL_BYTES,
+on disk beyond) that the image encoder then reads from.
+"""
+import os
+import tempfile
+
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(15 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+UPLOAD_SPOOL_BYTES = 1024 * 1024
+MAX_FIELD_BYTES = 4096
+MAX_PARTS = 16
+# Boundaries, part headers and small form fields on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadError(ValueError):
+    pass
+
+
+class UploadTooLarge(UploadError):
+    def __init__(self, max_bytes):
+        super().__init__(f"Upload is too large (limit {max_bytes // (1024 * 1024)} MB)")
+        self.max_bytes = max_bytes
+
+
+class Upload:
+    def __init__(self):
+        self.file = None
+        self.filename = None
+        self.size = 0
+        self.fields = {}
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+def read_upload(request, field="image", max_bytes=UPLOAD_MAX_BYTES, check_head=None, head_bytes=16):
+    """
+    Read a multipart/form-data request into an Upload. Only the file part
+    named `field` is kept; `check_head(first_bytes)` may raise to reject the
+    file before the rest of it is read.
+    """
+    mimetype, options = parse_options_header(request.headers.get("Content-Type", ""))
+    boundary = options.get("boundary", "").encode("ascii")
+    if mimetype != "multipart/form-data" or not boundary:
+        raise UploadError("Expected a multipart/form-data upload")
+    if request.content_length and request.content_length > max_bytes + MULTIPART_OVERHEAD:
+        raise UploadTooLarge(max_bytes)
+
+    decoder = MultipartDecoder(boundary, max_parts=MAX_PARTS)
+    upload = Upload()
+    current = None
+    target = None
+    field_value = []
+    head = b""
+    stream = request.stream
+
+    try:
+        while True:
+            chunk = stream.read(UPLOAD_CHUNK_SIZE)
+            decoder.receive_data(chunk or None)
+            event = decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                if isinstance(event, Field):
+                    current = event
+                    field_value = []
+                elif isinstance(event, File):
+                    current = event
+                    if event.name == field and target is None:
+                        target = event
+                        upload.file = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+                        upload.filename = event.filename
+                elif isinstance(event, Data):
+                    if isinstance(current, Field):
+                        field_value.append(event.data)
+                        if sum(len(part) for part in field_value) > MAX_FIELD_BYTES:
+                            raise UploadError(f"Form field '{current.name}' is too large")
+                        if not event.more_data:
+                            upload.fields[current.name] = b"".join(field_value).decode("utf-8", "replace")
+                    elif current is target:
+                        upload.size += len(event.data)
+                        if upload.size > max_bytes:
+                            raise UploadTooLarge(max_bytes)
+                        if check_head is not None and len(head) < head_bytes:
+                            head += event.data[:head_bytes - len(head)]
+                            if len(head) >= head_bytes or not event.more_data:
+                                check_head(head)
+                        upload.file.write(event.data)
+                event = decoder.next_event()
+            if isinstance(event, Epilogue) or not chunk:
+                break
+    except Exception:
+        upload.close()
+        raise
+
+    if upload.file is not None:
+        upload.file.seek(0)
+    return upload
@@ -1,5 +1,6 @@
 import React, { useState, useRef } from 'react'
 import { Upload, Search, ChevronLeft, AlertCircle, CheckCircle2, FlaskConical, Stethoscope, ShieldCheck, Leaf, Info, Moon, Sun } from 'lucide-react'
+import { getApiUrl, API_ENDPOINTS } from '../utils/api'
 
 const CropAnalyzerPage = ({ onBack }) => {
   const [selectedImage, setSelectedImage] = useState(null)
@@ -39,7 +40,7 @@ const CropAnalyzerPage = ({ onBack }) => {
       const formData = new FormData()
       formData.append('image', selectedImage)
 
-      const response = await fetch('http://localhost:5001/api/analyze-crop-image', {
+      const response = await fetch(getApiUrl(API_ENDPOINTS.ANALYZE_CROP_IMAGE), {
         method: 'POST',
         body: formData
       })
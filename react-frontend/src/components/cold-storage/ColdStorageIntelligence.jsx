@@ -64,11 +64,9 @@ const ColdStorageIntelligence = ({ isOpen, onClose, language }) => {
         setIsLoading(true);
 
         try {
-            const response = await fetch(getApiUrl(API_ENDPOINTS.COLD_STORAGE_SEARCH), {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify(searchQuery)
-            });
+            // GET so the browser can revalidate cached results (ETag / 304)
+            const params = new URLSearchParams({ crop: searchQuery.crop, location: searchQuery.location || '' });
+            const response = await fetch(`${getApiUrl(API_ENDPOINTS.COLD_STORAGE_SEARCH)}?${params}`);
 
             if (response.ok) {
                 const data = await response.json();
@@ -1,15 +1,22 @@
 
 import React, { useEffect, useState } from 'react';
-import { getApiUrl, API_ENDPOINTS } from '../../utils/api';
+import { getApiUrl, getAlertStreamUrl, API_ENDPOINTS } from '../../utils/api';
 
-const IntrusionAlertManager = ({ onAlert }) => {
+// farmLocation ({ lat, lon, radius_km }) is optional: with it, only alerts near the farm arrive
+const IntrusionAlertManager = ({ onAlert, farmLocation }) => {
     const [listening, setListening] = useState(false);
     const [pushStatus, setPushStatus] = useState('default'); // default, granted, denied
 
     // 1. SSE Connection
     useEffect(() => {
         if (!listening) {
-            const events = new EventSource(getApiUrl(API_ENDPOINTS.INTRUSION_STREAM));
+            const streamUrl = new URL(getAlertStreamUrl(), window.location.origin);
+            if (farmLocation) {
+                streamUrl.searchParams.set('lat', farmLocation.lat);
+                streamUrl.searchParams.set('lon', farmLocation.lon);
+                if (farmLocation.radius_km) streamUrl.searchParams.set('radius_km', farmLocation.radius_km);
+            }
+            const events = new EventSource(streamUrl.toString());
 
             events.onmessage = (event) => {
                 const parsedData = JSON.parse(event.data);
@@ -26,9 +33,9 @@ const IntrusionAlertManager = ({ onAlert }) => {
             };
 
             events.onerror = (err) => {
+                // EventSource reconnects by itself and sends Last-Event-ID,
+                // so the backend replays any alerts missed in between
                 console.error("SSE Error:", err);
-                events.close();
-                // Simple reconnection logic could go here
             };
 
             setListening(true);
@@ -37,7 +44,7 @@ const IntrusionAlertManager = ({ onAlert }) => {
                 events.close();
             };
         }
-    }, [listening, onAlert]);
+    }, [listening, onAlert, farmLocation]);
 
     // 2. Play Sound
     const playAlertSound = () => {
@@ -98,7 +105,7 @@ const IntrusionAlertManager = ({ onAlert }) => {
             // Send to backend
             await fetch(getApiUrl(API_ENDPOINTS.PUSH_SUBSCRIBE), {
                 method: 'POST',
-                body: JSON.stringify(subscription),
+                body: JSON.stringify(farmLocation ? { subscription, location: farmLocation } : subscription),
                 headers: {
                     'Content-Type': 'application/json'
                 }
@@ -14,8 +14,42 @@ export const AuthProvider = ({ children }) => {
     // Initialize axios defaults
     axios.defaults.baseURL = API_BASE_URL;
 
+    const clearTokens = () => {
+        localStorage.removeItem('token');
+        localStorage.removeItem('refreshToken');
+        delete axios.defaults.headers.common['Authorization'];
+    };
+
     useEffect(() => {
+        // When the access token expires, exchange the refresh token for a new pair
+        // (single-use, rotated by the backend) and retry the request once
+        let refreshing = null;
+        const interceptor = axios.interceptors.response.use(null, async (err) => {
+            const original = err.config;
+            const refreshToken = localStorage.getItem('refreshToken');
+            if (err.response?.status !== 401 || !refreshToken || original._retried
+                || ['/api/auth/login', '/api/auth/refresh', '/api/auth/logout'].includes(original.url)) {
+                throw err;
+            }
+            original._retried = true;
+            refreshing = refreshing || axios.post('/api/auth/refresh', { refresh_token: refreshToken })
+                .finally(() => { refreshing = null; });
+            try {
+                const res = await refreshing;
+                localStorage.setItem('token', res.data.access_token);
+                localStorage.setItem('refreshToken', res.data.refresh_token);
+                axios.defaults.headers.common['Authorization'] = `Bearer ${res.data.access_token}`;
+            } catch (refreshErr) {
+                clearTokens();
+                setUser(null);
+                throw err;
+            }
+            original.headers['Authorization'] = axios.defaults.headers.common['Authorization'];
+            return axios(original);
+        });
+
         checkUserLoggedIn();
+        return () => axios.interceptors.response.eject(interceptor);
     }, []);
 
     const checkUserLoggedIn = async () => {
@@ -27,9 +61,7 @@ export const AuthProvider = ({ children }) => {
                 setUser(res.data.user);
             } catch (err) {
                 console.error("Token verification failed", err);
-                localStorage.removeItem('token');
-                localStorage.removeItem('refreshToken');
-                delete axios.defaults.headers.common['Authorization'];
+                clearTokens();
                 setUser(null);
             }
         }
@@ -75,10 +107,13 @@ export const AuthProvider = ({ children }) => {
     };
 
     const logout = async () => {
-        // Optional: Call backend logout to blacklist token
-        localStorage.removeItem('token');
-        localStorage.removeItem('refreshToken');
-        delete axios.defaults.headers.common['Authorization'];
+        // Revoke both tokens on the backend; log out locally even if that fails
+        try {
+            await axios.post('/api/auth/logout', { refresh_token: localStorage.getItem('refreshToken') });
+        } catch (err) {
+            console.error("Logout request failed", err);
+        }
+        clearTokens();
         setUser(null);
     };
 
@@ -10,8 +10,10 @@ export const API_ENDPOINTS = {
   // Twin endpoints
   ASK_TWIN: '/api/ask-twin',
   ANALYZE_EMOTION: '/api/analyze-emotion',
+  ANALYZE_EMOTION_BATCH: '/api/analyze-emotion/batch',
   ANALYZE_VOICE_EMOTION: '/api/analyze-voice-emotion',
   WHAT_IF_VIEW: '/api/what-if-view',
+  ANALYZE_CROP_IMAGE: '/api/analyze-crop-image',
 
   // User endpoints
   UPLOAD_PROFILE: '/api/user/upload-profile',
@@ -19,6 +21,7 @@ export const API_ENDPOINTS = {
   // Cold storage endpoints
   COLD_STORAGE_SEARCH: '/api/cold-storage/search',
   COLD_STORAGE_ROUTE: '/api/cold-storage/route',
+  COLD_STORAGE_ROUTE_MATRIX: '/api/cold-storage/route-matrix',
 
   // Intrusion endpoints
   INTRUSION_REPORT: '/api/intrusion/report',
@@ -36,4 +39,9 @@ export const getApiUrl = (endpoint) => {
   return `${API_BASE_URL}${endpoint}`;
 };
 
+// Intrusion alerts can be served by the separate asyncio stream server (backend/alert_stream_asgi.py)
+export const getAlertStreamUrl = () => {
+  return import.meta.env.VITE_ALERT_STREAM_URL || getApiUrl(API_ENDPOINTS.INTRUSION_STREAM);
+};
+
 export default API_BASE_URL;